@@ -3,14 +3,39 @@ import subprocess
 import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import zipfile
-import tempfile
+import tarfile
 import shutil
+import multiprocessing
+
+import fastboot_protocol
+import metrics
+from log_store import LogQueue
+from device_watcher import parse_device_list
+from device_info import default_cache as getvar_cache
+from command_runner import run_fastboot_streaming
+from flash_scheduler import FlashJob, FlashScheduler, list_fastboot_serials, DEFAULT_MAX_PARALLEL
+from artifact_cache import default_cache as artifact_cache, COMPLETE_MARKER
+from zip_images import list_images
+from flash_plan import is_factory_package, load_factory
+from flash_ledger import DeltaFilter, default_ledger
+from firmware_verify import LZ4_IMAGE_SUFFIX, is_sidecar, is_tar_md5, match_sidecars, open_image_member, verify_all
+from tracing import tracer
+
+# Journal : lignes conservées dans la zone de log, cadence et taille des lots d'affichage
+LOG_MAX_LINES = 5000
+LOG_TRIM_SLACK = 500
+LOG_FLUSH_MS = 50
+LOG_BATCH_MAX = 5000
+# Commandes après lesquelles le slot courant ou les variables du cache getvar changent
+# (flash et erase modifient les partitions logiques et leurs tailles)
+CACHE_INVALIDATING_COMMANDS = ("set_active", "reboot", "reboot-bootloader", "boot", "flashing", "oem",
+                               "flash", "erase", "format", "update", "wipe-super", "update-super")
 
 
 class FastbootFlashTool:
     def __init__(self, root):
         self.root = root
+        self.log_queue = LogQueue()
 
         # Dictionnaire de traductions
         self.translations = {
@@ -32,6 +57,8 @@ class FastbootFlashTool:
                 "temporary_boot": "Démarrage Temporaire",
                 "firmware_flash": "Flash Firmware",
                 "select_firmware_files": "Sélectionner les fichiers firmware",
+                "max_parallel": "Appareils en parallèle :",
+                "delta_flash": "Images modifiées seulement",
                 "unlock_bootloader": "Unlock Bootloader",
                 "lock_bootloader": "Lock Bootloader",
                 "logs": "Logs",
@@ -60,7 +87,9 @@ class FastbootFlashTool:
                     "    Unlock Bootloader, Lock Bootloader.\n\n"
                     "Firmware Flash Option :\n"
                     "  - Sélectionnez directement un ou plusieurs fichiers firmware avec extension .img, .zip ou .md5.\n"
-                    "  - Pour les .zip, le programme extraira les images contenues et les flashera.\n\n"
+                    "  - Pour les .zip, chaque image est lue dans l'archive au moment de son flash (sans extraction complète).\n"
+                    "  - Les images sont vérifiées avec leurs fichiers .md5/.sha256 (et les .tar.md5 Samsung)\n"
+                    "    avant le premier flash ; une image corrompue annule le flash.\n\n"
                     "Onglet Terminal :\n"
                     "  - Utilisez l'émulateur pour exécuter des commandes sur votre PC.\n\n"
                     "Onglet Paramètres :\n"
@@ -86,6 +115,8 @@ class FastbootFlashTool:
                 "temporary_boot": "Temporary Boot",
                 "firmware_flash": "Flash Firmware",
                 "select_firmware_files": "Select Firmware Files",
+                "max_parallel": "Devices in parallel:",
+                "delta_flash": "Changed images only",
                 "unlock_bootloader": "Unlock Bootloader",
                 "lock_bootloader": "Lock Bootloader",
                 "logs": "Logs",
@@ -114,7 +145,9 @@ class FastbootFlashTool:
                     "    Unlock Bootloader, Lock Bootloader.\n\n"
                     "Firmware Flash Option:\n"
                     "  - Directly select one or several firmware files with extension .img, .zip, or .md5.\n"
-                    "  - For .zip files, the tool will extract any contained .img files and flash them.\n\n"
+                    "  - For .zip files, each contained .img is read from the archive when it is flashed (no full extraction).\n"
+                    "  - Images are checked against their .md5/.sha256 files (and Samsung .tar.md5 trailers)\n"
+                    "    before the first flash; a corrupt image cancels the flash.\n\n"
                     "Terminal Tab:\n"
                     "  - Use the terminal emulator to run commands on your PC.\n\n"
                     "Settings Tab:\n"
@@ -142,6 +175,9 @@ class FastbootFlashTool:
         # Statut de la connexion et fichiers firmware sélectionnés
         self.device_status = tk.StringVar(value="Inactive")
         self.firmware_files = []
+        self.max_parallel = tk.IntVar(value=DEFAULT_MAX_PARALLEL)
+        # Mode delta : ne renvoie que les images différentes du dernier flash réussi (décoché = flash complet forcé)
+        self.delta_flash = tk.BooleanVar(value=False)
 
         # Configuration du style ttk
         self.style = ttk.Style()
@@ -178,6 +214,13 @@ class FastbootFlashTool:
         # Application du thème après création des zones de log
         self.apply_theme()
 
+        # Affichage périodique du journal
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
+
+        # Endpoint Prometheus optionnel (FASTBOOTGUI_METRICS)
+        metrics.log_queue_depth.set_function(lambda: len(self.log_queue))
+        metrics.start_server()
+
     # ---------------------------
     # Mise à jour des textes (langue)
     # ---------------------------
@@ -205,6 +248,8 @@ class FastbootFlashTool:
         self.boot_temp_button.config(text=trans["temporary_boot"])
         self.firmware_select_button.config(text=trans["select_firmware_files"])
         self.firmware_flash_button.config(text=trans["firmware_flash"])
+        self.max_parallel_label.config(text=trans["max_parallel"])
+        self.delta_flash_check.config(text=trans["delta_flash"])
         self.unlock_button.config(text=trans["unlock_bootloader"])
         self.lock_button.config(text=trans["lock_bootloader"])
 
@@ -274,11 +319,23 @@ class FastbootFlashTool:
     # Zone de log (avec scrollbar)
     # ---------------------------
     def log(self, message):
-        if hasattr(self, "log_text"):
-            self.log_text.config(state="normal")
-            self.log_text.insert("end", message + "\n")
-            self.log_text.config(state="disabled")
-            self.log_text.see("end")
+        # Peut être appelé depuis n'importe quel thread : le message est seulement mis en file.
+        self.log_queue.push(message)
+
+    def flush_log(self):
+        # Boucle Tk : affiche les messages en attente en une seule insertion.
+        messages = self.log_queue.drain(LOG_BATCH_MAX)
+        if messages and hasattr(self, "log_text"):
+            # Tracé seulement quand il y a des lignes : la boucle tourne toutes les LOG_FLUSH_MS.
+            with tracer.span("flush_log", "ui", lines=len(messages)):
+                self.log_text.config(state="normal")
+                self.log_text.insert("end", "\n".join(messages) + "\n")
+                line_count = int(self.log_text.index("end-1c").split(".")[0])
+                if line_count > LOG_MAX_LINES + LOG_TRIM_SLACK:
+                    self.log_text.delete("1.0", f"{line_count - LOG_MAX_LINES}.0")
+                self.log_text.config(state="disabled")
+                self.log_text.see("end")
+        self.root.after(1 if len(self.log_queue) else LOG_FLUSH_MS, self.flush_log)
 
     # ---------------------------
     # Onglet Flash (Main Frame)
@@ -384,6 +441,9 @@ class FastbootFlashTool:
             command=self.lock_bootloader
         )
         self.lock_button.pack(side="left", padx=5)
+        # Progression du flash (alimentée par la sortie de fastboot en direct)
+        self.progress_bar = ttk.Progressbar(self.action_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress_bar.pack(fill="x", padx=5, pady=(10, 0))
 
         # Section Flash Firmware (sélection de fichiers firmware)
         self.firmware_frame = ttk.LabelFrame(
@@ -404,6 +464,12 @@ class FastbootFlashTool:
             command=self.flash_firmware
         )
         self.firmware_flash_button.pack(side="left", padx=5)
+        self.max_parallel_label = ttk.Label(self.firmware_frame, text=self.translations[self.lang.get()]["max_parallel"])
+        self.max_parallel_label.pack(side="left", padx=5)
+        self.max_parallel_spinbox = ttk.Spinbox(self.firmware_frame, from_=1, to=32, width=4, textvariable=self.max_parallel, state="readonly")
+        self.max_parallel_spinbox.pack(side="left", padx=5)
+        self.delta_flash_check = ttk.Checkbutton(self.firmware_frame, text=self.translations[self.lang.get()]["delta_flash"], variable=self.delta_flash)
+        self.delta_flash_check.pack(side="left", padx=5)
 
         # Zone de log (avec scrollbar)
         self.log_frame = ttk.LabelFrame(
@@ -441,7 +507,9 @@ class FastbootFlashTool:
 
         def run_command():
             try:
-                result = subprocess.run(command, shell=True, capture_output=True, text=True)
+                with tracer.span("terminal", "command", command=command) as span:
+                    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+                    span.set(exit_code=result.returncode)
                 self.log(result.stdout)
                 if result.stderr:
                     self.log(result.stderr)
@@ -537,7 +605,7 @@ class FastbootFlashTool:
     def select_firmware_files(self):
         files = filedialog.askopenfilenames(
             title=self.translations[self.lang.get()]["select_firmware_files"],
-            filetypes=[("Firmware Files", "*.img *.zip *.md5"), ("All Files", "*.*")]
+            filetypes=[("Firmware Files", "*.img *.zip *.md5 *.sha1 *.sha256 flash-all.sh flash-all.bat"), ("All Files", "*.*")]
         )
         if files:
             self.firmware_files = list(files)
@@ -545,60 +613,177 @@ class FastbootFlashTool:
         else:
             self.log("Aucun fichier firmware sélectionné.")
 
+    def import_firmware_archive(self, file, extract):
+        # Les archives sont extraites une seule fois dans le cache d'artefacts (clé : sha256),
+        # les imports suivants de la même archive réutilisent les images déjà extraites.
+        sha256 = artifact_cache.fingerprint_sha256(file)
+        cached = artifact_cache.tree_path(sha256)
+        if (cached / COMPLETE_MARKER).exists():
+            metrics.cache_requests.inc(cache="extract", result="hit")
+            self.log(f"{os.path.basename(file)} : images déjà extraites dans le cache.")
+        else:
+            metrics.cache_requests.inc(cache="extract", result="miss")
+            self.log(f"Extraction de l'archive {file}...")
+        tree = artifact_cache.extracted(sha256, lambda directory: extract(file, directory), name=os.path.basename(file))
+        images = []
+        for root_dir, dirs, files_in_dir in os.walk(tree):
+            for f in files_in_dir:
+                if f.lower().endswith(".img"):
+                    images.append(os.path.join(root_dir, f))
+        return sorted(images)
+
+    def extract_tar_archive(self, file, directory):
+        with tarfile.open(file, "r:") as tar_ref:
+            for member in tar_ref.getmembers():
+                name = os.path.basename(member.name)
+                if not member.isfile() or not name.lower().endswith((".img", LZ4_IMAGE_SUFFIX)):
+                    self.log(f"{name} ignoré (seules les images .img et .img.lz4 sont flashées).")
+                    continue
+                # Les images .img.lz4 des archives Samsung sont décompressées à l'extraction.
+                name, src = open_image_member(tar_ref, member)
+                if src is None:
+                    self.log(f"{name} NON FLASHÉ : image LZ4, module Python lz4 absent.")
+                    continue
+                with src, open(os.path.join(directory, name), "wb") as dst:
+                    shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+
+    @tracer.traced()
+    def verify_firmware_files(self):
+        # Associe chaque image à son fichier de somme de contrôle puis les vérifie en parallèle.
+        try:
+            entries, unverified, orphans = match_sidecars(self.firmware_files)
+        except Exception as e:
+            self.log(f"Erreur lors de la lecture des sommes de contrôle : {str(e)}")
+            return False
+        for path in orphans:
+            self.log(f"Fichier {os.path.basename(path)} : aucune image correspondante, ignoré.")
+        for path in unverified:
+            if path.lower().endswith(LZ4_IMAGE_SUFFIX):
+                self.log(f"{os.path.basename(path)} : image LZ4, non vérifiée (module Python lz4 absent).")
+            else:
+                self.log(f"{os.path.basename(path)} : aucune somme de contrôle, non vérifié.")
+        if not entries:
+            return True
+        self.log(f"Vérification de {len(entries)} fichier(s)...")
+        done = []
+        self.set_progress(0)
+
+        def on_result(result):
+            done.append(result)
+            self.set_progress(len(done) / len(entries) * 100)
+            name = os.path.basename(result.path)
+            if result.ok:
+                algorithms = ", ".join(result.digests)
+                self.log(f"{name} : {algorithms} OK ({result.source}, {result.duration:.1f}s)")
+            else:
+                self.log(f"{name} : ÉCHEC de la vérification - {result.error}")
+
+        results = verify_all(entries, on_result=on_result)
+        return all(result.ok for result in results)
+
+    def build_firmware_job(self):
+        # Un package usine (flash-all.sh, image-*.zip) devient un plan ordonné ;
+        # sinon chaque image sélectionnée est flashée dans l'ordre de la sélection.
+        factory = next((f for f in self.firmware_files
+                        if os.path.splitext(f)[1].lower() in (".zip", ".sh", ".bat") and is_factory_package(f)), None)
+        if factory:
+            try:
+                plan = load_factory(factory).optimize()
+            except Exception as e:
+                self.log(f"Erreur lors de la lecture du package usine {os.path.basename(factory)} : {str(e)}")
+                return None
+            for line in plan.summary():
+                self.log(line)
+            return plan
+        job = FlashJob("firmware", stop_on_error=False)
+        for file in self.firmware_files:
+            ext = os.path.splitext(file)[1].lower()
+            if is_sidecar(file):
+                continue
+            if ext == ".img":
+                partition_name = os.path.splitext(os.path.basename(file))[0]
+                job.add("flash", partition_name, file)
+            elif ext == ".zip":
+                # Pas d'extraction préalable : chaque image est lue dans le ZIP au moment
+                # de son flash (en flux pour fastboot TCP, sinon extraite puis supprimée).
+                try:
+                    zip_imgs = list_images(file)
+                    if not zip_imgs:
+                        self.log(f"Aucune image (.img) trouvée dans {os.path.basename(file)}.")
+                    for zip_img in zip_imgs:
+                        job.add("flash", zip_img.partition, zip_img)
+                except Exception as e:
+                    self.log(f"Erreur lors de la lecture du fichier ZIP {os.path.basename(file)} : {str(e)}")
+            elif is_tar_md5(file):
+                try:
+                    for img_file in self.import_firmware_archive(file, self.extract_tar_archive):
+                        partition_name = os.path.splitext(os.path.basename(img_file))[0]
+                        job.add("flash", partition_name, img_file)
+                except Exception as e:
+                    self.log(f"Erreur lors de l'extraction de {os.path.basename(file)} : {str(e)}")
+        return job
+
     def flash_firmware(self):
         if not self.firmware_files:
             messagebox.showerror("Erreur", "Aucun fichier firmware sélectionné.")
             return
 
+        @tracer.traced("flash_firmware")
         def flash_thread():
             self.check_device_status()
             if self.device_status.get() != "Active":
                 messagebox.showerror("Erreur", "Aucun appareil actif détecté.")
                 return
+            # Toutes les sommes de contrôle sont vérifiées avant la première commande fastboot.
+            if not self.verify_firmware_files():
+                self.log("Flash firmware annulé : vérification des fichiers échouée.")
+                return
 
-            for file in self.firmware_files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext == ".img":
-                    partition_name = os.path.splitext(os.path.basename(file))[0]
-                    cmd = ["fastboot", "flash", partition_name, file]
-                    self.log(f"Flash de {partition_name} avec {file}...")
-                    try:
-                        result = subprocess.run(cmd, capture_output=True, text=True)
-                        self.log(result.stdout)
-                        if result.stderr:
-                            self.log(result.stderr)
-                    except Exception as e:
-                        self.log(f"Erreur lors du flash de {partition_name} : {str(e)}")
-                elif ext == ".zip":
-                    self.log(f"Extraction du fichier ZIP {file}...")
+            job = self.build_firmware_job()
+            if job is None:
+                return
+
+            try:
+                serials = list_fastboot_serials()
+                self.log(f"Flash firmware sur {len(serials)} appareil(s) : {', '.join(serials)}")
+
+                def progress(serial, index, count, step, status):
+                    label = " ".join(os.path.basename(str(arg)) for arg in step)
+                    if status == "running":
+                        self.log(f"[{serial}] ({index}/{count}) {label}...")
+                    elif status == "failed":
+                        self.log(f"[{serial}] Erreur : {label}.")
+                    elif status == "skipped":
+                        self.log(f"[{serial}] ({index}/{count}) {label} : image inchangée, ignorée.")
+
+                def runner(args):
+                    if args[1:] == ["devices"]:
+                        return fastboot_protocol.run(args)
+                    serial = args[2]
+                    on_progress = None
+                    if len(serials) == 1:
+                        on_progress = self.on_flash_progress
                     try:
-                        with zipfile.ZipFile(file, 'r') as zip_ref:
-                            temp_dir = tempfile.mkdtemp()
-                            zip_ref.extractall(temp_dir)
-                            extracted_imgs = []
-                            for root_dir, dirs, files_in_dir in os.walk(temp_dir):
-                                for f in files_in_dir:
-                                    if f.lower().endswith(".img"):
-                                        extracted_imgs.append(os.path.join(root_dir, f))
-                            if not extracted_imgs:
-                                self.log(f"Aucune image (.img) trouvée dans {os.path.basename(file)}.")
-                            else:
-                                for img_file in extracted_imgs:
-                                    partition_name = os.path.splitext(os.path.basename(img_file))[0]
-                                    cmd = ["fastboot", "flash", partition_name, img_file]
-                                    self.log(f"Flash de {partition_name} (extrait de {os.path.basename(file)})...")
-                                    try:
-                                        result = subprocess.run(cmd, capture_output=True, text=True)
-                                        self.log(result.stdout)
-                                        if result.stderr:
-                                            self.log(result.stderr)
-                                    except Exception as e:
-                                        self.log(f"Erreur lors du flash de {partition_name} : {str(e)}")
-                            shutil.rmtree(temp_dir)
-                    except Exception as e:
-                        self.log(f"Erreur lors de l'extraction du fichier ZIP {os.path.basename(file)} : {str(e)}")
-                elif ext == ".md5":
-                    self.log(f"Fichier {os.path.basename(file)} (checksum) ignoré.")
+                        return run_fastboot_streaming(args, on_line=lambda line: self.log(f"[{serial}] {line}"),
+                                                      on_progress=on_progress)
+                    finally:
+                        # resolve_slot lit le slot courant dans le cache : il doit suivre set_active et reboot.
+                        self.invalidate_device_info(args[3:], serial)
+
+                self.set_progress(0)
+                delta_filter = DeltaFilter(default_ledger, delta=self.delta_flash.get())
+                scheduler = FlashScheduler(max_parallel=self.max_parallel.get(), runner=runner, progress_callback=progress,
+                                           delta_filter=delta_filter)
+                for serial, device_result in scheduler.run(job, serials).items():
+                    state = "OK" if device_result.ok else "ÉCHEC"
+                    self.log(f"[{serial}] {state} en {device_result.duration:.1f}s.")
+                if delta_filter.skipped_bytes:
+                    self.log(f"Mode delta : {delta_filter.skipped_bytes / 1e6:.1f} Mo non transférés.")
+            except Exception as e:
+                self.log(f"Erreur lors du flash firmware : {str(e)}")
+            finally:
+                if hasattr(job, "close"):
+                    job.close()
             self.log("Processus de flash firmware terminé.")
 
         threading.Thread(target=flash_thread, daemon=True).start()
@@ -614,13 +799,18 @@ class FastbootFlashTool:
         if file_path:
             self.file_path_var.set(file_path)
 
+    @tracer.traced()
     def check_device_status(self):
         try:
-            result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True)
+            result = fastboot_protocol.run(["fastboot", "devices"])
+            metrics.devices.set(len(parse_device_list(result.stdout)), mode="fastboot")
             if result.stdout.strip():
                 self.device_status.set("Active")
                 self.status_label.config(bg="green")
                 self.log("Appareil détecté :\n" + result.stdout.strip())
+                # 'getvar all' peut prendre plusieurs secondes par appareil : hors de la boucle Tk.
+                threading.Thread(target=self.log_device_info, args=(parse_device_list(result.stdout),),
+                                 daemon=True).start()
             else:
                 self.device_status.set("Inactive")
                 self.status_label.config(bg="red")
@@ -630,6 +820,23 @@ class FastbootFlashTool:
             self.status_label.config(bg="red")
             self.log("Erreur : fastboot n'est pas installé ou introuvable dans le PATH.")
 
+    def log_device_info(self, serials):
+        # Lu dans le cache getvar : pas de nouvel aller-retour fastboot tant qu'il est valide.
+        for serial in serials:
+            try:
+                info = getvar_cache.get(serial)
+            except Exception as e:
+                self.log(f"[{serial}] Variables fastboot indisponibles : {str(e)}")
+                continue
+            self.log(f"[{serial}] Produit : {info.product} - Slot actif : {info.current_slot or '-'} - "
+                     f"Mode : {'fastbootd' if info.is_userspace else 'bootloader'}")
+
+    def invalidate_device_info(self, command, serial=None):
+        # command : arguments après 'fastboot [-s serial]' ; sans serial, tout le cache est vidé.
+        name = next((str(arg) for arg in command if not str(arg).startswith("-")), None)
+        if name in CACHE_INVALIDATING_COMMANDS or any(str(arg).startswith("--set-active") for arg in command):
+            getvar_cache.invalidate(serial)
+
     def start_flash_thread(self):
         self.check_device_status()
         if self.device_status.get() != "Active":
@@ -637,6 +844,7 @@ class FastbootFlashTool:
             return
         threading.Thread(target=self.flash_partition, daemon=True).start()
 
+    @tracer.traced()
     def flash_partition(self):
         partition = self.partition_var.get()
         file_path = self.file_path_var.get()
@@ -648,19 +856,32 @@ class FastbootFlashTool:
         if slot:
             cmd.extend(["--slot", slot])
         cmd.append(file_path)
+        self.set_progress(0)
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            self.log(result.stdout)
-            if result.stderr:
-                self.log(result.stderr)
+            result = run_fastboot_streaming(cmd, on_line=self.log, on_progress=self.on_flash_progress)
+            for phase, target, duration in result.phases:
+                self.log(f"{phase} '{target}' : {duration:.3f}s")
         except Exception as e:
             self.log(f"Erreur lors du flash : {str(e)}")
+        finally:
+            self.invalidate_device_info(cmd[1:])
+            # Flash hors du mode delta : le registre ne connaît plus le contenu de la partition.
+            default_ledger.forget(None, partition, slot or None)
+
+    def set_progress(self, value):
+        # Appelé depuis les threads de travail : la mise à jour se fait dans la boucle Tk.
+        self.root.after(0, lambda: self.progress_bar.configure(value=value))
+
+    def on_flash_progress(self, event):
+        if event.percent is not None:
+            self.set_progress(event.percent)
 
     def confirm_wipe_partition(self):
         response = messagebox.askyesno("Attention", "Êtes-vous sûr de vouloir effacer la partition ? Cette action est irréversible.")
         if response:
             self.wipe_partition()
 
+    @tracer.traced()
     def wipe_partition(self):
         self.check_device_status()
         if self.device_status.get() != "Active":
@@ -668,26 +889,33 @@ class FastbootFlashTool:
             return
         partition = self.partition_var.get()
         try:
-            result = subprocess.run(["fastboot", "erase", partition], capture_output=True, text=True)
+            cmd = ["fastboot", "erase", partition]
+            result = fastboot_protocol.run(cmd, timeout=None)
+            self.invalidate_device_info(cmd[1:])
+            default_ledger.forget(None, partition)
             self.log(result.stdout)
             if result.stderr:
                 self.log(result.stderr)
         except Exception as e:
             self.log(f"Erreur lors de l'effacement de la partition : {str(e)}")
 
+    @tracer.traced()
     def reboot_device(self):
         self.check_device_status()
         if self.device_status.get() != "Active":
             messagebox.showerror("Erreur", "Aucun appareil actif détecté.")
             return
         try:
-            result = subprocess.run(["fastboot", "reboot"], capture_output=True, text=True)
+            cmd = ["fastboot", "reboot"]
+            result = fastboot_protocol.run(cmd)
+            self.invalidate_device_info(cmd[1:])
             self.log(result.stdout)
             if result.stderr:
                 self.log(result.stderr)
         except Exception as e:
             self.log(f"Erreur lors du redémarrage : {str(e)}")
 
+    @tracer.traced()
     def boot_temp_image(self):
         file_path = self.file_path_var.get()
         if not os.path.exists(file_path):
@@ -698,7 +926,10 @@ class FastbootFlashTool:
             messagebox.showerror("Erreur", "Aucun appareil actif détecté.")
             return
         try:
-            result = subprocess.run(["fastboot", "boot", file_path], capture_output=True, text=True)
+            cmd = ["fastboot", "boot", file_path]
+            result = fastboot_protocol.run(cmd, timeout=None)
+            self.invalidate_device_info(cmd[1:])
+            default_ledger.forget(None, partition)
             self.log(result.stdout)
             if result.stderr:
                 self.log(result.stderr)
@@ -714,12 +945,14 @@ class FastbootFlashTool:
             messagebox.showerror("Erreur", "Aucun appareil actif détecté.")
             return
 
+        @tracer.traced("unlock_bootloader")
         def run_unlock():
             commands = [["fastboot", "flashing", "unlock"], ["fastboot", "oem", "unlock"]]
             for cmd in commands:
                 self.log("Exécution de : " + " ".join(cmd))
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True)
+                    result = fastboot_protocol.run(cmd, timeout=None)
+                    self.invalidate_device_info(cmd[1:])
                     self.log(result.stdout)
                     if result.stderr:
                         self.log(result.stderr)
@@ -735,12 +968,14 @@ class FastbootFlashTool:
             messagebox.showerror("Erreur", "Aucun appareil actif détecté.")
             return
 
+        @tracer.traced("lock_bootloader")
         def run_lock():
             commands = [["fastboot", "flashing", "lock"], ["fastboot", "oem", "lock"]]
             for cmd in commands:
                 self.log("Exécution de : " + " ".join(cmd))
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True)
+                    result = fastboot_protocol.run(cmd, timeout=None)
+                    self.invalidate_device_info(cmd[1:])
                     self.log(result.stdout)
                     if result.stderr:
                         self.log(result.stderr)
@@ -779,6 +1014,7 @@ class FastbootFlashTool:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # pool de vérification dans un exécutable figé
     root = tk.Tk()
     app = FastbootFlashTool(root)
     root.mainloop()
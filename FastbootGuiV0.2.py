@@ -22,37 +22,60 @@
 
 import os
 import sys
-import subprocess
-import urllib.request
-import hashlib
-from zipfile import ZipFile, is_zipfile
-import threading
+import queue
 import time
-import ctypes  # To check for admin privileges on Windows
 import shutil
 import logging
 from datetime import datetime
 from pathlib import Path
 import platform
 
-from kivy.app import App
-from kivy.clock import Clock
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.button import Button
-from kivy.uix.spinner import Spinner
-from kivy.uix.checkbox import CheckBox
-from kivy.uix.label import Label
-from kivy.uix.popup import Popup
-from kivy.uix.filechooser import FileChooserListView
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.textinput import TextInput
-from kivy.uix.progressbar import ProgressBar
+from startup_profile import startup_profiler
+
+with startup_profiler.phase("import kivy"):
+    from kivy.app import App
+    from kivy.clock import Clock
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.button import Button
+    from kivy.uix.spinner import Spinner
+    from kivy.uix.checkbox import CheckBox
+    from kivy.uix.label import Label
+    from kivy.uix.scrollview import ScrollView
+    from kivy.uix.progressbar import ProgressBar
+    from kivy.uix.recycleview import RecycleView
+    from kivy.uix.recycleboxlayout import RecycleBoxLayout
+    from kivy.graphics import Color, Rectangle
+    from kivy.metrics import dp
+
+# The download, hash and extraction modules (urllib, ssl, hashlib, zipfile...), the
+# fastboot protocol and streaming runner, and the popups are imported by the functions
+# that use them, not at startup.
+with startup_profiler.phase("import device backends"):
+    import adb_client
+    from device_info import default_cache as getvar_cache
+    from device_lanes import default_lanes
+    from device_watcher import DeviceWatcher
+    import job_executor
+    from log_store import LogStore
+    import metrics
+    from tool_registry import default_registry as tool_registry
+    from tracing import tracer
 
 # --- Configuration ---
 PLATFORM_TOOLS_URL = "https://dl.google.com/android/repository/platform-tools-latest-{}.zip"
 DOWNLOAD_ZIP_NAME = "platform-tools.zip"
 EXTRACT_DIR = "platform-tools"
+# Optional sha256sum/md5sum-style file giving the expected digests of DOWNLOAD_ZIP_NAME
+DIGEST_MANIFEST = "platform-tools.sha256"
+EXTRACT_MARKER = ".artifact-sha256"  # sha256 of the archive EXTRACT_DIR was extracted from
 IS_WINDOWS = os.name == "nt"
+LOG_MAX_LINES = 10000  # lines kept in the UI log (older lines are dropped)
+# Startup mode: the secondary panels (reboot, device checks, sideload, getvar) are built
+# right after the first frame instead of before it. FASTBOOTGUI_LAZY_PANELS=0 disables it.
+LAZY_PANELS = os.environ.get("FASTBOOTGUI_LAZY_PANELS", "1") != "0"
+# Background jobs run at most this many at a time per kind: tool installs/updates, commands
+# that change the device state (flash, sideload, reboot) and read-only queries.
+JOB_LIMITS = {"tools": 1, "device": 1, "query": 2}
 
 # Logger configuration (console and file)
 log_filename = "adbinstaller.log"
@@ -65,98 +88,136 @@ logging.basicConfig(level=logging.INFO,
 
 # --- Utility Functions ---
 
-def calculate_file_hash(file_path, algorithm="sha256"):
+def calculate_file_hash(file_path, algorithm="sha256", cancel_check=lambda: False):
     """Calculates the file hash for integrity verification."""
-    hash_func = hashlib.new(algorithm)
+    import checksum
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                hash_func.update(chunk)
-        return hash_func.hexdigest()
+        return checksum.file_digests(file_path, (algorithm,), cancel_check=cancel_check)[algorithm]
+    except checksum.HashCancelled:
+        logging.warning("Hash calculation cancelled by user.")
+        return None
     except Exception as e:
         logging.error("Error calculating hash: %s", e)
         return None
 
-def download_file(url, destination, progress_callback=None, cancel_check=lambda: False):
+def download_file(url, destination, progress_callback=None, cancel_check=lambda: False, digest=None):
     """
     Downloads a file from the specified URL to the destination.
-    Supports resume if a partial file exists.
+    Servers supporting ranges are read in parallel segments, and an interrupted
+    download resumes from its state file if the server still reports the same ETag
+    or Last-Modified date; otherwise it starts over.
+    If a checksum.MultiDigest is given, it is fed while downloading and verified at the end.
     """
+    import checksum
+    import downloader
     try:
-        dest_path = Path(destination)
-        resume_byte_pos = dest_path.stat().st_size if dest_path.exists() else 0
-
-        req = urllib.request.Request(url)
-        if resume_byte_pos:
-            req.add_header("Range", f"bytes={resume_byte_pos}-")
-            logging.info("Resuming download at byte %s", resume_byte_pos)
-
-        with urllib.request.urlopen(req) as response, open(destination, "ab") as out_file:
-            total_length = response.getheader("content-length")
-            if total_length:
-                total_length = int(total_length) + resume_byte_pos
-            downloaded = resume_byte_pos
-            block_size = 8192
-            while True:
-                if cancel_check():
-                    logging.warning("Download cancelled by user.")
-                    return False
-                block = response.read(block_size)
-                if not block:
-                    break
-                out_file.write(block)
-                downloaded += len(block)
-                if progress_callback and total_length:
-                    progress_callback(downloaded / total_length * 100)
-        return True
+        if downloader.download(url, destination, progress_callback, cancel_check, digest=digest):
+            metrics.bytes_transferred.inc(os.path.getsize(destination), kind="download")
+            return True
+        logging.warning("Download cancelled by user.")
+        return False
+    except checksum.ChecksumError as e:
+        logging.error("Integrity check failed: %s", e)
+        # A corrupt file must not be resumed or reused by the next attempt.
+        Path(destination).unlink(missing_ok=True)
+        return False
     except Exception as e:
         logging.error("Download error: %s", e)
         return False
 
-def extract_zip(zip_path, extract_to, progress_callback=None):
+def fetch_artifact(url, destination, expected=None, progress_callback=None, cancel_check=lambda: False, log=logging.info):
+    """
+    Returns (path, sha256) of the artifact at url, taken from the artifact cache when the
+    expected sha256 or the unchanged server version is known, downloaded otherwise.
+    Returns (None, None) on failure.
+    """
+    import checksum
+    import downloader
+    from artifact_cache import default_cache as artifact_cache
+    path = artifact_cache.lookup((expected or {}).get("sha256"))
+    if path:
+        metrics.cache_requests.inc(cache="download", result="hit")
+        log("Using cached " + destination + " (" + expected["sha256"][:12] + ").")
+        return path, expected["sha256"]
+    try:
+        validator = downloader.probe_validator(url)
+    except Exception as e:
+        logging.warning("Could not query %s: %s", url, e)
+        validator = None
+    if validator:
+        path, sha256 = artifact_cache.lookup_alias(url, validator)
+        if path:
+            metrics.cache_requests.inc(cache="download", result="hit")
+            log("Using cached " + destination + " (unchanged on server, " + sha256[:12] + ").")
+            return path, sha256
+    metrics.cache_requests.inc(cache="download", result="miss")
+    log("Downloading from " + url + " ...")
+    digest = checksum.MultiDigest(expected=expected, name=destination)
+    if not download_file(url, destination, progress_callback, cancel_check, digest=digest):
+        return None, None
+    log("Download completed.")
+    digests = digest.hexdigests()
+    for algorithm, value in digests.items():
+        log("Downloaded file %s: %s" % (algorithm, value))
+    if expected:
+        log("Checksums match the manifest.")
+    try:
+        path = artifact_cache.insert_file(destination, digests["sha256"], name=destination, source=url,
+                                          alias=url, validator=validator, move=True)
+    except Exception as e:
+        logging.warning("Could not store %s in the artifact cache: %s", destination, e)
+        path = Path(destination)
+    return path, digests["sha256"]
+
+def extract_zip(zip_path, extract_to, progress_callback=None, cancel_check=lambda: False):
     """
-    Extracts the zip file into the specified directory.
+    Extracts the zip file into the specified directory, several members at a time.
+    Progress is reported in bytes; members already extracted (same size and CRC) are skipped.
     """
+    from zipfile import is_zipfile
+    import zip_extract
     try:
         if not is_zipfile(zip_path):
             raise Exception("Invalid file (not a zip)")
-        with ZipFile(zip_path, "r") as zip_ref:
-            file_list = zip_ref.namelist()
-            total_files = len(file_list)
-            for i, file in enumerate(file_list, 1):
-                zip_ref.extract(file, extract_to)
-                if progress_callback:
-                    progress_callback(i / total_files * 100)
+        zip_extract.extract_all(zip_path, extract_to, progress_callback, cancel_check=cancel_check)
         return True
+    except zip_extract.ExtractCancelled:
+        logging.warning("Extraction cancelled by user.")
+        return False
     except Exception as e:
         logging.error("Extraction error: %s", e)
         return False
 
 def tool_available(tool):
     """
-    Checks if a tool is available by running 'tool version' or 'tool --version'.
+    Checks if a tool is available. The tool registry runs 'tool version' only when the
+    binary has changed since the last check.
     """
     try:
-        for arg in ["version", "--version"]:
-            try:
-                result = subprocess.run([tool, arg], capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    logging.info("%s detected: %s", tool, result.stdout.splitlines()[0])
-                    return True
-            except Exception:
-                continue
-        logging.warning("%s did not return a version.", tool)
-        return False
+        info = tool_registry.info(tool)
+        if info is None:
+            logging.warning("%s not found or did not return a version.", tool)
+            return False
+        logging.info("%s detected: %s %s (build %s) at %s", tool, tool, info.version, info.build, info.path)
+        return True
     except Exception as e:
         logging.error("Error checking %s: %s", tool, e)
         return False
 
 def tool_in_path(tool):
-    """Checks if the tool is available in the PATH."""
-    return any(Path(path, tool).exists() for path in os.environ["PATH"].split(os.pathsep))
+    """Checks if the tool is available in the PATH (adb.exe included on Windows)."""
+    info = tool_registry.info(tool)
+    return info is not None and info.in_path
 
 # --- Main Application Class ---
 
+class LogLine(Label):
+    """One row of the log view (used by the RecycleView)."""
+    def __init__(self, **kwargs):
+        super(LogLine, self).__init__(halign='left', valign='middle', shorten=True, shorten_from='right',
+                                      color=(0.9, 0.9, 0.9, 1), font_size='14sp', **kwargs)
+        self.bind(size=lambda w, v: setattr(self, 'text_size', v))
+
 class ADBInstaller(BoxLayout):
     def __init__(self, **kwargs):
         super(ADBInstaller, self).__init__(orientation='vertical', padding=10, spacing=10, **kwargs)
@@ -241,19 +302,28 @@ class ADBInstaller(BoxLayout):
         # Internal widget dictionary for dynamic language updates
         self.widgets_to_update = {}
 
-        # Log area
-        self.log_text = ""
-        self.cancel_flag = False
-
-        self.log_view = TextInput(text='', readonly=True, size_hint_y=1,
-                                  background_color=(0.12, 0.12, 0.12, 1),
-                                  foreground_color=(0.9, 0.9, 0.9, 1),
-                                  font_size='14sp', multiline=True)
-        self.log_scroll = ScrollView(size_hint=(1, 0.35),
-                                     do_scroll_x=False, do_scroll_y=True,
-                                     bar_width=10)
+        # Log area: lines are kept in a bounded store and shown through a RecycleView,
+        # which only renders the visible rows.
+        self.log_store = LogStore(LOG_MAX_LINES)
+        self.log_shown_total = 0
+        # Every button handler runs as a job: queued per kind, cancelled by 'Cancel'.
+        self.executor = job_executor.JobExecutor(JOB_LIMITS)
+
+        self.log_scroll = RecycleView(size_hint=(1, 0.35),
+                                      do_scroll_x=False, do_scroll_y=True,
+                                      bar_width=10)
+        with self.log_scroll.canvas.before:
+            Color(0.12, 0.12, 0.12, 1)
+            self.log_background = Rectangle(pos=self.log_scroll.pos, size=self.log_scroll.size)
+        self.log_scroll.bind(pos=lambda w, v: setattr(self.log_background, 'pos', v),
+                             size=lambda w, v: setattr(self.log_background, 'size', v))
+        self.log_scroll.viewclass = LogLine
+        self.log_view = RecycleBoxLayout(orientation='vertical', size_hint_y=None,
+                                         default_size=(None, dp(20)), default_size_hint=(1, None))
+        self.log_view.bind(minimum_height=self.log_view.setter('height'))
         self.log_scroll.add_widget(self.log_view)
         self.add_widget(self.log_scroll)
+        self.refresh_log_view = Clock.create_trigger(self.append_to_log)
 
         self.progress_bar = ProgressBar(max=100, value=0, size_hint_y=None, height=25)
         self.add_widget(self.progress_bar)
@@ -261,6 +331,7 @@ class ADBInstaller(BoxLayout):
         # Check privileges
         if IS_WINDOWS:
             try:
+                import ctypes  # To check for admin privileges on Windows
                 if not ctypes.windll.shell32.IsUserAnAdmin():
                     self.log_message(self.tr("warn_admin"), level="warning")
             except Exception as e:
@@ -352,80 +423,9 @@ class ADBInstaller(BoxLayout):
         options_layout.add_widget(self.log_level_spinner)
         self.control_panel.add_widget(options_layout)
 
-        # ADB reboot buttons
-        reboot_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
-        self.btn_reboot_recovery = Button(text=self.tr("reboot_recovery"), size_hint_x=0.33, height=40)
-        self.btn_reboot_recovery.bind(on_press=self.on_adb_reboot_recovery)
-        reboot_layout.add_widget(self.btn_reboot_recovery)
-        self.widgets_to_update["reboot_recovery"] = self.btn_reboot_recovery
-
-        self.btn_reboot_bootloader = Button(text=self.tr("reboot_bootloader"), size_hint_x=0.33, height=40)
-        self.btn_reboot_bootloader.bind(on_press=self.on_adb_reboot_bootloader)
-        reboot_layout.add_widget(self.btn_reboot_bootloader)
-        self.widgets_to_update["reboot_bootloader"] = self.btn_reboot_bootloader
-
-        self.btn_reboot = Button(text=self.tr("reboot"), size_hint_x=0.33, height=40)
-        self.btn_reboot.bind(on_press=self.on_adb_reboot)
-        reboot_layout.add_widget(self.btn_reboot)
-        self.widgets_to_update["reboot"] = self.btn_reboot
-        self.control_panel.add_widget(reboot_layout)
-
-        # Fastboot reboot buttons
-        fastboot_reboot_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
-        self.btn_reboot_edl = Button(text=self.tr("reboot_edl"), size_hint_x=0.5, height=40)
-        self.btn_reboot_edl.bind(on_press=self.on_reboot_edl_pressed)
-        fastboot_reboot_layout.add_widget(self.btn_reboot_edl)
-        self.widgets_to_update["reboot_edl"] = self.btn_reboot_edl
-
-        self.btn_reboot_fastbootd = Button(text=self.tr("reboot_fastbootd"), size_hint_x=0.5, height=40)
-        self.btn_reboot_fastbootd.bind(on_press=self.on_reboot_fastbootd_pressed)
-        fastboot_reboot_layout.add_widget(self.btn_reboot_fastbootd)
-        self.widgets_to_update["reboot_fastbootd"] = self.btn_reboot_fastbootd
-        self.control_panel.add_widget(fastboot_reboot_layout)
-
-        # Device checking buttons
-        device_check_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
-        self.btn_check_adb = Button(text=self.tr("check_adb_devices"), size_hint_x=0.33, height=40)
-        self.btn_check_adb.bind(on_press=lambda x: threading.Thread(target=self.check_adb_devices, daemon=True).start())
-        device_check_layout.add_widget(self.btn_check_adb)
-        self.widgets_to_update["check_adb_devices"] = self.btn_check_adb
-
-        self.btn_check_fastboot = Button(text=self.tr("check_fastboot_devices"), size_hint_x=0.33, height=40)
-        self.btn_check_fastboot.bind(on_press=lambda x: threading.Thread(target=self.check_fastboot_devices, daemon=True).start())
-        device_check_layout.add_widget(self.btn_check_fastboot)
-        self.widgets_to_update["check_fastboot_devices"] = self.btn_check_fastboot
-
-        self.btn_check_lsusb = Button(text=self.tr("check_lsusb"), size_hint_x=0.33, height=40)
-        self.btn_check_lsusb.bind(on_press=lambda x: threading.Thread(target=self.check_lsusb, daemon=True).start())
-        device_check_layout.add_widget(self.btn_check_lsusb)
-        self.widgets_to_update["check_lsusb"] = self.btn_check_lsusb
-        self.control_panel.add_widget(device_check_layout)
-
-        # Sideload and getvar all
-        sideload_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
-        # Option: default prefix based on platform
-        if IS_WINDOWS:
-            sideload_values = [".\\", "adb -b sideload", "adb -a sideload"]
-        else:
-            sideload_values = ["./", "adb -b sideload", "adb -a sideload"]
-        self.sideload_spinner = Spinner(
-            text=sideload_values[0],
-            values=sideload_values,
-            size_hint_x=0.5, height=40
-        )
-        sideload_layout.add_widget(self.sideload_spinner)
-        self.btn_start_sideload = Button(text=self.tr("start_sideload"), size_hint_x=0.5, height=40)
-        self.btn_start_sideload.bind(on_press=self.on_start_sideload_pressed)
-        sideload_layout.add_widget(self.btn_start_sideload)
-        self.widgets_to_update["start_sideload"] = self.btn_start_sideload
-        self.control_panel.add_widget(sideload_layout)
-
-        getvar_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
-        self.btn_getvar_all = Button(text=self.tr("getvar_all"), size_hint_x=1, height=40)
-        self.btn_getvar_all.bind(on_press=self.on_getvar_all_pressed)
-        getvar_layout.add_widget(self.btn_getvar_all)
-        self.widgets_to_update["getvar_all"] = self.btn_getvar_all
-        self.control_panel.add_widget(getvar_layout)
+        self.secondary_panels_built = False
+        if not LAZY_PANELS:
+            self.build_secondary_panels()
 
         # Language toggle button
         self.btn_language = Button(text=self.tr("language"), size_hint_y=None, height=40)
@@ -441,7 +441,100 @@ class ADBInstaller(BoxLayout):
         # Automatic device detection label at the bottom
         self.device_status_label = Label(text=self.tr("no_device"), size_hint_y=None, height=30)
         self.add_widget(self.device_status_label)
-        Clock.schedule_interval(self.update_device_status, 5)
+        # Device changes are pushed by a background watcher; the UI only drains its queue.
+        self.device_watcher = DeviceWatcher()
+        self.device_watcher.start()
+        Clock.schedule_interval(self.update_device_status, 0.2)
+        # Optional Prometheus endpoint (FASTBOOTGUI_METRICS); the log depth is read at scrape time.
+        metrics.log_queue_depth.set_function(lambda: self.log_store.total - self.log_shown_total)
+        Clock.schedule_once(lambda dt: metrics.start_server(), 0)
+
+    def build_secondary_panels(self, dt=None):
+        """
+        Builds the reboot, device check, sideload and getvar rows. With LAZY_PANELS this
+        runs right after the first frame, so that the window shows up sooner.
+        """
+        with startup_profiler.phase("secondary panels"):
+            # ADB reboot buttons
+            reboot_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            self.btn_reboot_recovery = Button(text=self.tr("reboot_recovery"), size_hint_x=0.33, height=40)
+            self.btn_reboot_recovery.bind(on_press=self.on_adb_reboot_recovery)
+            reboot_layout.add_widget(self.btn_reboot_recovery)
+            self.widgets_to_update["reboot_recovery"] = self.btn_reboot_recovery
+
+            self.btn_reboot_bootloader = Button(text=self.tr("reboot_bootloader"), size_hint_x=0.33, height=40)
+            self.btn_reboot_bootloader.bind(on_press=self.on_adb_reboot_bootloader)
+            reboot_layout.add_widget(self.btn_reboot_bootloader)
+            self.widgets_to_update["reboot_bootloader"] = self.btn_reboot_bootloader
+
+            self.btn_reboot = Button(text=self.tr("reboot"), size_hint_x=0.33, height=40)
+            self.btn_reboot.bind(on_press=self.on_adb_reboot)
+            reboot_layout.add_widget(self.btn_reboot)
+            self.widgets_to_update["reboot"] = self.btn_reboot
+            self.add_secondary_panel(reboot_layout)
+
+            # Fastboot reboot buttons
+            fastboot_reboot_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            self.btn_reboot_edl = Button(text=self.tr("reboot_edl"), size_hint_x=0.5, height=40)
+            self.btn_reboot_edl.bind(on_press=self.on_reboot_edl_pressed)
+            fastboot_reboot_layout.add_widget(self.btn_reboot_edl)
+            self.widgets_to_update["reboot_edl"] = self.btn_reboot_edl
+
+            self.btn_reboot_fastbootd = Button(text=self.tr("reboot_fastbootd"), size_hint_x=0.5, height=40)
+            self.btn_reboot_fastbootd.bind(on_press=self.on_reboot_fastbootd_pressed)
+            fastboot_reboot_layout.add_widget(self.btn_reboot_fastbootd)
+            self.widgets_to_update["reboot_fastbootd"] = self.btn_reboot_fastbootd
+            self.add_secondary_panel(fastboot_reboot_layout)
+
+            # Device checking buttons
+            device_check_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            self.btn_check_adb = Button(text=self.tr("check_adb_devices"), size_hint_x=0.33, height=40)
+            self.btn_check_adb.bind(on_press=lambda x: self.executor.submit("query", self.check_adb_devices))
+            device_check_layout.add_widget(self.btn_check_adb)
+            self.widgets_to_update["check_adb_devices"] = self.btn_check_adb
+
+            self.btn_check_fastboot = Button(text=self.tr("check_fastboot_devices"), size_hint_x=0.33, height=40)
+            self.btn_check_fastboot.bind(on_press=lambda x: self.executor.submit("query", self.check_fastboot_devices))
+            device_check_layout.add_widget(self.btn_check_fastboot)
+            self.widgets_to_update["check_fastboot_devices"] = self.btn_check_fastboot
+
+            self.btn_check_lsusb = Button(text=self.tr("check_lsusb"), size_hint_x=0.33, height=40)
+            self.btn_check_lsusb.bind(on_press=lambda x: self.executor.submit("query", self.check_lsusb))
+            device_check_layout.add_widget(self.btn_check_lsusb)
+            self.widgets_to_update["check_lsusb"] = self.btn_check_lsusb
+            self.add_secondary_panel(device_check_layout)
+
+            # Sideload and getvar all
+            sideload_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            # Option: default prefix based on platform
+            if IS_WINDOWS:
+                sideload_values = [".\\", "adb -b sideload", "adb -a sideload"]
+            else:
+                sideload_values = ["./", "adb -b sideload", "adb -a sideload"]
+            self.sideload_spinner = Spinner(
+                text=sideload_values[0],
+                values=sideload_values,
+                size_hint_x=0.5, height=40
+            )
+            sideload_layout.add_widget(self.sideload_spinner)
+            self.btn_start_sideload = Button(text=self.tr("start_sideload"), size_hint_x=0.5, height=40)
+            self.btn_start_sideload.bind(on_press=self.on_start_sideload_pressed)
+            sideload_layout.add_widget(self.btn_start_sideload)
+            self.widgets_to_update["start_sideload"] = self.btn_start_sideload
+            self.add_secondary_panel(sideload_layout)
+
+            getvar_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            self.btn_getvar_all = Button(text=self.tr("getvar_all"), size_hint_x=1, height=40)
+            self.btn_getvar_all.bind(on_press=self.on_getvar_all_pressed)
+            getvar_layout.add_widget(self.btn_getvar_all)
+            self.widgets_to_update["getvar_all"] = self.btn_getvar_all
+            self.add_secondary_panel(getvar_layout)
+        self.secondary_panels_built = True
+
+    def add_secondary_panel(self, widget):
+        """Adds a row above the language button (which is the last row of the panel)."""
+        language = getattr(self, "btn_language", None)
+        self.control_panel.add_widget(widget, index=1 if language is not None and language.parent else 0)
 
     def tr(self, key):
         """Returns the translation for the given key according to the current language."""
@@ -452,30 +545,41 @@ class ADBInstaller(BoxLayout):
         for key, widget in self.widgets_to_update.items():
             if key in self.translations["en"]:
                 widget.text = self.tr(key)
-        self.device_status_label.text = self.tr("no_device")
+        self.refresh_device_status_label()
 
     def log_message(self, message, level="info"):
         """Adds a message to the log (console, file and UI)."""
-        self.log_text += message + "\n"
+        self.log_store.append(message)
         if level == "info":
             logging.info(message)
         elif level == "warning":
             logging.warning(message)
         elif level == "error":
             logging.error(message)
-        Clock.schedule_once(lambda dt: self.append_to_log(message), 0)
-
-    def append_to_log(self, message):
-        """Updates the log area and scrolls to the bottom."""
-        self.log_view.text += message + "\n"
-        Clock.schedule_once(lambda dt: setattr(self.log_scroll, 'scroll_y', 0), 0)
+        # Several messages logged within one frame are shown by a single refresh.
+        self.refresh_log_view()
+
+    @tracer.traced(cat="ui")
+    def append_to_log(self, dt):
+        """Adds the lines logged since the last refresh to the log view and scrolls to the bottom."""
+        at_bottom = self.log_scroll.scroll_y <= 0.01
+        self.log_shown_total, lines = self.log_store.since(self.log_shown_total)
+        if not lines:
+            return
+        data = self.log_scroll.data
+        data.extend({'text': line} for line in lines)
+        overflow = len(data) - self.log_store.max_lines
+        if overflow > 0:
+            del data[:overflow]
+        if at_bottom:
+            Clock.schedule_once(lambda dt: setattr(self.log_scroll, 'scroll_y', 0), 0)
 
     def export_log(self, instance):
         """Exports the log content to a timestamped text file."""
         filename = f"log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
         try:
             with open(filename, "w", encoding="utf-8") as f:
-                f.write(self.log_text)
+                self.log_store.write_to(f)
             self.log_message(self.tr("log_exported") + filename)
         except Exception as e:
             self.log_message(f"Error exporting log: {e}", level="error")
@@ -488,6 +592,7 @@ class ADBInstaller(BoxLayout):
 
     # --- Functions related to ADB/Fastboot ---
 
+    @tracer.traced()
     def check_adb_fastboot(self):
         """Checks for ADB and Fastboot availability on all platforms."""
         self.log_message(self.tr("Starting check for ADB and Fastboot..."))
@@ -522,34 +627,45 @@ class ADBInstaller(BoxLayout):
         Downloads and installs ADB/Fastboot for Windows or launches installation via package manager on Linux.
         Supports "force install" option to bypass some checks.
         """
+        @tracer.traced("install_adb_fastboot")
         def installation_task():
-            self.cancel_flag = False
+            job = job_executor.current_job()
             self.log_message(self.tr("Starting ADB/Fastboot installation..."))
             if IS_WINDOWS:
                 os_name = "windows"
                 url = PLATFORM_TOOLS_URL.format(os_name)
-                self.log_message("Downloading from " + url + " ...")
 
                 def progress_update(value):
                     Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', value), 0)
 
-                if download_file(url, DOWNLOAD_ZIP_NAME, progress_callback=progress_update, cancel_check=lambda: self.cancel_flag):
-                    self.log_message("Download completed. Validating file...")
-                    if not is_zipfile(DOWNLOAD_ZIP_NAME):
+                import checksum
+                from zipfile import is_zipfile
+                expected = checksum.load_manifest(DIGEST_MANIFEST).get(DOWNLOAD_ZIP_NAME)
+                zip_path, sha256 = fetch_artifact(url, DOWNLOAD_ZIP_NAME, expected, progress_update,
+                                                  cancel_check=job.cancelled, log=self.log_message)
+                if zip_path:
+                    self.log_message("Validating file...")
+                    if not is_zipfile(zip_path):
                         self.log_message("Error: Downloaded file is not a valid zip.", level="error")
                         return
-                    file_hash = calculate_file_hash(DOWNLOAD_ZIP_NAME)
-                    self.log_message("Downloaded file hash: " + str(file_hash))
-                    self.log_message("File validated. Extracting...")
-                    if extract_zip(DOWNLOAD_ZIP_NAME, EXTRACT_DIR, progress_callback=progress_update):
-                        adb_filename = "adb.exe" if IS_WINDOWS else "adb"
-                        adb_path = Path(EXTRACT_DIR) / adb_filename
-                        if adb_path.exists():
-                            self.log_message("Installation successful! Add 'platform-tools' to your PATH.")
-                        else:
-                            self.log_message("Error: Installation failed. 'platform-tools' not found after extraction.", level="error")
+                    marker = Path(EXTRACT_DIR) / EXTRACT_MARKER
+                    adb_filename = "adb.exe" if IS_WINDOWS else "adb"
+                    adb_path = Path(EXTRACT_DIR) / adb_filename
+                    if marker.exists() and marker.read_text().strip() == sha256 and adb_path.exists():
+                        self.log_message("platform-tools is already extracted from this archive.")
+                        self.log_message("Installation successful! Add 'platform-tools' to your PATH.")
                     else:
-                        self.log_message("Error during extraction.", level="error")
+                        # Extracting over the previous version only rewrites the files that changed.
+                        self.log_message("File validated. Extracting...")
+                        if extract_zip(zip_path, EXTRACT_DIR, progress_callback=progress_update, cancel_check=job.cancelled):
+                            marker.write_text(sha256)
+                            tool_registry.forget()
+                            if adb_path.exists():
+                                self.log_message("Installation successful! Add 'platform-tools' to your PATH.")
+                            else:
+                                self.log_message("Error: Installation failed. 'platform-tools' not found after extraction.", level="error")
+                        else:
+                            self.log_message("Error during extraction.", level="error")
                 else:
                     self.log_message("Error during download or download cancelled.", level="error")
                 Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 0), 0)
@@ -569,32 +685,32 @@ class ADBInstaller(BoxLayout):
                     return
                 self.log_message("Running command: " + " ".join(cmd))
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+                    with tracer.command(cmd) as span, metrics.command(cmd) as measure:
+                        # sudo may have to ask for the password on the terminal.
+                        result = job_executor.run(cmd, timeout=60, interactive=True)
+                        span.set(exit_code=result.returncode)
+                        measure.done(result.returncode)
                     if result.returncode == 0:
+                        tool_registry.forget()
                         self.log_message("Installation completed successfully via package manager.")
                     else:
                         self.log_message("Error during package installation: " + result.stderr, level="error")
                 except Exception as e:
                     self.log_message(f"Exception during package installation: {e}", level="error")
-        threading.Thread(target=installation_task, daemon=True).start()
+        return self.executor.submit("tools", installation_task, name="install_adb_fastboot")
 
     def update_adb_fastboot(self):
         """
         Updates ADB/Fastboot.
-        For Windows, removes the old version and reinstalls.
+        For Windows, reinstalls; the old version is replaced only if a new archive was published.
         For Linux, executes the update command via package manager or relaunches installation.
         The progress bar is updated accordingly.
         """
+        @tracer.traced("update_adb_fastboot")
         def update_task():
             self.log_message(self.tr("Starting update for ADB/Fastboot..."))
             if IS_WINDOWS:
-                if Path(EXTRACT_DIR).exists():
-                    try:
-                        shutil.rmtree(EXTRACT_DIR)
-                        self.log_message("Previous platform-tools removed successfully.")
-                    except Exception as e:
-                        self.log_message("Error removing old platform-tools: " + str(e), level="error")
-                        return
+                # The installation replaces platform-tools only if the archive has changed.
                 self.install_adb_fastboot()
             else:
                 self.log_message(self.tr("update_linux"))
@@ -611,20 +727,23 @@ class ADBInstaller(BoxLayout):
                     return
                 self.log_message("Running update command: " + " ".join(cmd))
                 try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+                    with tracer.command(cmd) as span, metrics.command(cmd) as measure:
+                        # sudo may have to ask for the password on the terminal.
+                        result = job_executor.run(cmd, timeout=60, interactive=True)
+                        span.set(exit_code=result.returncode)
+                        measure.done(result.returncode)
                     if result.returncode == 0:
                         self.log_message("Update completed successfully via package manager.")
                     else:
                         self.log_message("Error during package update: " + result.stderr, level="error")
                 except Exception as e:
                     self.log_message(f"Exception during package update: {e}", level="error")
-        threading.Thread(target=update_task, daemon=True).start()
+        return self.executor.submit("tools", update_task, name="update_adb_fastboot")
 
     def check_fastboot_mode(self):
         """Detects whether the device is in classic fastboot or fastbootd mode."""
         try:
-            result = subprocess.run(["fastboot", "getvar", "is-userspace"], capture_output=True, text=True, timeout=10)
-            if "is-userspace: yes" in result.stdout:
+            if getvar_cache.get().is_userspace:
                 self.log_message("Device is in fastbootd mode.")
                 return True
             else:
@@ -634,13 +753,15 @@ class ADBInstaller(BoxLayout):
             self.log_message("Error detecting fastboot mode: " + str(e), level="error")
             return False
 
+    @tracer.traced()
     def flash_partition(self):
         """
         Checks the fastboot connection and flashes the selected partition after confirmation.
         Considers verbose mode and force install option.
         """
+        import fastboot_protocol
         try:
-            result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True, timeout=10)
+            result = fastboot_protocol.run(["fastboot", "devices"], timeout=10)
         except Exception as e:
             self.log_message("Error running 'fastboot devices': " + str(e), level="error")
             return
@@ -657,6 +778,7 @@ class ADBInstaller(BoxLayout):
             self.log_message("Error: No file selected for flashing or file does not exist.", level="error")
             return
 
+        from kivy.uix.popup import Popup
         content = BoxLayout(orientation='vertical', padding=10)
         content.add_widget(Label(text=f"Flash file:\n{file_to_flash}\non partition: {partition} (Slot: {slot}) ?"))
         btn_layout = BoxLayout(size_hint_y=None, height=40, spacing=10)
@@ -667,13 +789,14 @@ class ADBInstaller(BoxLayout):
         content.add_widget(btn_layout)
         popup = Popup(title="Confirm Flash", content=content, size_hint=(0.8, 0.5))
 
-        def confirmed(instance):
-            popup.dismiss()
+        @tracer.traced("flash")
+        def run_flash():
+            getvar_cache.invalidate()
             self.log_message("Preparing to flash...")
             try:
                 self.log_message("Flashing in progress...")
                 # Uncomment the following line to perform the actual flash:
-                # subprocess.run(["fastboot", "flash", partition, file_to_flash], check=True)
+                # fastboot_protocol.run(["fastboot", "flash", partition, file_to_flash])
                 time.sleep(2)  # Simulation delay
                 if self.chk_verbose.active:
                     self.log_message("Verbose mode: Detailed flash log output...")
@@ -683,6 +806,10 @@ class ADBInstaller(BoxLayout):
             except Exception as e:
                 self.log_message("Error during flash: " + str(e), level="error")
 
+        def confirmed(instance):
+            popup.dismiss()
+            self.executor.submit("device", run_flash, name="flash")
+
         def cancelled(instance):
             self.log_message("Flash cancelled by user.", level="warning")
             popup.dismiss()
@@ -691,11 +818,22 @@ class ADBInstaller(BoxLayout):
         btn_no.bind(on_press=cancelled)
         popup.open()
 
+    @tracer.traced()
     def reboot_command(self, command, description):
         """Executes a reboot command and logs the result."""
+        getvar_cache.invalidate()
         try:
             self.log_message(f"{description}: {' '.join(command)}")
-            result = subprocess.run(command, capture_output=True, text=True, timeout=10)
+            if command[0] == "adb":
+                result = adb_client.run(command, timeout=10)
+            elif command[0] == "fastboot":
+                import fastboot_protocol
+                result = fastboot_protocol.run(command, timeout=10)
+            else:
+                with tracer.command(command) as span, metrics.command(command) as measure:
+                    result = job_executor.run(command, timeout=10)
+                    span.set(exit_code=result.returncode)
+                    measure.done(result.returncode)
             if result.returncode == 0:
                 self.log_message(f"{description} executed successfully.")
             else:
@@ -703,11 +841,14 @@ class ADBInstaller(BoxLayout):
         except Exception as e:
             self.log_message(f"Exception executing {description}: {e}", level="error")
 
+    @tracer.traced()
     def reboot_edl(self):
         """Reboots the device into EDL mode."""
+        import fastboot_protocol
+        getvar_cache.invalidate()
         try:
             self.log_message("Attempting to reboot device into EDL mode...")
-            result = subprocess.run(["fastboot", "reboot", "edl"], capture_output=True, text=True, timeout=10)
+            result = fastboot_protocol.run(["fastboot", "reboot", "edl"], timeout=10)
             if result.returncode == 0:
                 self.log_message("EDL reboot command executed successfully.")
             else:
@@ -715,10 +856,11 @@ class ADBInstaller(BoxLayout):
         except Exception as e:
             self.log_message("Exception during EDL reboot: " + str(e), level="error")
 
+    @tracer.traced()
     def check_adb_devices(self):
         """Checks and logs the connected ADB devices."""
         try:
-            result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=10)
+            result = adb_client.run(["adb", "devices"], timeout=10)
             devices = result.stdout.strip().split("\n")[1:]
             if devices and any(dev.strip() for dev in devices):
                 self.log_message("Connected ADB devices:")
@@ -730,10 +872,12 @@ class ADBInstaller(BoxLayout):
         except Exception as e:
             self.log_message("Error checking ADB devices: " + str(e), level="error")
 
+    @tracer.traced()
     def check_fastboot_devices(self):
         """Checks and logs the connected Fastboot devices."""
+        import fastboot_protocol
         try:
-            result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True, timeout=10)
+            result = fastboot_protocol.run(["fastboot", "devices"], timeout=10)
             devices = result.stdout.strip().split("\n")
             if devices and any(dev.strip() for dev in devices):
                 self.log_message("Connected Fastboot devices:")
@@ -745,6 +889,7 @@ class ADBInstaller(BoxLayout):
         except Exception as e:
             self.log_message("Error checking Fastboot devices: " + str(e), level="error")
 
+    @tracer.traced()
     def check_lsusb(self):
         """Checks for lsusb availability on Linux and runs it."""
         if IS_WINDOWS:
@@ -755,19 +900,33 @@ class ADBInstaller(BoxLayout):
         if not lsusb_path:
             self.log_message("lsusb command not found. Attempting to install usbutils...")
             if os.geteuid() == 0:
-                try:
-                    subprocess.run(["apt-get", "update"], check=True)
-                    subprocess.run(["apt-get", "install", "-y", "usbutils"], check=True)
-                    self.log_message("usbutils installed successfully.")
-                except Exception as e:
-                    self.log_message("Error installing usbutils: " + str(e), level="error")
-                    return
+                # Through the job executor: 'Cancel' stops apt-get and its children.
+                for cmd in (["apt-get", "update"], ["apt-get", "install", "-y", "usbutils"]):
+                    try:
+                        with tracer.command(cmd) as span, metrics.command(cmd) as measure:
+                            result = job_executor.run(cmd, timeout=300)
+                            span.set(exit_code=result.returncode)
+                            measure.done(result.returncode)
+                    except job_executor.JobCancelled:
+                        self.log_message("usbutils installation cancelled.", level="warning")
+                        return
+                    except Exception as e:
+                        self.log_message("Error installing usbutils: " + str(e), level="error")
+                        return
+                    if result.returncode != 0:
+                        self.log_message(f"Error installing usbutils ({' '.join(cmd)}): " + result.stderr,
+                                         level="error")
+                        return
+                self.log_message("usbutils installed successfully.")
             else:
                 self.log_message("Please run the script as root to install usbutils.", level="warning")
                 return
 
         try:
-            result = subprocess.run(["lsusb"], capture_output=True, text=True, timeout=10)
+            with tracer.command(["lsusb"]) as span, metrics.command(["lsusb"]) as measure:
+                result = job_executor.run(["lsusb"], timeout=10)
+                span.set(exit_code=result.returncode)
+                measure.done(result.returncode)
             self.log_message("LSUSB output:")
             self.log_message(result.stdout)
         except Exception as e:
@@ -775,6 +934,8 @@ class ADBInstaller(BoxLayout):
 
     def on_browse_pressed(self, instance):
         """Opens a file chooser to select a flashable file and adjusts partitions."""
+        from kivy.uix.popup import Popup
+        from kivy.uix.filechooser import FileChooserListView
         filechooser = FileChooserListView(path=os.getcwd())
 
         def select_file(instance):
@@ -832,68 +993,88 @@ class ADBInstaller(BoxLayout):
         args.append(file_arg)
         self.log_message("Starting sideload command: " + " ".join(args))
 
+        def on_progress(event):
+            if event.kind == "percent":
+                Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', event.percent), 0)
+
+        def on_line(line):
+            if "%)" not in line:
+                self.log_message(line)
+
+        @tracer.traced("sideload")
         def run_sideload():
+            from command_runner import run_streaming
             try:
-                result = subprocess.run(args, capture_output=True, text=True, timeout=60)
-                if result.returncode == 0:
+                # Cancelling the job stops adb and its children (see job_executor).
+                result = run_streaming(args, on_line=on_line, on_progress=on_progress)
+                Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 0), 0)
+                if result.returncode is None:
+                    self.log_message("Sideload cancelled.", level="warning")
+                elif result.returncode == 0:
                     self.log_message("Sideload completed successfully.")
                 else:
                     self.log_message("Error during sideload (code " + str(result.returncode) + "): " + result.stderr, level="error")
             except Exception as e:
                 self.log_message("Exception during sideload: " + str(e), level="error")
-        threading.Thread(target=run_sideload, daemon=True).start()
+        self.executor.submit("device", run_sideload, name="sideload")
 
     def on_getvar_all_pressed(self, instance):
         """Executes the 'fastboot getvar all' command and logs the output."""
         self.log_message("Executing 'fastboot getvar all' command...")
+        if default_lanes.busy():
+            self.log_message("Device busy: 'getvar all' will run after the current command.", level="warning")
+        @tracer.traced("getvar_all")
         def run_getvar_all():
             try:
-                result = subprocess.run(["fastboot", "getvar", "all"], capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    self.log_message("Output of 'fastboot getvar all':")
-                    self.log_message(result.stdout)
-                else:
-                    self.log_message("Error: 'fastboot getvar all' returned code " + str(result.returncode) + ".", level="error")
+                # Explicit request: refresh the cached model, which other features then reuse.
+                info = getvar_cache.get(refresh=True)
+                self.log_message("Output of 'fastboot getvar all':")
+                self.log_message("\n".join(f"{key}: {value}" for key, value in info.variables.items()))
+                self.log_message(f"Product: {info.product} - Current slot: {info.current_slot} - "
+                                 f"Unlocked: {info.unlocked} - Partitions: {len(info.partitions)}")
             except Exception as e:
                 self.log_message("Exception during 'fastboot getvar all': " + str(e), level="error")
-        threading.Thread(target=run_getvar_all, daemon=True).start()
+        self.executor.submit("query", run_getvar_all, name="getvar_all")
 
-    # --- Methods for actions via threads ---
+    # --- Methods for actions via jobs ---
     def on_check_pressed(self, instance):
-        threading.Thread(target=self.check_adb_fastboot, daemon=True).start()
+        self.executor.submit("tools", self.check_adb_fastboot)
 
     def on_install_pressed(self, instance):
-        threading.Thread(target=self.install_adb_fastboot, daemon=True).start()
+        self.install_adb_fastboot()
 
     def on_update_pressed(self, instance):
-        threading.Thread(target=self.update_adb_fastboot, daemon=True).start()
+        self.update_adb_fastboot()
 
     def on_flash_pressed(self, instance):
-        threading.Thread(target=self.flash_partition, daemon=True).start()
+        self.executor.submit("device", self.flash_partition)
 
     def on_reboot_edl_pressed(self, instance):
-        threading.Thread(target=self.reboot_edl, daemon=True).start()
+        self.executor.submit("device", self.reboot_edl)
 
     def on_reboot_fastbootd_pressed(self, instance):
-        threading.Thread(target=lambda: self.reboot_command(["fastboot", "reboot", "fastboot"], "Reboot FastbootD"), daemon=True).start()
+        self.executor.submit("device", self.reboot_command, ["fastboot", "reboot", "fastboot"], "Reboot FastbootD")
 
     def on_cancel_pressed(self, instance):
-        """Cancels any ongoing long operation."""
-        self.cancel_flag = True
-        self.log_message("Cancel flag set. Ongoing operation will be cancelled.", level="warning")
+        """Cancels the queued and running jobs, stopping their commands."""
+        count = self.executor.cancel_all()
+        if count:
+            self.log_message(f"Cancelling {count} operation(s). Running commands are being stopped.", level="warning")
+        else:
+            self.log_message("No operation in progress.")
 
     # --- ADB Reboot Buttons ---
     def on_adb_reboot_recovery(self, instance):
         """Executes the 'adb reboot recovery' command."""
-        threading.Thread(target=lambda: self.reboot_command(["adb", "reboot", "recovery"], "ADB Reboot Recovery"), daemon=True).start()
+        self.executor.submit("device", self.reboot_command, ["adb", "reboot", "recovery"], "ADB Reboot Recovery")
 
     def on_adb_reboot_bootloader(self, instance):
         """Executes the 'adb reboot bootloader' command."""
-        threading.Thread(target=lambda: self.reboot_command(["adb", "reboot", "bootloader"], "ADB Reboot Bootloader"), daemon=True).start()
+        self.executor.submit("device", self.reboot_command, ["adb", "reboot", "bootloader"], "ADB Reboot Bootloader")
 
     def on_adb_reboot(self, instance):
         """Executes the 'adb reboot' command."""
-        threading.Thread(target=lambda: self.reboot_command(["adb", "reboot"], "ADB Reboot"), daemon=True).start()
+        self.executor.submit("device", self.reboot_command, ["adb", "reboot"], "ADB Reboot")
 
     def toggle_language(self, instance):
         """Toggles between English and French and updates the UI in real time."""
@@ -902,20 +1083,29 @@ class ADBInstaller(BoxLayout):
         self.update_ui_language()
 
     def update_device_status(self, dt):
-        """Continuously checks for ADB and Fastboot devices and updates the status label."""
-        try:
-            adb_status = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
-            fastboot_status = subprocess.run(["fastboot", "devices"], capture_output=True, text=True, timeout=5)
-            adb_devices = [d for d in adb_status.stdout.strip().split("\n")[1:] if d.strip()]
-            fastboot_devices = [d for d in fastboot_status.stdout.strip().split("\n") if d.strip()]
-        except FileNotFoundError:
-            adb_devices = []
-            fastboot_devices = []
-            self.log_message("ADB or Fastboot command not found.", level="error")
-        except Exception as e:
-            self.log_message("Error checking device status: " + str(e), level="error")
-            adb_devices = []
-            fastboot_devices = []
+        """Applies the device changes published by the watcher and updates the status label."""
+        changed = False
+        while True:
+            try:
+                event = self.device_watcher.events.get_nowait()
+            except queue.Empty:
+                break
+            changed = True
+            if event.mode == "fastboot":
+                getvar_cache.invalidate(event.serial)
+            if event.state is None:
+                self.log_message(f"Device {event.serial} disconnected ({event.mode}).")
+            else:
+                self.log_message(f"Device {event.serial} [{event.mode}]: {event.state}")
+        if changed:
+            self.refresh_device_status_label()
+
+    @tracer.traced(cat="ui")
+    def refresh_device_status_label(self):
+        """Sets the status label from the devices currently known by the watcher."""
+        devices = self.device_watcher.snapshot()
+        adb_devices = devices["adb"]
+        fastboot_devices = devices["fastboot"]
         if adb_devices and fastboot_devices:
             status = self.tr("device_both")
         elif adb_devices:
@@ -928,7 +1118,28 @@ class ADBInstaller(BoxLayout):
 
 class ADBInstallerApp(App):
     def build(self):
-        return ADBInstaller()
+        startup_profiler.mark("build")
+        with startup_profiler.phase("main window"):
+            return ADBInstaller()
+
+    def on_start(self):
+        from kivy.core.window import Window
+        startup_profiler.mark("app started")
+        Window.bind(on_flip=self.on_first_frame)
+
+    def on_first_frame(self, window):
+        """Called once the first frame is on screen: builds the deferred panels, then reports."""
+        window.unbind(on_flip=self.on_first_frame)
+        startup_profiler.mark("first frame")
+        if not self.root.secondary_panels_built:
+            self.root.build_secondary_panels()
+        startup_profiler.mark("interactive")
+        startup_profiler.report()
+
+    def on_stop(self):
+        # Cancel the jobs so that no adb/fastboot process outlives the window.
+        self.root.executor.shutdown(cancel=True, timeout=5)
+        self.root.device_watcher.stop()
 
 if __name__ == "__main__":
     ADBInstallerApp().run()
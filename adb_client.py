@@ -0,0 +1,319 @@
+#This module contains AdbClient, a pure-Python client for the adb server's TCP
+#protocol (port 5037), so that ADB queries no longer spawn an 'adb' process.
+
+import os
+import select
+import socket
+import struct
+import subprocess
+import threading
+import logging
+
+import job_executor
+import metrics
+from device_lanes import default_lanes
+from tool_registry import default_registry as tool_registry
+from tracing import tracer
+
+ADB_SERVER_HOST = "127.0.0.1"
+ADB_SERVER_PORT = 5037
+
+# Shell protocol v2 packet ids ('shell,v2:' service): id byte, little-endian length, payload.
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+
+class AdbError(Exception):
+    """Raised when the adb server answers FAIL to a request."""
+
+
+class ShellProtocolUnsupported(AdbError):
+    """Raised when the device refuses 'shell,v2:' (Android 6 and older)."""
+
+
+class AdbUnavailable(ConnectionError):
+    """
+    Raised when the adb server cannot be reached, or drops the connection while the
+    device transport is selected: the request itself was not sent.
+    """
+
+
+def recv_exact(sock, size):
+    """Reads exactly 'size' bytes from the socket."""
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+def recv_all(sock):
+    """Reads from the socket until the server closes it."""
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def read_message(sock):
+    """Reads one length-prefixed message ('%04x' + payload)."""
+    length = int(recv_exact(sock, 4), 16)
+    return recv_exact(sock, length).decode("utf-8", "replace") if length else ""
+
+
+def send_request(sock, request):
+    """Sends a request and waits for OKAY; raises AdbError with the server message on FAIL."""
+    data = request.encode("utf-8")
+    sock.sendall(b"%04x" % len(data) + data)
+    status = recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise AdbError(read_message(sock))
+    raise AdbError("unexpected reply from adb server: %r" % status)
+
+
+def read_shell_packets(sock):
+    """
+    Reads shell protocol v2 packets until the exit packet.
+    Returns (exit status, stdout bytes, stderr bytes).
+    """
+    stdout, stderr = [], []
+    while True:
+        header = recv_exact(sock, 5)
+        kind, length = header[0], struct.unpack("<I", header[1:])[0]
+        payload = recv_exact(sock, length) if length else b""
+        if kind == SHELL_STDOUT:
+            stdout.append(payload)
+        elif kind == SHELL_STDERR:
+            stderr.append(payload)
+        elif kind == SHELL_EXIT:
+            return (payload[0] if payload else 0), b"".join(stdout), b"".join(stderr)
+
+
+def parse_devices_long(payload):
+    """Parses host:devices-l output into a list of dictionaries (serial, state, product, model...)."""
+    devices = []
+    for line in payload.splitlines():
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        device = {"serial": parts[0], "state": parts[1]}
+        for field in parts[2:]:
+            key, sep, value = field.partition(":")
+            if sep:
+                device[key] = value
+        devices.append(device)
+    return devices
+
+
+class AdbClient:
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, pool_size=2, timeout=10):
+        """
+        The adb server closes a connection once a service has been served, so the
+        pool keeps already-connected, unused sockets ready for the next request.
+        """
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []
+        self._lock = threading.Lock()
+
+    # --- Connections ---
+
+    def _new_socket(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _connect(self):
+        """Returns a connected socket, taken from the pool when possible."""
+        while True:
+            with self._lock:
+                sock = self._pool.pop() if self._pool else None
+            if sock is None:
+                return self._new_socket()
+            # An idle socket that is readable has been closed by the server.
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                sock.settimeout(self.timeout)
+                return sock
+            sock.close()
+
+    def _refill(self):
+        with self._lock:
+            missing = self.pool_size - len(self._pool)
+        for _ in range(missing):
+            try:
+                sock = self._new_socket()
+            except OSError:
+                return
+            with self._lock:
+                if len(self._pool) >= self.pool_size:
+                    sock.close()
+                    return
+                self._pool.append(sock)
+
+    def close(self):
+        """Closes the pooled connections."""
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for sock in pool:
+            sock.close()
+
+    def _transport(self, serial=None, host=False):
+        """
+        Returns a connected socket, switched to the device transport unless host is set.
+        Connection errors up to that point raise AdbUnavailable.
+        """
+        try:
+            sock = self._connect()
+        except OSError as e:
+            raise AdbUnavailable(str(e)) from e
+        if host:
+            return sock
+        try:
+            send_request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+        except OSError as e:
+            sock.close()
+            raise AdbUnavailable(str(e)) from e
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def open_service(self, request, serial=None):
+        """
+        Opens a connection to a host service (serial None and request 'host:...')
+        or to a device service, after switching to the device transport.
+        The caller owns the returned socket.
+        """
+        sock = self._transport(serial, host=request.startswith("host:"))
+        try:
+            send_request(sock, request)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _query(self, request):
+        """Runs a host service that answers with one length-prefixed message."""
+        sock = self.open_service(request)
+        try:
+            return read_message(sock)
+        finally:
+            sock.close()
+            self._refill()
+
+    def _device_service(self, request, serial=None):
+        """Runs a device service and returns everything it writes until it closes."""
+        sock = self.open_service(request, serial)
+        try:
+            return recv_all(sock).decode("utf-8", "replace")
+        finally:
+            sock.close()
+            self._refill()
+
+    # --- Services ---
+
+    def version(self):
+        """Returns the adb server protocol version."""
+        return int(self._query("host:version"), 16)
+
+    def devices(self):
+        """Returns the connected devices as dictionaries (host:devices-l)."""
+        return parse_devices_long(self._query("host:devices-l"))
+
+    def shell(self, command, serial=None):
+        """Runs a shell command on the device and returns its output (stdout and stderr merged)."""
+        return self._device_service("shell:" + command, serial)
+
+    def shell_v2(self, command, serial=None):
+        """
+        Runs a shell command through the shell protocol v2, which keeps stdout and stderr
+        apart and reports the exit status. Returns (exit status, stdout, stderr).
+        Raises ShellProtocolUnsupported if the device only speaks 'shell:'.
+        """
+        sock = self._transport(serial)
+        try:
+            try:
+                send_request(sock, "shell,v2,raw:" + command)
+            except AdbError as e:
+                raise ShellProtocolUnsupported(str(e))
+            status, stdout, stderr = read_shell_packets(sock)
+        finally:
+            sock.close()
+            self._refill()
+        return status, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+
+    def reboot(self, target="", serial=None):
+        """Reboots the device, optionally into 'bootloader', 'recovery', 'sideload', 'fastboot'..."""
+        self._device_service("reboot:" + target, serial)
+
+    # --- subprocess.run compatibility ---
+
+    def run(self, args, timeout=10):
+        """
+        Drop-in replacement for subprocess.run(args, capture_output=True, text=True, timeout=...)
+        for ADB command lines. 'devices', 'reboot' and 'shell' (shell v2, with the remote
+        exit status) are served in-process; anything else (or an unreachable server, or a
+        device without shell v2) falls back to the adb binary. Once a request has been sent,
+        errors are reported, never retried through the binary: the device may already have
+        run it. Commands to the same device are serialized (see device_lanes).
+        """
+        return default_lanes.run(args, lambda: self._measured_run(args, timeout))
+
+    def _measured_run(self, args, timeout):
+        with tracer.command(args) as span, metrics.command(args) as measure:
+            result = self._run(args, timeout)
+            span.set(exit_code=result.returncode)
+            measure.done(result.returncode)
+        return result
+
+    def _run(self, args, timeout):
+        argv = list(args)
+        if argv and os.path.basename(argv[0]).lower() in ("adb", "adb.exe"):
+            argv = argv[1:]
+        serial = None
+        if len(argv) >= 2 and argv[0] == "-s":
+            serial, argv = argv[1], argv[2:]
+        try:
+            if argv in (["devices"], ["devices", "-l"]):
+                lines = ["List of devices attached"]
+                for device in self.devices():
+                    if argv == ["devices"]:
+                        lines.append(f"{device['serial']}\t{device['state']}")
+                    else:
+                        extra = " ".join(f"{k}:{v}" for k, v in device.items() if k not in ("serial", "state"))
+                        lines.append(f"{device['serial']:<22} {device['state']} {extra}".rstrip())
+                return subprocess.CompletedProcess(args, 0, "\n".join(lines) + "\n\n", "")
+            if argv and argv[0] == "reboot" and len(argv) <= 2:
+                self.reboot(argv[1] if len(argv) == 2 else "", serial)
+                return subprocess.CompletedProcess(args, 0, "", "")
+            if len(argv) >= 2 and argv[0] == "shell":
+                status, stdout, stderr = self.shell_v2(" ".join(argv[1:]), serial)
+                return subprocess.CompletedProcess(args, status, stdout, stderr)
+        except ShellProtocolUnsupported as e:
+            # Without shell v2 there is no exit status: the adb binary reports it.
+            logging.info("shell v2 not supported (%s), falling back to the adb binary.", e)
+        except AdbUnavailable as e:
+            # Server not running: the adb binary starts it for us.
+            logging.info("adb server not reachable (%s), falling back to the adb binary.", e)
+        except (AdbError, OSError) as e:
+            return subprocess.CompletedProcess(args, 1, "", f"adb: error: {e}\n")
+        return job_executor.run(tool_registry.argv(args), timeout)
+
+
+# Shared client used by the front-ends.
+default_client = AdbClient()
+
+
+def run(args, timeout=10):
+    """Runs an ADB command line through the shared client (see AdbClient.run)."""
+    return default_client.run(args, timeout=timeout)
@@ -0,0 +1,266 @@
+#This module contains ArtifactCache, a content-addressed store for downloaded and
+#imported artifacts (platform-tools zips, firmware archives) and their extracted
+#trees. Objects are keyed by sha256 and inserted atomically; a JSON index keeps
+#their metadata, URL aliases and file fingerprints, and the least recently used
+#objects are evicted once the size bound is exceeded.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import logging
+import zipfile
+from pathlib import Path
+
+from checksum import MultiDigest
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+INDEX_NAME = "index.json"
+COMPLETE_MARKER = ".complete"
+
+
+def default_cache_dir():
+    """FASTBOOTGUI_CACHE, else %LOCALAPPDATA%\\FastbootGui\\cache or ~/.cache/fastbootgui."""
+    if os.environ.get("FASTBOOTGUI_CACHE"):
+        return Path(os.environ["FASTBOOTGUI_CACHE"])
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return Path(os.environ["LOCALAPPDATA"]) / "FastbootGui" / "cache"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "fastbootgui"
+
+
+def file_sha256(path):
+    digest = MultiDigest(("sha256",))
+    with open(path, "rb") as f:
+        digest.update_from_file(f)
+    return digest.hexdigests()["sha256"]
+
+
+def zip_member_sha256(path, member):
+    """sha256 of the decompressed content of a zip member."""
+    digest = MultiDigest(("sha256",))
+    with zipfile.ZipFile(path) as zip_ref, zip_ref.open(member) as f:
+        digest.update_from_file(f)
+    return digest.hexdigests()["sha256"]
+
+
+def tree_size(path):
+    total = 0
+    for root_dir, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root_dir, name))
+            except OSError:
+                pass
+    return total
+
+
+class ArtifactCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        """Nothing is read or created on disk before the first use."""
+        self.root = Path(root) if root else default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._index = None
+        self._hashing = {}  # fingerprint key -> lock held while it is computed
+
+    # --- Index ---
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        for sub in ("objects", "trees", "tmp"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        try:
+            self._index = json.loads((self.root / INDEX_NAME).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self._index = {}
+        except ValueError as e:
+            logging.warning("Artifact cache index unreadable, starting empty: %s", e)
+            self._index = {}
+        for key in ("files", "trees", "aliases", "fingerprints"):
+            self._index.setdefault(key, {})
+        return self._index
+
+    def _save(self):
+        path = self.root / INDEX_NAME
+        fd, tmp = tempfile.mkstemp(dir=self.root / "tmp", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp, path)
+
+    def object_path(self, sha256):
+        return self.root / "objects" / sha256[:2] / sha256
+
+    def tree_path(self, sha256):
+        return self.root / "trees" / sha256
+
+    def _touch(self, entry):
+        entry["last_used"] = time.time()
+
+    # --- Files ---
+
+    def lookup(self, sha256):
+        """Returns the cached file with this sha256, or None."""
+        if not sha256:
+            return None
+        with self._lock:
+            index = self._load()
+            entry = index["files"].get(sha256.lower())
+            path = self.object_path(sha256.lower())
+            if entry is None or not path.is_file():
+                if entry is not None:
+                    del index["files"][sha256.lower()]
+                    self._save()
+                return None
+            self._touch(entry)
+            self._save()
+            return path
+
+    def lookup_alias(self, key, validator=None):
+        """
+        Returns (path, sha256) for a key recorded by insert_file(alias=...), e.g. a URL,
+        provided its validator (size, ETag...) is unchanged; (None, None) otherwise.
+        """
+        with self._lock:
+            alias = self._load()["aliases"].get(key)
+        if not alias or (validator is not None and alias.get("validator") != validator):
+            return None, None
+        path = self.lookup(alias["sha256"])
+        return (path, alias["sha256"]) if path else (None, None)
+
+    def insert_file(self, path, sha256=None, name=None, source=None, alias=None, validator=None, move=False):
+        """
+        Stores a copy of the file (or moves it) under its sha256 and returns the cached path.
+        The copy goes to a temporary name first, so a crash never leaves a partial object.
+        """
+        path = Path(path)
+        sha256 = (sha256 or file_sha256(path)).lower()
+        final = self.object_path(sha256)
+        with self._lock:
+            index = self._load()
+            if not final.is_file():
+                final.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=self.root / "tmp")
+                os.close(fd)
+                try:
+                    if move:
+                        shutil.move(str(path), tmp)
+                    else:
+                        shutil.copyfile(path, tmp)
+                    os.replace(tmp, final)
+                except BaseException:
+                    Path(tmp).unlink(missing_ok=True)
+                    raise
+            elif move:
+                path.unlink()
+            entry = index["files"].setdefault(sha256, {"added": time.time()})
+            entry.update(size=final.stat().st_size, name=name or path.name, source=source)
+            self._touch(entry)
+            if alias:
+                index["aliases"][alias] = {"sha256": sha256, "validator": validator}
+            self._evict(keep=("files", sha256))
+            self._save()
+        return final
+
+    def fingerprint_sha256(self, path, member=None):
+        """
+        sha256 of a local file, or of the decompressed member of a zip file, remembered
+        by the (size, mtime) of the file so that importing the same firmware again does
+        not hash it again. Concurrent callers for the same file wait for one hash.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = str(path) if member is None else "%s!%s" % (path, member)
+        with self._lock:
+            known = self._load()["fingerprints"].get(key)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                return known[2]
+            pending = self._hashing.setdefault(key, threading.Lock())
+        with pending:
+            with self._lock:
+                known = self._load()["fingerprints"].get(key)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                return known[2]
+            try:
+                sha256 = file_sha256(path) if member is None else zip_member_sha256(path, member)
+                with self._lock:
+                    self._load()["fingerprints"][key] = [stat.st_size, stat.st_mtime_ns, sha256]
+                    self._save()
+            finally:
+                with self._lock:
+                    self._hashing.pop(key, None)
+        return sha256
+
+    # --- Extracted trees ---
+
+    def extracted(self, sha256, extract_fn, name=None):
+        """
+        Returns the directory holding the extraction of artifact 'sha256'. On a miss,
+        extract_fn(directory) fills a temporary directory (returning False to abort),
+        which is then renamed into place.
+        """
+        sha256 = sha256.lower()
+        final = self.tree_path(sha256)
+        with self._lock:
+            index = self._load()
+            entry = index["trees"].get(sha256)
+            if entry is not None and (final / COMPLETE_MARKER).exists():
+                self._touch(entry)
+                self._save()
+                return final
+        tmp = Path(tempfile.mkdtemp(dir=self.root / "tmp"))
+        try:
+            if extract_fn(tmp) is False:
+                return None
+            (tmp / COMPLETE_MARKER).touch()
+            with self._lock:
+                if final.exists():
+                    shutil.rmtree(final, ignore_errors=True)
+                os.replace(tmp, final)
+                entry = index["trees"].setdefault(sha256, {"added": time.time()})
+                entry.update(size=tree_size(final), name=name)
+                self._touch(entry)
+                self._evict(keep=("trees", sha256))
+                self._save()
+            return final
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    # --- Eviction ---
+
+    def total_size(self):
+        with self._lock:
+            index = self._load()
+            return sum(entry.get("size", 0) for kind in ("files", "trees") for entry in index[kind].values())
+
+    def _evict(self, keep=None):
+        """Removes the least recently used objects until the cache fits in max_bytes."""
+        index = self._index
+        candidates = sorted(((entry.get("last_used", 0), kind, sha256)
+                             for kind in ("files", "trees") for sha256, entry in index[kind].items()
+                             if (kind, sha256) != keep))
+        total = self.total_size()
+        for last_used, kind, sha256 in candidates:
+            if total <= self.max_bytes:
+                break
+            entry = index[kind].pop(sha256)
+            total -= entry.get("size", 0)
+            if kind == "files":
+                self.object_path(sha256).unlink(missing_ok=True)
+                for key in [k for k, alias in index["aliases"].items() if alias["sha256"] == sha256]:
+                    del index["aliases"][key]
+            else:
+                shutil.rmtree(self.tree_path(sha256), ignore_errors=True)
+            logging.info("Artifact cache: evicted %s %s (%s)", kind[:-1], sha256[:12], entry.get("name"))
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._index = None
+
+
+# Shared cache used by the front-ends.
+default_cache = ArtifactCache()
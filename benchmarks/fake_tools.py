@@ -0,0 +1,200 @@
+#This module contains stand-in adb and fastboot executables for the benchmarks. They
+#answer the commands the front-ends send with the same output layout as platform-tools,
+#and their cost is set from the environment:
+#   FAKE_TOOL_LATENCY      seconds added to every invocation (USB round trips...)
+#   FAKE_TOOL_THROUGHPUT   bytes per second for flash and sideload (0: as fast as the disk)
+#   FAKE_ADB_DEVICES       comma-separated serials listed by 'adb devices'
+#   FAKE_FASTBOOT_DEVICES  comma-separated serials listed by 'fastboot devices'
+#install(directory) writes 'adb' and 'fastboot' launchers (.cmd on Windows) there.
+
+import os
+import sys
+import time
+
+READ_BUFFER = 1024 * 1024
+VERSION = "35.0.2-12147458"
+
+ADB_HELP = """Android Debug Bridge version 1.0.41
+global options:
+ -a                       listen on all network interfaces, not just localhost
+ -s SERIAL                use device with given serial
+networking:
+ connect HOST[:PORT]      connect to a device via TCP/IP
+ pair HOST[:PORT] [PAIRING CODE]
+ mdns check               check if mdns discovery is available
+app installation:
+ install [-lrtsdg] [--instant] [--incremental] PACKAGE
+scripting:
+ reboot [bootloader|recovery|sideload|sideload-auto-reboot]
+ sideload OTAPACKAGE      sideload the given full OTA package
+"""
+
+FASTBOOT_HELP = """usage: fastboot [OPTION...] COMMAND...
+flashing:
+ flash PARTITION [FILENAME]   Flash given partition, using the image from FILENAME.
+ flashing lock|unlock         Lock/unlock partitions for flashing
+ snapshot-update cancel       On devices that support snapshot-based updates...
+basics:
+ devices [-l]                 List devices in bootloader (-l: with device paths).
+ getvar NAME                  Display given bootloader variable.
+ reboot [bootloader|fastboot] Reboot device.
+options:
+ --slot SLOT                  Use SLOT; 'all' for both slots, 'other' for non-current slot.
+"""
+
+GETVAR_ALL = {
+    "product": "bench",
+    "current-slot": "a",
+    "slot-count": "2",
+    "is-userspace": "no",
+    "unlocked": "yes",
+    "max-download-size": "0x10000000",
+    "partition-size:boot_a": "0x4000000",
+    "partition-type:boot_a": "raw",
+    "has-slot:boot": "yes",
+}
+
+
+def _env_float(name, default=0.0):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _serials(name):
+    return [s for s in os.environ.get(name, "").split(",") if s]
+
+
+def _transfer(path):
+    """Reads the file and takes as long as the configured throughput would. Returns its size."""
+    throughput = _env_float("FAKE_TOOL_THROUGHPUT")
+    start = time.perf_counter()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_BUFFER)
+            if not chunk:
+                break
+            size += len(chunk)
+    if throughput > 0:
+        remaining = size / throughput - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+    return size
+
+
+def _strip_options(args):
+    serial = None
+    rest = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "-s" and args:
+            serial = args.pop(0)
+        elif arg in ("-a", "-b", "-d", "-e", "-l") and not rest:
+            continue
+        else:
+            rest.append(arg)
+    return serial, rest
+
+
+def adb(args):
+    serial, rest = _strip_options(args)
+    command = rest[0] if rest else "help"
+    if command == "version":
+        print("Android Debug Bridge version 1.0.41\nVersion %s\nInstalled as %s" % (VERSION, sys.argv[0]))
+    elif command in ("help", "--help"):
+        print(ADB_HELP)
+    elif command == "devices":
+        print("List of devices attached")
+        for device in _serials("FAKE_ADB_DEVICES"):
+            print("%s\tdevice" % device)
+        print()
+    elif command in ("start-server", "kill-server", "reboot", "wait-for-device"):
+        pass
+    elif command == "shell":
+        print(" ".join(rest[1:]))
+    elif command == "sideload" and len(rest) == 2:
+        size = _transfer(rest[1])
+        sys.stdout.write("serving: '%s'  (~100%%)    \n" % os.path.basename(rest[1]))
+        sys.stdout.write("Total xfer: %.2fx\n" % (1.0 if size else 0.0))
+    else:
+        sys.stderr.write("adb: unknown command %s\n" % command)
+        return 1
+    return 0
+
+
+def fastboot(args):
+    slot = None
+    if "--slot" in args:
+        index = args.index("--slot")
+        slot = args[index + 1] if index + 1 < len(args) else None
+        args = args[:index] + args[index + 2:]
+    serial, rest = _strip_options(args)
+    command = rest[0] if rest else "--help"
+    if command == "--version":
+        print("fastboot version %s\nInstalled as %s" % (VERSION, sys.argv[0]))
+    elif command in ("--help", "help"):
+        print(FASTBOOT_HELP)
+    elif command == "devices":
+        for device in _serials("FAKE_FASTBOOT_DEVICES"):
+            print("%s\tfastboot" % device)
+    elif command == "getvar" and len(rest) == 2:
+        if rest[1] == "all":
+            for name, value in GETVAR_ALL.items():
+                sys.stderr.write("(bootloader) %s: %s\n" % (name, value))
+            sys.stderr.write("all: \n")
+        elif rest[1] in GETVAR_ALL:
+            sys.stderr.write("%s: %s\n" % (rest[1], GETVAR_ALL[rest[1]]))
+        else:
+            sys.stderr.write("getvar:%s FAILED (remote: 'GetVar Variable Not found')\n" % rest[1])
+            return 1
+        sys.stderr.write("Finished. Total time: 0.001s\n")
+    elif command == "flash" and len(rest) == 3:
+        partition = rest[1] + ("_" + slot if slot and slot not in ("all", "other") else "")
+        start = time.perf_counter()
+        size = _transfer(rest[2])
+        sent = time.perf_counter() - start
+        sys.stderr.write("Sending '%s' (%d KB)%sOKAY [%7.3fs]\n" % (partition, size // 1024, " " * 8, sent))
+        sys.stderr.write("Writing '%s'%sOKAY [  0.001s]\n" % (partition, " " * 8))
+        sys.stderr.write("Finished. Total time: %.3fs\n" % (time.perf_counter() - start))
+    elif command in ("erase", "format") and len(rest) == 2:
+        sys.stderr.write("Erasing '%s'%sOKAY [  0.001s]\nFinished. Total time: 0.001s\n" % (rest[1], " " * 8))
+    elif command in ("reboot", "reboot-bootloader", "set_active", "--set-active", "flashing", "continue"):
+        sys.stderr.write("Rebooting%sOKAY [  0.001s]\nFinished. Total time: 0.001s\n" % (" " * 8)
+                         if command.startswith("reboot") else "Finished. Total time: 0.001s\n")
+    else:
+        sys.stderr.write("fastboot: usage: unknown command %s\n" % command)
+        return 1
+    return 0
+
+
+def main(tool, args):
+    latency = _env_float("FAKE_TOOL_LATENCY")
+    if latency > 0:
+        time.sleep(latency)
+    return adb(args) if tool == "adb" else fastboot(args)
+
+
+def install(directory):
+    """Writes adb/fastboot launchers running this module into directory. Returns directory."""
+    os.makedirs(directory, exist_ok=True)
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    for tool in ("adb", "fastboot"):
+        if os.name == "nt":
+            path = os.path.join(directory, tool + ".cmd")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('@"%s" -S "%s" %s %%*\r\n' % (sys.executable, os.path.abspath(__file__), tool))
+        else:
+            path = os.path.join(directory, tool)
+            with open(path, "w", encoding="utf-8") as f:
+                # -S: no site import, the stand-ins only need the standard library.
+                f.write("#!%s -S\nimport sys\nsys.path.insert(0, %r)\nimport fake_tools\n"
+                        "sys.exit(fake_tools.main(%r, sys.argv[1:]))\n" % (sys.executable, module_dir, tool))
+            os.chmod(path, 0o755)
+    return directory
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,162 @@
+#This module contains the fixtures of the benchmarks: generated data files and zips, a
+#local HTTP server with Range support (optionally throttled), and loaders for the two
+#front-ends, whose GUI toolkit may not be installed on a bench host.
+
+import os
+import re
+import sys
+import time
+import zipfile
+import logging
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 1024 * 1024
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def make_file(path, size, compressible=False):
+    """Writes 'size' bytes: random data, or a repeated pattern that compresses well."""
+    block = (b"fastbootgui-bench-" * (CHUNK // 18 + 1))[:CHUNK] if compressible else None
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            count = min(CHUNK, size - written)
+            f.write(block[:count] if compressible else os.urandom(count))
+            written += count
+    return path
+
+
+def make_zip(path, members, member_size):
+    """A zip of 'members' .img files, alternating random and compressible contents."""
+    directory = os.path.dirname(path)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zip_ref:
+        for index in range(members):
+            source = make_file(os.path.join(directory, "member.tmp"), member_size, compressible=index % 2 == 1)
+            zip_ref.write(source, "images/part%02d.img" % index)
+            os.remove(source)
+    return path
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head):
+        path = self.server.files.get(self.path.split("?", 1)[0])
+        if path is None:
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = RANGE_RE.match(self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"%d-%d"' % (size, int(os.path.getmtime(path))))
+        self.end_headers()
+        if head:
+            return
+        throughput = self.server.throughput
+        begin = time.perf_counter()
+        sent = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                sent += len(chunk)
+                if throughput:
+                    delay = sent / throughput - (time.perf_counter() - begin)
+                    if delay > 0:
+                        time.sleep(delay)
+
+
+class FileServer:
+    def __init__(self, throughput=0):
+        """Serves registered files on 127.0.0.1; throughput (bytes/s per connection) 0 = unthrottled."""
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files = {}
+        self.httpd.throughput = throughput
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add(self, name, path):
+        self.httpd.files["/" + name] = path
+        return "http://127.0.0.1:%d/%s" % (self.httpd.server_address[1], name)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def load_v02():
+    """Imports FastbootGuiV0.2.py, or returns (None, reason) if Kivy is not available."""
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    handlers = list(logging.getLogger().handlers)
+    try:
+        spec = importlib.util.spec_from_file_location("FastbootGuiV02", os.path.join(REPO_DIR, "FastbootGuiV0.2.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        return None, "FastbootGuiV0.2 not importable: %s" % e
+    finally:
+        # The front-end logs to stdout at import; the benchmarks keep their own handlers.
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if handler not in handlers:
+                root.removeHandler(handler)
+                handler.close()
+    return module, None
+
+
+def load_mini():
+    """Imports FastbootGuiMini.py, or returns (None, reason) if tkinter is not available."""
+    try:
+        import FastbootGuiMini
+    except ImportError as e:
+        return None, "FastbootGuiMini not importable: %s" % e
+    return FastbootGuiMini, None
+
+
+def tk_root():
+    """A hidden Tk root, or (None, reason) on a host without a display."""
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception as e:
+        return None, "no Tk display: %s" % str(e).splitlines()[0]
+    root.withdraw()
+    return root, None
+
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
@@ -0,0 +1,459 @@
+#This module runs the benchmark suite: it times the hot paths of the front-ends against
+#the stand-in adb/fastboot of fake_tools.py and a local HTTP server, and saves the
+#results as JSON so that two runs (e.g. two releases) can be compared.
+#
+#   python benchmarks/run.py                              all benchmarks
+#   python benchmarks/run.py --only hash,extract -r 10    a subset, 10 runs each
+#   python benchmarks/run.py --compare benchmarks/results/previous.json
+#
+#Benchmarks needing a front-end whose toolkit is missing (Kivy, a Tk display) are
+#recorded as skipped. Repository caches (artifacts, ledger, tool registry) are redirected
+#to the temporary work directory, so a run never touches the user's ones.
+
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+
+import fake_tools
+import fixtures
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MB = 1024 * 1024
+FLASH_TIMEOUT = 600  # seconds before an end-to-end flash run is considered stuck
+
+BENCHMARKS = []
+
+
+class Skip(Exception):
+    pass
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return register
+
+
+class Case:
+    def __init__(self, run, setup=None, target=None, bytes=None, items=None, repeat=None):
+        """
+        One timed case: run(state) is timed, setup() (untimed) prepares its state before
+        every run. bytes/items give a throughput figure; target names the code measured.
+        """
+        self.run = run
+        self.setup = setup
+        self.target = target
+        self.bytes = bytes
+        self.items = items
+        self.repeat = repeat
+
+
+def measure(case, repeat):
+    times = []
+    for _ in range(case.repeat or repeat):
+        state = case.setup() if case.setup else None
+        start = time.perf_counter()
+        case.run(state)
+        times.append(time.perf_counter() - start)
+    result = {"runs": len(times), "min": min(times), "median": statistics.median(times),
+              "mean": statistics.fmean(times), "stdev": statistics.stdev(times) if len(times) > 1 else 0.0}
+    if case.target:
+        result["target"] = case.target
+    if case.bytes:
+        result["mb_per_s"] = case.bytes / MB / result["median"]
+    if case.items:
+        result["items_per_s"] = case.items / result["median"]
+    return result
+
+
+# --- Device status ---
+
+@benchmark("device_status")
+def bench_device_status(ctx):
+    from device_watcher import DeviceWatcher, DeviceEvent
+    cases = {}
+    watcher = DeviceWatcher(fastboot="fastboot")
+    cases["fastboot_poll"] = Case(lambda state: watcher._poll_fastboot(), target="DeviceWatcher._poll_fastboot")
+    if ctx.v02:
+        ui = v02_shim(ctx)
+
+        def fill():
+            for index in range(100):
+                ui.device_watcher.events.put(DeviceEvent("BENCH%03d" % index, "adb", "device", None))
+        cases["update_idle"] = Case(lambda state: ui.update_device_status(0), target="ADBInstaller.update_device_status")
+        cases["update_100_events"] = Case(lambda state: ui.update_device_status(0), setup=fill, items=100,
+                                          target="ADBInstaller.update_device_status")
+    else:
+        cases["update_device_status"] = ctx.v02_missing
+    return cases
+
+
+# --- Tool discovery ---
+
+@benchmark("tool_check")
+def bench_tool_check(ctx):
+    from tool_registry import ToolRegistry
+    store = os.path.join(ctx.work, "tools-bench.json")
+
+    def cold():
+        if os.path.exists(store):
+            os.remove(store)
+        return ToolRegistry(store)
+
+    def warm():
+        registry = ToolRegistry(store)
+        registry.info("adb")
+        registry.info("fastboot")
+        return ToolRegistry(store)
+
+    def check(registry):
+        assert registry.info("adb") and registry.info("fastboot")
+
+    cases = {"registry_cold": Case(check, setup=cold, target="ToolRegistry.info"),
+             "registry_warm": Case(check, setup=warm, target="ToolRegistry.info")}
+    if ctx.v02:
+        ui = v02_shim(ctx)
+        cases["check_adb_fastboot"] = Case(lambda state: ui.check_adb_fastboot(),
+                                           target="ADBInstaller.check_adb_fastboot")
+    else:
+        cases["check_adb_fastboot"] = ctx.v02_missing
+    return cases
+
+
+# --- Hashing, extraction, download ---
+
+@benchmark("hash")
+def bench_hash(ctx):
+    import checksum
+    path = ctx.data_file()
+    size = os.path.getsize(path)
+    if ctx.v02:
+        sha256 = Case(lambda state: ctx.v02.calculate_file_hash(path), bytes=size, target="calculate_file_hash")
+    else:
+        sha256 = Case(lambda state: checksum.file_digests(path, ("sha256",)), bytes=size,
+                      target="checksum.file_digests (calculate_file_hash needs Kivy)")
+    return {"sha256": sha256,
+            "sha256_sha1_md5": Case(lambda state: checksum.file_digests(path, checksum.ALGORITHMS), bytes=size,
+                                    target="checksum.file_digests")}
+
+
+@benchmark("extract")
+def bench_extract(ctx):
+    import zip_extract
+    zip_path = ctx.zip_file()
+    size = sum(info.file_size for info in __import__("zipfile").ZipFile(zip_path).infolist())
+    target_dir = os.path.join(ctx.work, "extract")
+    if ctx.v02:
+        extract, target = ctx.v02.extract_zip, "extract_zip"
+    else:
+        extract, target = zip_extract.extract_all, "zip_extract.extract_all (extract_zip needs Kivy)"
+
+    def fresh():
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+    def extracted():
+        if not os.path.isdir(target_dir):
+            extract(zip_path, target_dir)
+    return {"cold": Case(lambda state: extract(zip_path, target_dir), setup=fresh, bytes=size, target=target),
+            "up_to_date": Case(lambda state: extract(zip_path, target_dir), setup=extracted, bytes=size, target=target)}
+
+
+@benchmark("download")
+def bench_download(ctx):
+    import downloader
+    url = ctx.server.add("platform-tools.zip", ctx.data_file())
+    size = os.path.getsize(ctx.data_file())
+    destination = os.path.join(ctx.work, "download.bin")
+
+    def fresh():
+        for path in (destination, str(downloader.state_path(destination))):
+            if os.path.exists(path):
+                os.remove(path)
+
+    if ctx.v02:
+        segmented = Case(lambda state: ctx.v02.download_file(url, destination), setup=fresh, bytes=size,
+                         target="download_file")
+    else:
+        segmented = Case(lambda state: downloader.download(url, destination), setup=fresh, bytes=size,
+                         target="downloader.download (download_file needs Kivy)")
+    return {"segmented": segmented,
+            "single_stream": Case(lambda state: downloader.download(url, destination, segments=1), setup=fresh,
+                                  bytes=size, target="downloader.download(segments=1)")}
+
+
+# --- Log ingestion ---
+
+@benchmark("log")
+def bench_log(ctx):
+    count = ctx.args.log_lines
+    messages = ["[BENCH] (%d/%d) flash boot_a OKAY [  0.041s]" % (i, count) for i in range(count)]
+    cases = {}
+    if ctx.mini:
+        shim = types.SimpleNamespace(log_queue=None)
+        log = ctx.mini.FastbootFlashTool.log
+
+        def fresh_queue():
+            shim.log_queue = ctx.mini.LogQueue()
+
+        def ingest(state):
+            for message in messages:
+                log(shim, message)
+            while len(shim.log_queue):
+                shim.log_queue.drain(ctx.mini.LOG_BATCH_MAX)
+        cases["mini_log"] = Case(ingest, setup=fresh_queue, items=count, target="FastbootFlashTool.log + drain")
+    else:
+        cases["mini_log"] = ctx.mini_missing
+    if ctx.v02:
+        ui = v02_shim(ctx)
+
+        def ingest_v02(state):
+            for message in messages:
+                ui.log_message(message)
+        cases["v02_log_message"] = Case(ingest_v02, items=count, target="ADBInstaller.log_message")
+    else:
+        cases["v02_log_message"] = ctx.v02_missing
+    return cases
+
+
+# --- Flash ---
+
+@benchmark("flash")
+def bench_flash(ctx):
+    from command_runner import run_fastboot_streaming
+    from flash_scheduler import FlashJob, FlashScheduler, list_fastboot_serials
+    images = ctx.image_files()
+    size = sum(os.path.getsize(path) for path in images)
+    serials = list_fastboot_serials()
+    if not serials:
+        raise Skip("the stand-in fastboot lists no device")
+
+    def engine(state):
+        job = FlashJob("bench", stop_on_error=True)
+        for path in images:
+            job.add("flash", os.path.splitext(os.path.basename(path))[0], path)
+        results = FlashScheduler(max_parallel=len(serials), runner=run_fastboot_streaming).run(job, serials)
+        assert all(result.ok for result in results.values()), results
+    cases = {"engine": Case(engine, bytes=size * len(serials), target="FlashScheduler + run_fastboot_streaming")}
+    if not ctx.mini:
+        cases["flash_firmware"] = ctx.mini_missing
+        return cases
+    root, reason = fixtures.tk_root()
+    if root is None:
+        cases["flash_firmware"] = reason
+        return cases
+    app = ctx.mini.FastbootFlashTool(root)
+    app.firmware_files = list(images)
+    done = threading.Event()
+    log = app.log
+
+    def watch_log(message):
+        log(message)
+        if message.startswith("Processus de flash firmware termin"):
+            done.set()
+    app.log = watch_log
+
+    def gui_flash(state):
+        done.clear()
+        deadline = time.monotonic() + FLASH_TIMEOUT
+        app.flash_firmware()
+
+        def poll():
+            if done.is_set() or time.monotonic() > deadline:
+                root.quit()
+            else:
+                root.after(5, poll)
+        root.after(5, poll)
+        root.mainloop()
+        if not done.is_set():
+            raise RuntimeError("flash_firmware did not finish within %ds" % FLASH_TIMEOUT)
+    cases["flash_firmware"] = Case(gui_flash, bytes=size * len(serials), target="FastbootFlashTool.flash_firmware")
+    ctx.cleanups.append(root.destroy)
+    return cases
+
+
+# --- Front-end stand-ins ---
+
+def v02_shim(ctx):
+    """
+    An object exposing the real ADBInstaller methods without building the Kivy widgets:
+    the log store, device watcher and status label are the only state they use.
+    """
+    from log_store import LogStore
+    from device_watcher import DeviceWatcher
+    cls = ctx.v02.ADBInstaller
+    ui = types.SimpleNamespace(language="en", translations={"en": {}}, log_store=LogStore(ctx.v02.LOG_MAX_LINES),
+                               refresh_log_view=lambda *args: None, device_watcher=DeviceWatcher(),
+                               device_status_label=types.SimpleNamespace(text=""))
+    for name in ("tr", "log_message", "update_device_status", "refresh_device_status_label", "check_adb_fastboot"):
+        setattr(ui, name, types.MethodType(getattr(cls, name), ui))
+    return ui
+
+
+class Context:
+    def __init__(self, args, work):
+        self.args = args
+        self.work = work
+        self.server = None
+        self.v02, self.v02_missing = fixtures.load_v02() if not args.no_gui else (None, "--no-gui")
+        self.mini, self.mini_missing = fixtures.load_mini() if not args.no_gui else (None, "--no-gui")
+        self.cleanups = []
+        self._files = {}
+
+    def _cached(self, key, make):
+        if key not in self._files:
+            self._files[key] = make()
+        return self._files[key]
+
+    def data_file(self):
+        return self._cached("data", lambda: fixtures.make_file(os.path.join(self.work, "data.bin"),
+                                                                self.args.size_mb * MB))
+
+    def zip_file(self):
+        return self._cached("zip", lambda: fixtures.make_zip(os.path.join(self.work, "bench.zip"), 16,
+                                                              max(1, self.args.size_mb // 16) * MB))
+
+    def image_files(self):
+        def make():
+            directory = os.path.join(self.work, "images")
+            os.makedirs(directory, exist_ok=True)
+            return [fixtures.make_file(os.path.join(directory, name + ".img"), max(1, self.args.size_mb // 8) * MB)
+                    for name in ("boot", "vendor_boot", "dtbo", "vbmeta")]
+        return self._cached("images", make)
+
+
+def prepare_environment(args, work):
+    """Puts the stand-in tools first on PATH and redirects the repository caches."""
+    bin_dir = fake_tools.install(os.path.join(work, "bin"))
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_TOOL_LATENCY"] = str(args.latency)
+    os.environ["FAKE_TOOL_THROUGHPUT"] = str(args.throughput * MB)
+    os.environ["FAKE_ADB_DEVICES"] = ",".join("ADB%03d" % i for i in range(args.devices))
+    os.environ["FAKE_FASTBOOT_DEVICES"] = ",".join("FB%03d" % i for i in range(args.devices))
+    os.environ["FASTBOOTGUI_CACHE"] = os.path.join(work, "cache")
+    os.environ["FASTBOOTGUI_LEDGER"] = os.path.join(work, "ledger.json")
+    os.environ["FASTBOOTGUI_TOOLS"] = os.path.join(work, "tools.json")
+    # Nothing should talk to a real adb server during the benchmarks.
+    os.environ["ANDROID_ADB_SERVER_PORT"] = "1"
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=fixtures.REPO_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, previous_path, threshold):
+    """Prints the median change of every case also in the previous results. Returns the regressions."""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)["results"]
+    regressions = []
+    print("\n%-36s %12s %12s %9s" % ("case", "previous", "current", "change"))
+    for name, result in results.items():
+        old = previous.get(name)
+        if "median" not in result or not old or "median" not in old:
+            continue
+        change = result["median"] / old["median"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print("%-36s %10.2fms %10.2fms %+8.1f%%%s" % (name, old["median"] * 1000, result["median"] * 1000,
+                                                    change * 100, flag))
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FastbootGui benchmark suite.")
+    parser.add_argument("--only", help="comma-separated benchmarks (%s)" % ", ".join(name for name, _ in BENCHMARKS))
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per case")
+    parser.add_argument("--size-mb", type=int, default=64, help="size of the hashed/downloaded/extracted data")
+    parser.add_argument("--log-lines", type=int, default=20000, help="messages per log ingestion run")
+    parser.add_argument("--devices", type=int, default=2, help="devices listed by the stand-in tools")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stand-in tool call")
+    parser.add_argument("--throughput", type=float, default=0.0, help="stand-in flash throughput, MB/s (0: disk speed)")
+    parser.add_argument("--http-throughput", type=float, default=0.0, help="HTTP server throughput, MB/s per connection")
+    parser.add_argument("--no-gui", action="store_true", help="do not load the front-ends")
+    parser.add_argument("-o", "--output", help="results file (default: benchmarks/results/<date>-<revision>.json)")
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="median slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    selected = set(args.only.split(",")) if args.only else None
+    work = tempfile.mkdtemp(prefix="fastbootgui-bench-")
+    prepare_environment(args, work)
+    previous_cwd = os.getcwd()
+    # The front-ends write their log file in the current directory.
+    os.chdir(work)
+    results = {}
+    try:
+        ctx = Context(args, work)
+        logging.getLogger().addHandler(logging.FileHandler(os.path.join(work, "bench.log"), encoding="utf-8"))
+        with fixtures.FileServer(int(args.http_throughput * MB)) as server:
+            ctx.server = server
+            for name, function in BENCHMARKS:
+                if selected and name not in selected:
+                    continue
+                try:
+                    cases = function(ctx)
+                except Skip as e:
+                    results[name] = {"skipped": str(e)}
+                    print("%-36s skipped: %s" % (name, e))
+                    continue
+                for case_name, case in cases.items():
+                    key = name + "." + case_name
+                    if not isinstance(case, Case):
+                        results[key] = {"skipped": case}
+                        print("%-36s skipped: %s" % (key, case))
+                        continue
+                    results[key] = result = measure(case, args.repeat)
+                    extra = ""
+                    if "mb_per_s" in result:
+                        extra = "%9.1f MB/s" % result["mb_per_s"]
+                    elif "items_per_s" in result:
+                        extra = "%9.0f /s" % result["items_per_s"]
+                    print("%-36s median %9.2f ms  min %9.2f ms %s" % (key, result["median"] * 1000,
+                                                                      result["min"] * 1000, extra))
+        for cleanup in ctx.cleanups:
+            cleanup()
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+    revision = git_revision()
+    document = {"meta": {"date": datetime.now().isoformat(timespec="seconds"), "revision": revision,
+                         "python": platform.python_version(), "platform": platform.platform(),
+                         "cpu_count": os.cpu_count(),
+                         "parameters": {key: value for key, value in vars(args).items()
+                                        if key not in ("output", "compare", "only")}},
+                "results": results}
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, "%s-%s.json" % (datetime.now().strftime("%Y%m%d-%H%M%S"), revision or "local"))
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=1)
+    print("\nResults saved to %s" % output)
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print("%d regression(s) above %.0f%%." % (len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
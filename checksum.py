@@ -0,0 +1,111 @@
+#This module contains MultiDigest, which computes several digests (sha256, sha1, md5)
+#in a single pass over the data, as it arrives from the network or from disk, and
+#checks them against expected values. It also reads checksum manifests
+#('<hex>  <file name>' lines, as written by sha256sum/md5sum).
+
+import hashlib
+import re
+from pathlib import Path
+
+ALGORITHMS = ("sha256", "sha1", "md5")
+HEX_LENGTHS = {32: "md5", 40: "sha1", 64: "sha256"}
+BUFFER_SIZE = 1024 * 1024
+MANIFEST_LINE_RE = re.compile(r"^([0-9a-fA-F]{32}|[0-9a-fA-F]{40}|[0-9a-fA-F]{64})\s+\*?(.+?)\s*$")
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class HashCancelled(Exception):
+    pass
+
+
+def algorithm_for(hexdigest):
+    """Guesses the algorithm of a hex digest from its length."""
+    return HEX_LENGTHS.get(len(hexdigest.strip()))
+
+
+class MultiDigest:
+    def __init__(self, algorithms=ALGORITHMS, expected=None, expected_size=None, name=None):
+        """
+        expected maps algorithm names to hex digests; algorithms it lists are added
+        to the ones computed. expected_size lets a download fail before it starts.
+        """
+        self.expected = {algo: value.lower() for algo, value in (expected or {}).items()}
+        self.algorithms = tuple(dict.fromkeys(tuple(algorithms) + tuple(self.expected)))
+        self.expected_size = expected_size
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self._hashes = [hashlib.new(algo) for algo in self.algorithms]
+        self.size = 0
+
+    def update(self, data):
+        for h in self._hashes:
+            h.update(data)
+        self.size += len(data)
+
+    def update_from_file(self, f, length=None, buffer_size=BUFFER_SIZE, cancel_check=lambda: False):
+        """
+        Feeds 'length' bytes (None: until EOF) read from a binary file object.
+        Raises HashCancelled between two buffers once cancel_check() is true.
+        """
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        while length is None or length > 0:
+            if cancel_check():
+                raise HashCancelled()
+            wanted = buffer_size if length is None else min(buffer_size, length)
+            count = f.readinto(view[:wanted])
+            if not count:
+                break
+            self.update(view[:count])
+            if length is not None:
+                length -= count
+
+    def check_size(self, size):
+        """Raises ChecksumError as soon as the announced size differs from the expected one."""
+        if self.expected_size is not None and size is not None and size != self.expected_size:
+            raise ChecksumError("%s: size %d, expected %d" % (self.name or "data", size, self.expected_size))
+
+    def hexdigests(self):
+        return {algo: h.hexdigest() for algo, h in zip(self.algorithms, self._hashes)}
+
+    def verify(self):
+        """Checks the digests against the expected ones. Returns the hex digests."""
+        self.check_size(self.size)
+        digests = self.hexdigests()
+        for algo, value in self.expected.items():
+            if digests[algo] != value:
+                raise ChecksumError("%s: %s mismatch (got %s, expected %s)" % (
+                    self.name or "data", algo, digests[algo], value))
+        return digests
+
+
+def file_digests(path, algorithms=ALGORITHMS, expected=None, cancel_check=lambda: False):
+    """Hashes a file in one pass. Raises ChecksumError if 'expected' does not match."""
+    digest = MultiDigest(algorithms, expected, name=Path(path).name)
+    with open(path, "rb") as f:
+        digest.update_from_file(f, cancel_check=cancel_check)
+    return digest.verify()
+
+
+def parse_manifest(text):
+    """Parses sha256sum/sha1sum/md5sum output into {file name: {algorithm: hex digest}}."""
+    manifest = {}
+    for line in text.splitlines():
+        match = MANIFEST_LINE_RE.match(line.strip())
+        if match:
+            value, name = match.groups()
+            manifest.setdefault(Path(name).name, {})[algorithm_for(value)] = value.lower()
+    return manifest
+
+
+def load_manifest(path):
+    """Reads a manifest file; a missing file gives an empty manifest."""
+    try:
+        return parse_manifest(Path(path).read_text(encoding="utf-8", errors="replace"))
+    except FileNotFoundError:
+        return {}
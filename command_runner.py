@@ -0,0 +1,229 @@
+#This module contains run_streaming(), which runs a command and reads its output
+#while it runs, turning fastboot/adb progress lines into ProgressEvent objects
+#and recording how long each phase took.
+
+import codecs
+import os
+import re
+import queue
+import subprocess
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import fastboot_protocol
+import job_executor
+import metrics
+from device_lanes import default_lanes
+from tool_registry import default_registry as tool_registry
+from tracing import tracer
+
+# kind: "start" (a phase begins), "done" (a phase ended, with its duration), "failed",
+# "percent" (adb sideload) or "finished" (fastboot total time).
+ProgressEvent = namedtuple("ProgressEvent", ["kind", "phase", "target", "part", "parts", "percent", "duration", "line"])
+
+SENDING_RE = re.compile(r"Sending(?: sparse)? '([^']+)'(?: (\d+)/(\d+))?")
+PHASE_RE = re.compile(r"^(Sending(?: sparse)?|Writing|Erasing|Booting|Rebooting|Setting current slot)\b(?: '([^']+)')?")
+OKAY_RE = re.compile(r"OKAY \[\s*([\d.]+)s\]")
+FAILED_RE = re.compile(r"FAILED \((.*)\)")
+FINISHED_RE = re.compile(r"Finished\. Total time: ([\d.]+)s")
+PERCENT_RE = re.compile(r"\(~?(\d{1,3})%\)")
+
+
+class StreamResult(subprocess.CompletedProcess):
+    def __init__(self, args, returncode, stdout, stderr, phases):
+        """CompletedProcess with the (phase, target, duration) list measured while streaming."""
+        super().__init__(args, returncode, stdout, stderr)
+        self.phases = phases
+
+
+class ProgressParser:
+    def __init__(self, on_progress=None):
+        """
+        Parses fastboot and adb output incrementally. Fastboot prints 'Sending ...' and
+        its 'OKAY [ 1.234s]' on the same line, so partial lines are parsed as well.
+        """
+        self.on_progress = on_progress
+        self.phases = []
+        self._phase = None
+        self._target = None
+        self._part = (1, 1)
+        self._phase_start = None
+        self._percent = None
+
+    def _emit(self, kind, line, percent=None, duration=None):
+        if percent is not None:
+            self._percent = percent
+        if self.on_progress:
+            self.on_progress(ProgressEvent(kind, self._phase, self._target, self._part[0], self._part[1],
+                                           self._percent, duration, line))
+
+    def _overall(self, phase_done):
+        # Each part counts as one download plus one write.
+        part, parts = self._part
+        steps_done = (part - 1) * 2 + phase_done
+        return min(100.0, steps_done / (parts * 2) * 100)
+
+    def feed_partial(self, text):
+        """Handles the start of a line that has not been terminated yet."""
+        match = PHASE_RE.match(text.strip())
+        if match and match.group(1) != self._phase:
+            self._start_phase(match, text)
+
+    def _start_phase(self, match, line):
+        self._phase = match.group(1)
+        self._target = match.group(2)
+        self._phase_start = time.monotonic()
+        sending = SENDING_RE.search(line)
+        if sending and sending.group(2):
+            self._part = (int(sending.group(2)), int(sending.group(3)))
+        elif sending:
+            self._part = (1, 1)
+        self._emit("start", line, self._overall(1 if self._phase == "Writing" else 0))
+
+    def feed_line(self, line):
+        """Handles one complete line."""
+        stripped = line.strip()
+        if not stripped:
+            return
+        match = PHASE_RE.match(stripped)
+        if match and (match.group(1) != self._phase or self._phase_start is None):
+            self._start_phase(match, stripped)
+        okay = OKAY_RE.search(stripped)
+        failed = FAILED_RE.search(stripped)
+        finished = FINISHED_RE.search(stripped)
+        percent = PERCENT_RE.search(stripped)
+        if okay and self._phase:
+            measured = time.monotonic() - self._phase_start if self._phase_start else None
+            duration = float(okay.group(1)) if okay.group(1) else measured
+            self.phases.append((self._phase, self._target, duration))
+            self._emit("done", stripped, self._overall(2 if self._phase == "Writing" else 1), duration)
+            self._phase = None
+            self._phase_start = None
+        elif failed:
+            self._emit("failed", stripped)
+            self._phase = None
+            self._phase_start = None
+        elif finished:
+            self._emit("finished", stripped, 100.0, float(finished.group(1)))
+        elif percent:
+            self._emit("percent", stripped, float(percent.group(1)))
+
+
+def _reader(stream, name, out_queue):
+    try:
+        while True:
+            data = os.read(stream.fileno(), 65536)
+            if not data:
+                break
+            out_queue.put((name, data))
+    except OSError:
+        pass
+    finally:
+        out_queue.put((name, None))
+
+
+def run_streaming(args, on_line=None, on_progress=None, cancel_check=None, timeout=None):
+    """
+    Runs a command and reads stdout/stderr as they are produced. on_line(line) gets every
+    output line ('\\r'-terminated progress lines included) and on_progress(ProgressEvent)
+    the parsed progress. Returns a StreamResult; returncode is None if cancelled. The
+    command runs in its own process group, stopped as a whole when cancel_check() (by
+    default: the current job is cancelled, see job_executor) or the timeout fires. It
+    waits for the commands issued before it to the same device (see device_lanes).
+    """
+    return default_lanes.run(args, lambda: _measured_run(args, on_line, on_progress, cancel_check, timeout),
+                             cancel_check)
+
+
+def _measured_run(args, on_line, on_progress, cancel_check, timeout):
+    with tracer.command(args) as span, metrics.command(args) as measure:
+        result = _run_streaming(args, on_line, on_progress, cancel_check, timeout, span)
+        span.set(exit_code=result.returncode)
+        measure.done(result.returncode)
+    return result
+
+
+def _trace_phases(on_progress):
+    """Wraps on_progress so that every finished phase is also recorded as a trace span."""
+    def on_event(event):
+        if event.kind == "done" and event.duration is not None:
+            tracer.complete(event.phase, "phase", event.duration, target=event.target,
+                            part="%d/%d" % (event.part, event.parts) if event.parts > 1 else None)
+        if on_progress:
+            on_progress(event)
+    return on_event
+
+
+def _run_streaming(args, on_line, on_progress, cancel_check, timeout, span):
+    parser = ProgressParser(_trace_phases(on_progress) if tracer.enabled else on_progress)
+    cancel_check = cancel_check or job_executor.cancel_requested
+    with tracer.span("spawn", "phase"):
+        process = job_executor.popen(tool_registry.argv(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     stdin=subprocess.DEVNULL)
+    span.set(pid=process.pid)
+    output_queue = queue.Queue()
+    for stream, name in ((process.stdout, "stdout"), (process.stderr, "stderr")):
+        threading.Thread(target=_reader, args=(stream, name, output_queue), daemon=True).start()
+
+    collected = {"stdout": [], "stderr": []}
+    pending = {"stdout": "", "stderr": ""}
+    decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in collected}
+    open_streams = 2
+    deadline = time.monotonic() + timeout if timeout else None
+    cancelled = False
+    while open_streams:
+        if not cancelled and (cancel_check() or (deadline and time.monotonic() > deadline)):
+            cancelled = True
+            job_executor.terminate(process)
+        try:
+            name, data = output_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if data is None:
+            open_streams -= 1
+            decoded = decoders[name].decode(b"", final=True)
+            text = pending[name] + decoded + "\n"
+        else:
+            decoded = decoders[name].decode(data)
+            text = pending[name] + decoded
+        collected[name].append(decoded)
+        parts = re.split(r"[\r\n]", text)
+        pending[name] = parts.pop()
+        for line in parts:
+            if line.strip():
+                parser.feed_line(line)
+                if on_line:
+                    on_line(line)
+        if pending[name]:
+            parser.feed_partial(pending[name])
+
+    returncode = None if cancelled else process.wait()
+    job_executor.release(process)
+    if returncode and cancel_check():
+        # Stopped by Job.cancel() before this loop noticed the cancellation.
+        returncode = None
+        cancelled = True
+    if cancelled:
+        logging.warning("Command cancelled: %s", " ".join(args))
+    return StreamResult(args, returncode, "".join(collected["stdout"]), "".join(collected["stderr"]), parser.phases)
+
+
+def run_fastboot_streaming(args, on_line=None, on_progress=None, cancel_check=None, timeout=None):
+    """
+    Same as run_streaming() for fastboot command lines. TCP targets are served in-process
+    by fastboot_protocol; their report is fed through the same parser. Image sources
+    (zip members) are extracted just in time for the binary.
+    """
+    if not fastboot_protocol.is_native(args):
+        with fastboot_protocol.materialized(args) as real_args:
+            return run_streaming(real_args, on_line, on_progress, cancel_check, timeout)
+    result = fastboot_protocol.run(args, timeout=timeout or 60, cancel_check=cancel_check)
+    parser = ProgressParser(on_progress)
+    for line in (result.stdout + result.stderr).splitlines():
+        if line.strip():
+            parser.feed_line(line)
+            if on_line:
+                on_line(line)
+    return StreamResult(args, result.returncode, result.stdout, result.stderr, parser.phases)
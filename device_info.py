@@ -0,0 +1,188 @@
+#This module contains the 'fastboot getvar all' parser (DeviceInfo) and GetvarCache,
+#a per-serial cache with a TTL, so that features needing a bootloader variable do
+#not each pay for another fastboot round trip.
+
+import threading
+import time
+import logging
+
+DEFAULT_TTL = 300  # seconds; reboot and flash invalidate earlier
+
+# Variables reported per partition, as 'name:partition: value'
+PARTITION_VARIABLES = ("partition-size", "partition-type", "has-slot", "is-logical")
+
+
+class PartitionInfo:
+    def __init__(self, name):
+        self.name = name
+        self.size = None
+        self.type = None
+        self.has_slot = None
+        self.is_logical = None
+
+    def __repr__(self):
+        return "PartitionInfo(%r, size=%r, type=%r, has_slot=%r)" % (self.name, self.size, self.type, self.has_slot)
+
+
+def _parse_int(value):
+    try:
+        return int(value, 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_bool(value):
+    if value is None:
+        return None
+    return value.strip().lower() in ("yes", "true", "1")
+
+
+class DeviceInfo:
+    def __init__(self, variables, serial=None):
+        """Typed view of the variables returned by 'getvar all'."""
+        self.serial = serial
+        self.variables = variables
+        self.fetched_at = time.monotonic()
+        self.partitions = {}
+        for key, value in variables.items():
+            name, sep, partition = key.partition(":")
+            if not sep or name not in PARTITION_VARIABLES:
+                continue
+            info = self.partitions.setdefault(partition, PartitionInfo(partition))
+            if name == "partition-size":
+                info.size = _parse_int(value)
+            elif name == "partition-type":
+                info.type = value
+            elif name == "has-slot":
+                info.has_slot = _parse_bool(value)
+            elif name == "is-logical":
+                info.is_logical = _parse_bool(value)
+
+    def get(self, name, default=None):
+        return self.variables.get(name, default)
+
+    @property
+    def product(self):
+        return self.get("product")
+
+    @property
+    def serialno(self):
+        return self.get("serialno", self.serial)
+
+    @property
+    def current_slot(self):
+        slot = self.get("current-slot")
+        return slot.lstrip("_") if slot else slot
+
+    @property
+    def slot_count(self):
+        return _parse_int(self.get("slot-count"))
+
+    @property
+    def max_download_size(self):
+        return _parse_int(self.get("max-download-size"))
+
+    @property
+    def is_userspace(self):
+        return _parse_bool(self.get("is-userspace"))
+
+    @property
+    def unlocked(self):
+        return _parse_bool(self.get("unlocked"))
+
+    def __repr__(self):
+        return "DeviceInfo(%r, product=%r, current_slot=%r, partitions=%d)" % (
+            self.serialno, self.product, self.current_slot, len(self.partitions))
+
+
+def parse_getvar_all(output):
+    """
+    Parses 'fastboot getvar all' output ('(bootloader) key: value' lines; fastbootd
+    and older bootloaders omit the prefix) into a {key: value} dictionary.
+    """
+    variables = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("(bootloader)"):
+            line = line[len("(bootloader)"):].strip()
+        elif line.startswith(("Finished.", "all:", "getvar:")) or not line:
+            continue
+        key, sep, value = line.rpartition(": ")
+        if not sep:
+            key, sep, value = line.rpartition(":")
+        if sep and key:
+            variables[key.strip()] = value.strip()
+    return variables
+
+
+def fetch_device_info(serial=None, timeout=10):
+    """Runs 'fastboot getvar all' for the serial (or the only device) and parses it."""
+    import fastboot_protocol
+    cmd = ["fastboot"] + (["-s", serial] if serial else []) + ["getvar", "all"]
+    result = fastboot_protocol.run(cmd, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError("'fastboot getvar all' returned code %s: %s" % (result.returncode, result.stderr.strip()))
+    # fastboot prints the variables on stderr
+    return DeviceInfo(parse_getvar_all(result.stdout + "\n" + result.stderr), serial)
+
+
+class GetvarCache:
+    def __init__(self, ttl=DEFAULT_TTL, loader=fetch_device_info):
+        """Per-serial DeviceInfo cache; serial None designates the only connected device."""
+        self.ttl = ttl
+        self.loader = loader
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def get(self, serial=None, refresh=False):
+        """Returns the cached DeviceInfo, loading it if missing, expired or if refresh is set."""
+        with self._lock:
+            info = self._entries.get(serial)
+            if info is not None and not refresh and time.monotonic() - info.fetched_at < self.ttl:
+                return info
+            # One loader per serial: concurrent callers wait for the same fetch.
+            event = self._loading.get(serial)
+            owner = event is None
+            if owner:
+                event = self._loading[serial] = threading.Event()
+        if not owner:
+            event.wait()
+            with self._lock:
+                info = self._entries.get(serial)
+            if info is None:
+                raise RuntimeError("getvar all failed for %s" % (serial or "device"))
+            return info
+        try:
+            info = self.loader(serial)
+            with self._lock:
+                self._entries[serial] = info
+            return info
+        finally:
+            with self._lock:
+                del self._loading[serial]
+            event.set()
+
+    def variable(self, name, serial=None, default=None):
+        """Returns one variable from the cached model."""
+        return self.get(serial).get(name, default)
+
+    def invalidate(self, serial=None):
+        """
+        Drops the cached model of a serial; the 'only device' entry is always dropped too.
+        Serial None (a command sent without -s) may have reached any device: everything is dropped.
+        """
+        with self._lock:
+            if serial is None:
+                self._entries.clear()
+            self._entries.pop(serial, None)
+            self._entries.pop(None, None)
+        logging.debug("getvar cache invalidated for %s", serial or "default device")
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared cache used by the front-ends.
+default_cache = GetvarCache()
@@ -0,0 +1,231 @@
+#This module contains CommandLane, the command queue of one device: the adb/fastboot
+#commands addressed to a serial run one at a time, in the order they were issued, so
+#that a status query, a flash and a 'getvar all' never share the USB interface at once.
+#LaneRegistry also folds identical read-only queries (devices, getvar) that are already
+#in flight into a single request whose result every caller gets, and tells status
+#probes which devices are busy so that they can skip them instead of queueing. A
+#command sent without a serial may reach any device: it holds every lane.
+
+import os
+import time
+import threading
+import contextlib
+from collections import deque
+
+import job_executor
+import metrics
+from tracing import describe_command, tracer
+
+# Queries that do not change the device: identical ones in flight share one request.
+READ_ONLY_COMMANDS = ("devices", "getvar")
+# Commands addressed to the adb server or the host, not to a device: they take no lane.
+HOST_COMMANDS = ("", "devices", "version", "help", "start-server", "kill-server", "connect", "disconnect")
+POLL_INTERVAL = 0.1  # seconds between two cancellation checks while waiting for a lane
+
+
+class DeviceBusy(Exception):
+    """Raised by CommandLane.hold(wait=False) when another command is using the device."""
+
+
+def command_target(args):
+    """
+    Returns (serial, name) for an adb/fastboot command line, e.g. ('X', 'fastboot getvar').
+    The serial is the '-s' argument, else ANDROID_SERIAL, else None for 'the only
+    connected device'.
+    """
+    name, info = describe_command(args)
+    return info.get("serial") or os.environ.get("ANDROID_SERIAL") or None, name
+
+
+class CommandLane:
+    def __init__(self, serial):
+        """Lane of one serial (None: commands sent without a serial)."""
+        self.serial = serial
+        self.current = None
+        self.since = None
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._owner = None
+        self._depth = 0
+
+    def busy(self):
+        """True while a command runs on the device or waits for it."""
+        return self._owner is not None or bool(self._waiting)
+
+    def queued(self):
+        return len(self._waiting)
+
+    def held(self):
+        """True if the calling thread holds the lane."""
+        return self._owner == threading.get_ident()
+
+    @contextlib.contextmanager
+    def hold(self, args=None, wait=True, cancel_check=None):
+        """
+        Holds the device for the enclosed commands, after the ones issued before. The
+        lane is reentrant: commands run by its holder thread do not queue again.
+        With wait=False, raises DeviceBusy instead of queueing. A cancelled job stops
+        waiting (job_executor.JobCancelled).
+        """
+        me = threading.get_ident()
+        cancel_check = cancel_check or job_executor.cancel_requested
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+            else:
+                if not wait and self.busy():
+                    raise DeviceBusy("%s is busy with %s" % (self.serial or "device", self.current))
+                self._wait_turn(args, cancel_check)
+                self._owner = me
+                self._depth = 1
+                self.current = " ".join(str(arg) for arg in args) if args else None
+                self.since = time.monotonic()
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._owner = None
+                    self.current = None
+                    self.since = None
+                    self._cond.notify_all()
+
+    def _wait_turn(self, args, cancel_check):
+        token = object()
+        self._waiting.append(token)
+        try:
+            if self._owner is None and self._waiting[0] is token:
+                return
+            with tracer.span("lane wait", "phase", serial=self.serial, queued=len(self._waiting) - 1):
+                while self._owner is not None or self._waiting[0] is not token:
+                    self._cond.wait(POLL_INTERVAL)
+                    if cancel_check():
+                        raise job_executor.JobCancelled("%s cancelled while waiting for %s" % (
+                            " ".join(str(arg) for arg in args or ()), self.serial or "the device"))
+        finally:
+            self._waiting.remove(token)
+            self._cond.notify_all()
+
+    def __repr__(self):
+        return "CommandLane(%r, current=%r, queued=%d)" % (self.serial, self.current, len(self._waiting))
+
+
+class _Pending:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LaneRegistry:
+    def __init__(self):
+        self._lanes = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def lane(self, serial):
+        """The lane of a serial (None: commands without a serial), created on first use."""
+        with self._lock:
+            lane = self._lanes.get(serial)
+            if lane is None:
+                lane = self._lanes[serial] = CommandLane(serial)
+            return lane
+
+    def busy(self, serial=None):
+        lane = self._lanes.get(serial)
+        return lane is not None and lane.busy()
+
+    def busy_serials(self):
+        """Serials whose lane is in use (None stands for commands sent without a serial)."""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return [lane.serial for lane in lanes if lane.busy()]
+
+    def hold(self, serial, args=None, wait=True, cancel_check=None):
+        """
+        Holds a device for several commands (see CommandLane.hold). Serial None holds
+        every known device, since the command goes to whichever one is connected.
+        """
+        if serial is None:
+            return self._hold_all(args, wait, cancel_check)
+        return self.lane(serial).hold(args, wait, cancel_check)
+
+    @contextlib.contextmanager
+    def _hold_all(self, args, wait, cancel_check):
+        none_lane = self.lane(None)
+        with self._lock:
+            lanes = [self._lanes[serial] for serial in sorted(s for s in self._lanes if s is not None)]
+        # A thread that already holds a device runs its serial-less commands on it: taking
+        # the other lanes after one of them could deadlock with a serial-less holder.
+        if not none_lane.held() and any(lane.held() for lane in lanes):
+            yield none_lane
+            return
+        # Serial-less commands queue on the None lane first, so they never wait on each other
+        # while holding device lanes.
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(none_lane.hold(args, wait, cancel_check))
+            for lane in lanes:
+                stack.enter_context(lane.hold(args, wait, cancel_check))
+            yield none_lane
+
+    def run(self, args, function, cancel_check=None):
+        """
+        Runs function(), which executes the command line 'args', in the lane of its device.
+        An identical read-only query already in flight is not run again: its result (or
+        exception) is returned to every caller.
+        """
+        serial, name = command_target(args)
+        command = name.partition(" ")[2]
+        # A holder must not wait for a query that is itself queued behind it.
+        if command not in READ_ONLY_COMMANDS or (command not in HOST_COMMANDS and self._held(serial)):
+            return self._run(serial, command, args, function, cancel_check)
+        key = (name, serial) + tuple(str(arg) for arg in args[1:])
+        cancel_check = cancel_check or job_executor.cancel_requested
+        while True:
+            with self._lock:
+                pending = self._inflight.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self._inflight[key] = _Pending()
+            if owner:
+                break
+            while not pending.event.wait(POLL_INTERVAL):
+                if cancel_check():
+                    raise job_executor.JobCancelled("%s cancelled" % " ".join(str(arg) for arg in args))
+            # The caller that ran the query was cancelled: run it for this one.
+            if isinstance(pending.error, job_executor.JobCancelled):
+                continue
+            metrics.commands_folded.inc(command=name)
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+        try:
+            pending.result = self._run(serial, command, args, function, cancel_check)
+            return pending.result
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.event.set()
+
+    def _held(self, serial):
+        if serial is not None:
+            return self.lane(serial).held()
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return any(lane.held() for lane in lanes)
+
+    def _run(self, serial, command, args, function, cancel_check):
+        if command in HOST_COMMANDS:
+            return function()
+        with self.hold(serial, args, cancel_check=cancel_check):
+            return function()
+
+
+# Shared lanes used by the command helpers (fastboot_protocol, command_runner, adb_client).
+default_lanes = LaneRegistry()
@@ -0,0 +1,271 @@
+#This module contains the DeviceWatcher class, which follows device plug/unplug
+#events in background threads instead of polling 'adb devices' from the UI. Devices
+#busy with a command (see device_lanes) are skipped by the fastboot poll.
+
+import os
+import queue
+import select
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import metrics
+from adb_client import AdbClient, AdbError, ADB_SERVER_HOST, ADB_SERVER_PORT, read_message
+from device_lanes import default_lanes
+from tool_registry import default_registry as tool_registry
+
+# Fastboot has no event source: it is polled, but only as often as needed.
+FASTBOOT_FAST_INTERVAL = 0.5   # right after an ADB device went away (reboot to bootloader)
+FASTBOOT_ACTIVE_INTERVAL = 2   # while fastboot devices are connected
+FASTBOOT_IDLE_INTERVAL = 10    # upper bound of the back-off when nothing else tells us to poll
+FASTBOOT_MISSING_INTERVAL = 60  # fastboot binary not found
+TRANSITION_WINDOW = 15         # seconds of fast polling after an ADB disconnection
+USB_BUS_DIR = "/dev/bus/usb"
+
+# mode is "adb" or "fastboot"; state is None when the device disappeared.
+DeviceEvent = namedtuple("DeviceEvent", ["serial", "mode", "state", "previous"])
+
+
+def parse_device_list(payload, skip_header=False):
+    """Parses 'serial<TAB>state' lines into a {serial: state} dictionary."""
+    devices = {}
+    lines = payload.strip().splitlines()
+    if skip_header and lines and lines[0].startswith("List of devices"):
+        lines = lines[1:]
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+def usb_bus_signature():
+    """
+    Returns a cheap fingerprint of the USB bus (Linux only) or None.
+    The bus directories change mtime when a device node is added or removed,
+    which lets the watcher skip fastboot polling while nothing is plugged.
+    """
+    try:
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns)
+                            for entry in os.scandir(USB_BUS_DIR)))
+    except OSError:
+        return None
+
+
+class DeviceWatcher:
+    def __init__(self, events=None, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT,
+                 adb="adb", fastboot="fastboot"):
+        """
+        All per-serial changes are published on 'events' (a queue.Queue), which
+        the UI drains from its own thread.
+        """
+        self.events = events if events is not None else queue.Queue()
+        self.client = AdbClient(host, port, pool_size=0)
+        self.adb = adb
+        self.fastboot = fastboot
+        self.adb_source_available = False
+        self._devices = {"adb": {}, "fastboot": {}}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake_fastboot = threading.Event()
+        self._last_adb_departure = 0.0
+        self._socket = None
+        self._threads = []
+
+    # --- Public API ---
+
+    def start(self):
+        """Starts the ADB tracking and fastboot polling threads."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._adb_loop, name="adb-track-devices", daemon=True),
+            threading.Thread(target=self._fastboot_loop, name="fastboot-poll", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2):
+        """Stops the watcher threads and closes the tracking connection."""
+        self._stop.set()
+        self._wake_fastboot.set()
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def snapshot(self):
+        """Returns a copy of the currently known devices, per mode."""
+        with self._lock:
+            return {mode: dict(devices) for mode, devices in self._devices.items()}
+
+    def poll_fastboot_now(self):
+        """Requests an immediate fastboot poll (e.g. after issuing a reboot)."""
+        self._wake_fastboot.set()
+
+    # --- Internal state handling ---
+
+    def _update(self, mode, current):
+        """Diffs the new device list for a mode against the previous one and publishes the changes."""
+        with self._lock:
+            previous = self._devices[mode]
+            self._devices[mode] = dict(current)
+        metrics.devices.set(len(current), mode=mode)
+        for serial, state in current.items():
+            if previous.get(serial) != state:
+                self.events.put(DeviceEvent(serial, mode, state, previous.get(serial)))
+        for serial, state in previous.items():
+            if serial not in current:
+                self.events.put(DeviceEvent(serial, mode, None, state))
+                if mode == "adb":
+                    self._note_adb_departure()
+        if mode == "adb" and any(state == "offline" for state in current.values()):
+            self._note_adb_departure()
+
+    def _note_adb_departure(self):
+        # A device leaving ADB is usually rebooting, possibly into the bootloader.
+        self._last_adb_departure = time.monotonic()
+        self._wake_fastboot.set()
+
+    # --- ADB: host:track-devices stream ---
+
+    def _start_adb_server(self):
+        """Starts the adb server once so that it can be tracked over its socket."""
+        adb = tool_registry.argv([self.adb])[0]
+        if not shutil.which(adb):
+            return False
+        try:
+            result = subprocess.run([adb, "start-server"], capture_output=True, text=True, timeout=15)
+            return result.returncode == 0
+        except Exception as e:
+            logging.error("Error starting adb server: %s", e)
+            return False
+
+    def _adb_loop(self):
+        retry_delay = 1
+        server_start_attempted = False
+        while not self._stop.is_set():
+            try:
+                sock = self.client.open_service("host:track-devices")
+            except (OSError, AdbError) as e:
+                self.adb_source_available = False
+                self._update("adb", {})
+                if not server_start_attempted:
+                    server_start_attempted = True
+                    logging.info("adb server not reachable (%s), starting it.", e)
+                    if self._start_adb_server():
+                        continue
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, FASTBOOT_IDLE_INTERVAL)
+                continue
+
+            self._socket = sock
+            self.adb_source_available = True
+            retry_delay = 1
+            server_start_attempted = False
+            logging.info("Tracking ADB devices through %s:%s.", self.client.host, self.client.port)
+            try:
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([sock], [], [], 0.5)
+                    if not readable:
+                        continue
+                    sock.settimeout(5)
+                    self._update("adb", parse_device_list(read_message(sock)))
+            except (OSError, ValueError) as e:
+                if not self._stop.is_set():
+                    logging.warning("Lost connection to the adb server: %s", e)
+            finally:
+                self._socket = None
+                self.adb_source_available = False
+                sock.close()
+                if not self._stop.is_set():
+                    self._update("adb", {})
+
+    # --- Fastboot: adaptive polling ---
+
+    def _next_fastboot_interval(self, idle_interval):
+        with self._lock:
+            has_fastboot = bool(self._devices["fastboot"])
+        if time.monotonic() - self._last_adb_departure < TRANSITION_WINDOW:
+            return FASTBOOT_FAST_INTERVAL
+        if has_fastboot:
+            return FASTBOOT_ACTIVE_INTERVAL
+        return idle_interval
+
+    def _poll_fastboot(self):
+        """Runs 'fastboot devices' once. Returns False if the binary is missing."""
+        with self._lock:
+            known = list(self._devices["fastboot"])
+        busy = default_lanes.busy_serials()
+        if known and (all(serial in busy for serial in known) or (None in busy and len(known) == 1)):
+            # Every known device is busy: leave the USB bus to its commands.
+            return True
+        try:
+            result = subprocess.run(tool_registry.argv([self.fastboot, "devices"]), capture_output=True, text=True, timeout=5)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.error("Error checking fastboot devices: %s", e)
+            return True
+        self._update("fastboot", self._keep_busy(parse_device_list(result.stdout)))
+        return True
+
+    def _keep_busy(self, current):
+        """
+        A device busy with a command (flash, reboot to fastbootd...) can drop out of the
+        list for a moment: it keeps its known state until its lane is free again.
+        """
+        busy = default_lanes.busy_serials()
+        if not busy:
+            return current
+        with self._lock:
+            previous = self._devices["fastboot"]
+        current = dict(current)
+        for serial, state in previous.items():
+            # None: a command sent without a serial, to the only device there is.
+            if serial in busy or (None in busy and len(previous) == 1):
+                current.setdefault(serial, state)
+        return current
+
+    def _fastboot_loop(self):
+        idle_interval = 1
+        bus_signature = usb_bus_signature()
+        self._wake_fastboot.set()  # initial poll
+        while not self._stop.is_set():
+            interval = self._next_fastboot_interval(idle_interval)
+            deadline = time.monotonic() + interval
+            woken = self._wake_fastboot.wait(interval) if bus_signature is None else False
+            # On Linux, the USB bus fingerprint is checked instead of spawning fastboot
+            # while idle; only a change on the bus (or a wake-up) triggers a poll.
+            while bus_signature is not None and not self._stop.is_set():
+                if self._wake_fastboot.is_set():
+                    woken = True
+                    break
+                signature = usb_bus_signature()
+                if signature != bus_signature:
+                    bus_signature = signature
+                    woken = True
+                    break
+                if interval != idle_interval and time.monotonic() >= deadline:
+                    break
+                self._wake_fastboot.wait(FASTBOOT_FAST_INTERVAL)
+            if self._stop.is_set():
+                return
+            self._wake_fastboot.clear()
+            if not self._poll_fastboot():
+                logging.warning("fastboot not found, device detection limited to ADB.")
+                self._update("fastboot", {})
+                self._stop.wait(FASTBOOT_MISSING_INTERVAL)
+                continue
+            if woken or interval != idle_interval:
+                idle_interval = 1
+            else:
+                idle_interval = min(idle_interval * 2, FASTBOOT_IDLE_INTERVAL)
@@ -0,0 +1,351 @@
+#This module contains the segmented downloader used by download_file(): the file
+#is split into byte ranges fetched concurrently into a preallocated destination,
+#with per-segment resume from a sidecar state file. Servers without range
+#support get a single stream. Bytes already on disk are only reused when the state
+#file records them together with the ETag/Last-Modified the server still reports. An optional checksum.MultiDigest is fed in file
+#order while the bytes arrive, so verifying a download needs no second read.
+
+import json
+import os
+import re
+import threading
+import time
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_SEGMENTS = 4
+MIN_SEGMENT_SIZE = 1024 * 1024      # smaller files are fetched in one stream
+BUFFER_SIZE = 1024 * 1024
+STATE_SAVE_INTERVAL = 1.0           # seconds between sidecar updates
+STATE_SUFFIX = ".download.json"
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadCancelled(Exception):
+    """Raised inside workers when the user cancels the download."""
+
+
+def state_path(destination):
+    return Path(str(destination) + STATE_SUFFIX)
+
+
+def probe(url, timeout=30):
+    """
+    Asks for the first byte of the resource. Returns (size, ranges_supported, tag);
+    size is None when the server does not report it, tag is its ETag (else its
+    Last-Modified date, else None).
+    """
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        tag = response.getheader("ETag") or response.getheader("Last-Modified")
+        if response.status == 206:
+            match = CONTENT_RANGE_RE.match(response.getheader("Content-Range", ""))
+            if match and match.group(3) != "*":
+                return int(match.group(3)), True, tag
+            return None, False, tag
+        length = response.getheader("Content-Length")
+        return (int(length) if length else None), False, tag
+
+
+def probe_validator(url, timeout=30):
+    """
+    Returns a value identifying the current version of the resource (size plus ETag
+    or Last-Modified), used to tell whether a cached copy is still current.
+    """
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        size = None
+        match = CONTENT_RANGE_RE.match(response.getheader("Content-Range", ""))
+        if response.status == 206 and match and match.group(3) != "*":
+            size = int(match.group(3))
+        elif response.status == 200:
+            size = response.getheader("Content-Length")
+        tag = response.getheader("ETag") or response.getheader("Last-Modified")
+        if size is None or not tag:
+            return None
+        return "%s;%s" % (size, tag)
+
+
+def read_state(destination):
+    """The state file of an interrupted download of destination, or None."""
+    path = state_path(destination)
+    if not path.exists() or not Path(destination).exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (ValueError, OSError) as e:
+        logging.warning("Ignoring download state %s: %s", path, e)
+        return None
+
+
+def write_state(destination, state):
+    path = state_path(destination)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _copy_stream(response, out_file, limit, on_bytes, cancel_check):
+    """Copies up to 'limit' bytes (None: until EOF) from the response with readinto."""
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    copied = 0
+    while limit is None or copied < limit:
+        if cancel_check():
+            raise DownloadCancelled()
+        wanted = BUFFER_SIZE if limit is None else min(BUFFER_SIZE, limit - copied)
+        count = response.readinto(view[:wanted])
+        if not count:
+            break
+        out_file.write(view[:count])
+        out_file.flush()  # the digest may read this range back from another handle
+        copied += count
+        on_bytes(view[:count])
+    return copied
+
+
+def download_single(url, destination, progress_callback=None, cancel_check=lambda: False,
+                    digest=None, timeout=30, tag=None):
+    """
+    One stream. An interrupted download resumes after the bytes its state file
+    records, if the server still reports the same tag (ETag or Last-Modified);
+    otherwise the file is rewritten from the start.
+    """
+    state = read_state(destination)
+    resume_byte_pos = 0
+    if tag and state and "segments" not in state and state.get("url") == url and state.get("tag") == tag:
+        resume_byte_pos = min(state.get("done", 0), Path(destination).stat().st_size)
+    req = urllib.request.Request(url)
+    if resume_byte_pos:
+        req.add_header("Range", f"bytes={resume_byte_pos}-")
+        # The server answers with the whole resource if it changed since.
+        req.add_header("If-Range", tag)
+        logging.info("Resuming download at byte %s", resume_byte_pos)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        if resume_byte_pos and response.status != 206:
+            # The server ignored the range: start over.
+            resume_byte_pos = 0
+        total_length = response.getheader("content-length")
+        total_length = int(total_length) + resume_byte_pos if total_length else None
+        downloaded = [resume_byte_pos]
+        last_save = [0.0]
+
+        def save_state(force=False):
+            if tag and (force or time.monotonic() - last_save[0] >= STATE_SAVE_INTERVAL):
+                last_save[0] = time.monotonic()
+                write_state(destination, {"url": url, "tag": tag, "done": downloaded[0]})
+        if digest:
+            digest.reset()
+            digest.check_size(total_length)
+            if resume_byte_pos:
+                with open(destination, "rb") as f:
+                    digest.update_from_file(f, resume_byte_pos)
+
+        def on_bytes(chunk):
+            downloaded[0] += len(chunk)
+            if digest:
+                digest.update(chunk)
+            if progress_callback and total_length:
+                progress_callback(downloaded[0] / total_length * 100)
+            save_state()
+
+        with open(destination, "r+b" if resume_byte_pos else "wb") as out_file:
+            out_file.truncate(resume_byte_pos)
+            out_file.seek(resume_byte_pos)
+            if not tag:
+                # Without a tag the partial file could not be trusted on the next attempt.
+                state_path(destination).unlink(missing_ok=True)
+            save_state(force=True)
+            try:
+                _copy_stream(response, out_file, None, on_bytes, cancel_check)
+            finally:
+                save_state(force=True)
+    state_path(destination).unlink(missing_ok=True)
+    if digest:
+        digest.verify()
+    return True
+
+
+class SegmentedDownload:
+    def __init__(self, url, destination, size, segments=DEFAULT_SEGMENTS,
+                 progress_callback=None, cancel_check=lambda: False, timeout=30, digest=None, tag=None):
+        self.url = url
+        self.destination = Path(destination)
+        self.size = size
+        self.tag = tag
+        self.progress_callback = progress_callback
+        self.cancel_check = cancel_check
+        self.timeout = timeout
+        self.digest = digest
+        self._lock = threading.Lock()
+        self._digest_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._digest_file = None
+        self._last_save = 0.0
+        self.segments = self._load_state()
+        self.resumed = self.segments is not None
+        if not self.resumed:
+            self.segments = self._plan(segments)
+        self.segments.sort(key=lambda segment: segment["start"])
+
+    def _plan(self, count):
+        """Splits [0, size) into ranges."""
+        count = max(1, min(count, self.size // MIN_SEGMENT_SIZE or 1))
+        step = -(-self.size // count)
+        segments = []
+        for start in range(0, self.size, step):
+            segments.append({"start": start, "end": min(start + step, self.size), "done": 0})
+        return segments or [{"start": 0, "end": 0, "done": 0}]
+
+    def _load_state(self):
+        """The segments of an interrupted download of the same version of the resource, or None."""
+        state = read_state(self.destination)
+        if not state or not self.tag:
+            return None
+        if (state.get("url"), state.get("size"), state.get("tag")) != (self.url, self.size, self.tag):
+            logging.info("%s changed on the server since the last attempt: starting over.", self.url)
+            return None
+        try:
+            segments = [dict(start=segment["start"], end=segment["end"], done=segment["done"])
+                        for segment in state["segments"]]
+        except (KeyError, TypeError) as e:
+            logging.warning("Ignoring download state %s: %s", state_path(self.destination), e)
+            return None
+        logging.info("Resuming segmented download from %s", state_path(self.destination))
+        return segments
+
+    def save_state(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_save < STATE_SAVE_INTERVAL:
+            return
+        # Workers skip the save if another thread is already writing the file.
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            self._last_save = now
+            with self._lock:
+                state = {"url": self.url, "size": self.size, "tag": self.tag,
+                         "segments": [dict(segment) for segment in self.segments]}
+            write_state(self.destination, state)
+        finally:
+            self._save_lock.release()
+
+    @property
+    def downloaded(self):
+        with self._lock:
+            return sum(segment["done"] for segment in self.segments)
+
+    def _written_end(self, position):
+        """End of the contiguous range written to disk from 'position'."""
+        with self._lock:
+            for segment in self.segments:
+                if segment["start"] <= position < segment["end"]:
+                    return segment["start"] + segment["done"]
+        return position
+
+    def _feed_digest(self, offset, chunk, wait=False):
+        """
+        Feeds the digest in file order. The chunk at the digest position is hashed from
+        memory; bytes other segments wrote ahead of it are read back once they become
+        contiguous, while they are still in the page cache.
+        """
+        if not self.digest or not self._digest_lock.acquire(blocking=wait or offset == self.digest.size):
+            return
+        try:
+            if offset == self.digest.size:
+                self.digest.update(chunk)
+            while self.digest.size < self.size:
+                end = self._written_end(self.digest.size)
+                if end <= self.digest.size:
+                    break
+                self._digest_file.seek(self.digest.size)
+                self.digest.update_from_file(self._digest_file, end - self.digest.size)
+        finally:
+            self._digest_lock.release()
+
+    def _fetch(self, segment):
+        offset = segment["start"] + segment["done"]
+        remaining = segment["end"] - offset
+        if remaining <= 0:
+            return
+        req = urllib.request.Request(self.url, headers={"Range": f"bytes={offset}-{segment['end'] - 1}"})
+        if self.tag:
+            req.add_header("If-Range", self.tag)
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            if response.status != 206:
+                raise IOError("server ignored the range request (HTTP %s)" % response.status)
+
+            def on_bytes(chunk):
+                with self._lock:
+                    position = segment["start"] + segment["done"]
+                    segment["done"] += len(chunk)
+                self._feed_digest(position, chunk)
+                if self.progress_callback:
+                    self.progress_callback(self.downloaded / self.size * 100)
+                self.save_state()
+
+            with open(self.destination, "r+b") as out_file:
+                out_file.seek(offset)
+                _copy_stream(response, out_file, remaining, on_bytes, self.cancel_check)
+        if segment["start"] + segment["done"] < segment["end"]:
+            raise IOError("segment %d-%d ended early" % (segment["start"], segment["end"]))
+
+    def run(self):
+        """Downloads the missing ranges. Returns False if cancelled."""
+        # Without a matching state file nothing already on disk is trusted.
+        with open(self.destination, "r+b" if self.resumed else "wb") as f:
+            f.truncate(self.size)
+        if self.tag:
+            self.save_state(force=True)
+        else:
+            state_path(self.destination).unlink(missing_ok=True)
+        pending = [segment for segment in self.segments if segment["done"] < segment["end"] - segment["start"]]
+        if self.digest:
+            self.digest.reset()
+            self._digest_file = open(self.destination, "rb")
+        try:
+            # Bytes kept from a previous attempt are hashed first.
+            self._feed_digest(0, b"", wait=True)
+            with ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix="download") as executor:
+                for future in [executor.submit(self._fetch, segment) for segment in pending]:
+                    future.result()
+            # Catches up on chunks that arrived while another thread held the digest.
+            self._feed_digest(self.size, b"", wait=True)
+        except DownloadCancelled:
+            if self.tag:
+                self.save_state(force=True)
+            return False
+        except Exception:
+            if self.tag:
+                self.save_state(force=True)
+            raise
+        finally:
+            if self._digest_file:
+                self._digest_file.close()
+        state_path(self.destination).unlink(missing_ok=True)
+        if self.digest:
+            self.digest.verify()
+        return True
+
+
+def download(url, destination, progress_callback=None, cancel_check=lambda: False,
+             segments=DEFAULT_SEGMENTS, timeout=30, digest=None):
+    """
+    Downloads url to destination, in parallel segments when the server supports ranges.
+    Returns True on success, False if cancelled; raises on errors, and raises
+    checksum.ChecksumError if 'digest' (a MultiDigest) does not match.
+    """
+    size, ranges, tag = probe(url, timeout)
+    if digest:
+        # Fails before any transfer when the manifest gives another size.
+        digest.check_size(size)
+    if not ranges or size is None or size < 2 * MIN_SEGMENT_SIZE or segments <= 1:
+        # A state left by a segmented attempt is not resumed: its file is preallocated.
+        try:
+            return download_single(url, destination, progress_callback, cancel_check, digest, timeout, tag)
+        except DownloadCancelled:
+            return False
+    return SegmentedDownload(url, destination, size, segments, progress_callback, cancel_check, timeout,
+                             digest, tag).run()
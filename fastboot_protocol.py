@@ -0,0 +1,492 @@
+#This module contains an in-process implementation of the fastboot protocol
+#(getvar, download, flash, erase, boot, reboot, set_active) over the fastboot
+#TCP transport, with structured results and per-phase timings.
+
+import contextlib
+import os
+import socket
+import struct
+import subprocess
+import time
+import logging
+
+import job_executor
+import metrics
+import sparse_image
+from device_lanes import default_lanes
+from tool_registry import default_registry as tool_registry
+from tracing import tracer
+
+FASTBOOT_TCP_PORT = 5554
+HANDSHAKE = b"FB01"
+CHUNK_SIZE = 1024 * 1024
+MAX_RESPONSE_SIZE = 256
+# The final reply of flash/erase comes once the device has written the partition, which
+# takes minutes for super or userdata: it gets this timeout instead of the connection's,
+# renewed by every INFO keep-alive.
+WRITE_TIMEOUT = 1800
+
+
+class FastbootError(Exception):
+    """Raised on transport or protocol errors (not on FAIL replies, see FastbootResult.ok)."""
+
+
+class FastbootResult:
+    def __init__(self, command):
+        """Outcome of one fastboot operation: reply, INFO lines and timings per phase."""
+        self.command = command
+        self.ok = False
+        self.response = ""
+        self.info = []
+        self.timings = {}
+        self.bytes_sent = 0
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+    def summary(self):
+        """Formats the result the way the fastboot binary reports it, one line per phase."""
+        target = self.command.split(":", 1)[-1]
+        lines = []
+        phases = list(self.timings.items())
+        for index, (phase, duration) in enumerate(phases):
+            if phase == "download":
+                label = "Sending '%s' (%d KB)" % (target, self.bytes_sent // 1024)
+            elif phase == "write":
+                label = "Writing '%s'" % target
+            else:
+                label = self.command
+            last = index == len(phases) - 1
+            status = "OKAY" if self.ok or not last else "FAILED (remote: '%s')" % self.response
+            lines.append("%-50s %s [%7.3fs]" % (label, status, duration))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "FastbootResult(%r, ok=%r, response=%r, timings=%r)" % (
+            self.command, self.ok, self.response, self.timings)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise FastbootError("connection closed by device")
+        data += chunk
+    return bytes(data)
+
+
+class TcpTransport:
+    def __init__(self, host, port=FASTBOOT_TCP_PORT, timeout=30):
+        """Fastboot over TCP: 'FBxx' handshake, then 8-byte big-endian length-prefixed packets."""
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.sock.sendall(HANDSHAKE)
+            reply = _recv_exact(self.sock, 4)
+            if not reply.startswith(b"FB") or not reply[2:].isdigit():
+                raise FastbootError("unexpected handshake reply: %r" % reply)
+            self.version = int(reply[2:])
+        except Exception:
+            self.sock.close()
+            raise
+
+    def write(self, data):
+        """Sends one packet; the payload is not copied."""
+        self.sock.sendall(struct.pack(">Q", len(data)))
+        self.sock.sendall(data)
+
+    def read(self, timeout=None):
+        """Reads one packet; 'timeout' replaces the connection timeout for this read."""
+        if timeout is not None:
+            previous = self.sock.gettimeout()
+            self.sock.settimeout(timeout)
+        try:
+            length = struct.unpack(">Q", _recv_exact(self.sock, 8))[0]
+            if length > MAX_RESPONSE_SIZE:
+                raise FastbootError("response too long (%d bytes)" % length)
+            return _recv_exact(self.sock, length)
+        finally:
+            if timeout is not None:
+                self.sock.settimeout(previous)
+
+    def close(self):
+        self.sock.close()
+
+
+def _iter_chunks(data, size):
+    """Yields memoryview/bytes chunks from a buffer, a binary file object, a path or an iterable."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for offset in range(0, len(view), CHUNK_SIZE):
+            yield view[offset:offset + CHUNK_SIZE]
+    elif isinstance(data, (str, os.PathLike)):
+        with open(data, "rb") as f:
+            yield from _iter_chunks(f, size)
+    elif hasattr(data, "readinto"):
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        remaining = size
+        while remaining > 0:
+            count = data.readinto(view[:min(CHUNK_SIZE, remaining)])
+            if not count:
+                raise FastbootError("source ended %d bytes early" % remaining)
+            remaining -= count
+            yield view[:count]
+    else:
+        for chunk in data:
+            yield chunk
+
+
+def _data_size(data, size):
+    if size is not None:
+        return size
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+    if isinstance(data, (str, os.PathLike)):
+        return os.path.getsize(data)
+    raise FastbootError("size is required for streamed data")
+
+
+class FastbootDevice:
+    def __init__(self, transport):
+        self.transport = transport
+        self._max_download_size = None
+
+    @classmethod
+    def connect_tcp(cls, host, port=FASTBOOT_TCP_PORT, timeout=30):
+        return cls(TcpTransport(host, port, timeout))
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Protocol core ---
+
+    def _read_reply(self, result, info_callback=None, timeout=None):
+        """Reads replies until OKAY/FAIL/DATA. Returns the DATA size or None."""
+        while True:
+            reply = self.transport.read(timeout)
+            kind, payload = reply[:4], reply[4:].decode("utf-8", "replace")
+            if kind in (b"INFO", b"TEXT"):
+                result.info.append(payload)
+                if info_callback:
+                    info_callback(payload)
+            elif kind == b"OKAY":
+                result.ok = True
+                result.response = payload
+                return None
+            elif kind == b"FAIL":
+                result.ok = False
+                result.response = payload
+                return None
+            elif kind == b"DATA":
+                return int(payload, 16)
+            else:
+                raise FastbootError("unknown reply: %r" % reply)
+
+    def command(self, command, phase="command", info_callback=None, result=None, timeout=None):
+        """Sends a raw command and waits for its final reply (each reply within 'timeout', if given)."""
+        result = result or FastbootResult(command)
+        start = time.perf_counter()
+        with tracer.span(phase, "phase", command=command):
+            self.transport.write(command.encode("utf-8"))
+            if self._read_reply(result, info_callback, timeout) is not None:
+                raise FastbootError("unexpected DATA reply to %r" % command)
+        result.timings[phase] = result.timings.get(phase, 0) + time.perf_counter() - start
+        return result
+
+    def download(self, data, size=None, progress_callback=None, result=None):
+        """
+        Downloads data to the device. 'data' can be bytes/memoryview, a path, a binary
+        file object or an iterable of chunks (then 'size' is required).
+        """
+        size = _data_size(data, size)
+        result = result or FastbootResult("download")
+        with tracer.span("download", "phase", bytes=size):
+            start = time.perf_counter()
+            self.transport.write(b"download:%08x" % size)
+            accepted = self._read_reply(result)
+            if accepted is None:
+                result.timings["download"] = time.perf_counter() - start
+                return result
+            if accepted != size:
+                raise FastbootError("device accepted %d bytes instead of %d" % (accepted, size))
+            sent = 0
+            for chunk in _iter_chunks(data, size):
+                self.transport.write(chunk)
+                sent += len(chunk)
+                if progress_callback:
+                    progress_callback(sent, size)
+            if sent != size:
+                raise FastbootError("sent %d bytes instead of %d" % (sent, size))
+            result.bytes_sent += sent
+            result.ok = False
+            self._read_reply(result)
+        result.timings["download"] = result.timings.get("download", 0) + time.perf_counter() - start
+        return result
+
+    # --- Commands ---
+
+    def getvar(self, name):
+        return self.command("getvar:" + name)
+
+    def getvar_all(self):
+        """Returns the variables reported by 'getvar:all' as a dictionary."""
+        result = self.command("getvar:all")
+        variables = {}
+        for line in result.info:
+            key, sep, value = line.rpartition(":")
+            if sep:
+                variables[key.strip()] = value.strip()
+        return variables
+
+    def max_download_size(self):
+        """Returns the device's max-download-size (read once per connection)."""
+        if self._max_download_size is None:
+            result = self.getvar("max-download-size")
+            try:
+                self._max_download_size = sparse_image.parse_max_download_size(result.response) if result.ok else 0
+            except ValueError:
+                self._max_download_size = 0
+        return self._max_download_size
+
+    def flash(self, partition, data, size=None, slot=None, progress_callback=None):
+        """
+        Downloads the image then writes it to the partition (phases 'download' and 'write').
+        An image file bigger than max-download-size is sent as sparse parts, each one
+        generated on the fly from the file.
+        """
+        if slot:
+            partition = "%s_%s" % (partition, slot)
+        result = FastbootResult("flash:" + partition)
+        if isinstance(data, (str, os.PathLike)):
+            max_size = self.max_download_size()
+            if max_size and sparse_image.needs_split(data, max_size):
+                return self._flash_sparse(partition, data, max_size, progress_callback, result)
+        self.download(data, size, progress_callback, result=result)
+        if not result.ok:
+            return result
+        return self.command("flash:" + partition, phase="write", result=result, timeout=WRITE_TIMEOUT)
+
+    def _flash_sparse(self, partition, path, max_size, progress_callback, result):
+        parts = sparse_image.split(path, max_size)
+        total = os.path.getsize(path)
+        for part in parts:
+            logging.info("Sending sparse '%s' %d/%d (%d KB)", partition, part.index, part.count, part.size // 1024)
+            sent_before = result.bytes_sent
+            callback = None
+            if progress_callback:
+                callback = lambda sent, size: progress_callback(min(sent_before + sent, total), total)
+            self.download(part, part.size, callback, result=result)
+            if not result.ok:
+                return result
+            self.command("flash:" + partition, phase="write", result=result, timeout=WRITE_TIMEOUT)
+            if not result.ok:
+                return result
+        return result
+
+    def erase(self, partition, slot=None):
+        if slot:
+            partition = "%s_%s" % (partition, slot)
+        return self.command("erase:" + partition, phase="erase", timeout=WRITE_TIMEOUT)
+
+    def boot(self, data, size=None, progress_callback=None):
+        result = FastbootResult("boot")
+        self.download(data, size, progress_callback, result=result)
+        if not result.ok:
+            return result
+        return self.command("boot", phase="boot", result=result)
+
+    def reboot(self, target=None):
+        """Reboots the device; target can be 'bootloader', 'fastboot', 'recovery'..."""
+        return self.command("reboot-" + target if target else "reboot", phase="reboot")
+
+    def set_active(self, slot):
+        return self.command("set_active:" + slot, phase="set_active")
+
+
+def parse_tcp_serial(serial):
+    """Returns (host, port) for a 'tcp:host[:port]' serial, None otherwise."""
+    if not serial or not serial.startswith("tcp:"):
+        return None
+    host, sep, port = serial[4:].rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return serial[4:], FASTBOOT_TCP_PORT
+
+
+def tcp_target():
+    """Returns (host, port) when ANDROID_SERIAL designates a fastboot TCP device."""
+    return parse_tcp_serial(os.environ.get("ANDROID_SERIAL"))
+
+
+def _parse_args(args):
+    """Splits a fastboot command line into (serial, slot, remaining arguments)."""
+    argv = list(args)[1:]
+    serial = os.environ.get("ANDROID_SERIAL")
+    slot = None
+    rest = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == "-s" and i + 1 < len(argv):
+            serial = argv[i + 1]
+            i += 2
+        elif argv[i] == "--slot" and i + 1 < len(argv):
+            slot = argv[i + 1]
+            i += 2
+        elif isinstance(argv[i], str) and argv[i].startswith("--slot="):
+            slot = argv[i].split("=", 1)[1]
+            i += 1
+        else:
+            rest.append(argv[i])
+            i += 1
+    return serial, slot, rest
+
+
+def is_source(arg):
+    """
+    True for image sources that are not files yet (zip_images.ZipImage): they provide
+    open() for streaming, and acquire()/release() for a temporary extracted path.
+    """
+    return hasattr(arg, "open") and hasattr(arg, "acquire")
+
+
+@contextlib.contextmanager
+def materialized(args):
+    """Yields the command line with its image sources replaced by extracted file paths."""
+    acquired = []
+    try:
+        real_args = []
+        for arg in args:
+            if is_source(arg):
+                with tracer.span("extract image", "phase", bytes=arg.size):
+                    real_args.append(arg.acquire())
+                acquired.append(arg)
+            else:
+                real_args.append(arg)
+        yield real_args
+    finally:
+        for source in acquired:
+            source.release()
+
+
+def _flash_source(device, partition, source, slot):
+    """Streams an image source to the device; sources needing a sparse split are extracted first."""
+    max_size = device.max_download_size()
+    if max_size and source.size > max_size:
+        path = source.acquire()
+        try:
+            return device.flash(partition, path, slot=slot)
+        finally:
+            source.release()
+    with source.open() as stream:
+        return device.flash(partition, stream, source.size, slot=slot)
+
+
+def is_native(args):
+    """True if run() serves this command line in-process (TCP target, supported command)."""
+    serial, slot, rest = _parse_args(args)
+    if parse_tcp_serial(serial) is None:
+        return False
+    return rest == ["devices"] or _native_operation(rest, slot) is not None
+
+
+def run(args, timeout=60, cancel_check=None):
+    """
+    Drop-in replacement for subprocess.run(args, capture_output=True, text=True) for
+    fastboot command lines. When the target is a TCP device ('-s tcp:host[:port]' or
+    ANDROID_SERIAL), getvar, flash, erase, boot, reboot and set_active run in-process;
+    anything else goes to the fastboot binary. The image of 'flash' may be a source
+    (see is_source()), streamed to TCP targets and extracted for the binary. The binary
+    is stopped when cancel_check() (default: the current job is cancelled) becomes true
+    and job_executor.JobCancelled is raised. Commands to the same device are serialized.
+    timeout=None sets no limit, for commands that wait on the user or on the device
+    (unlock confirmation, erase, boot).
+    """
+    # Commands to one device run in its lane, one at a time (see device_lanes).
+    return default_lanes.run(args, lambda: _measured_run(args, timeout, cancel_check), cancel_check)
+
+
+def _measured_run(args, timeout, cancel_check):
+    with tracer.command(args) as span, metrics.command(args) as measure:
+        result = _run(args, timeout, cancel_check)
+        span.set(exit_code=result.returncode)
+        measure.done(result.returncode)
+    return result
+
+
+def _native_operation(rest, slot):
+    """
+    Returns operation(device) -> (FastbootResult, output) for the commands served
+    in-process, None for the ones left to the fastboot binary. Decided from the
+    arguments alone: a TCP device serves a single connection, so none may be open
+    while the binary runs.
+    """
+    command = rest[0] if rest else None
+    if command == "getvar" and len(rest) == 2:
+        name = rest[1]
+        if name == "all":
+            def getvar_all(device):
+                result = device.command("getvar:all")
+                return result, "".join("(bootloader) %s\n" % line for line in result.info)
+            return getvar_all
+
+        def getvar(device):
+            result = device.getvar(name)
+            return result, ("%s: %s\n" % (name, result.response) if result.ok else "")
+        return getvar
+    if command == "flash" and len(rest) == 3:
+        if is_source(rest[2]):
+            return lambda device: (_flash_source(device, rest[1], rest[2], slot), "")
+        return lambda device: (device.flash(rest[1], rest[2], slot=slot), "")
+    if command == "erase" and len(rest) == 2:
+        return lambda device: (device.erase(rest[1], slot=slot), "")
+    if command == "boot" and len(rest) == 2:
+        return lambda device: (device.boot(rest[1]), "")
+    if command in ("reboot", "reboot-bootloader") and len(rest) <= 2:
+        target_mode = rest[1] if len(rest) == 2 else ("bootloader" if command == "reboot-bootloader" else None)
+        return lambda device: (device.reboot(target_mode), "")
+    if command in ("set_active", "--set-active") and len(rest) == 2:
+        return lambda device: (device.set_active(rest[1]), "")
+    if command and command.startswith("--set-active=") and len(rest) == 1:
+        return lambda device: (device.set_active(command.split("=", 1)[1]), "")
+    return None
+
+
+def _run(args, timeout, cancel_check):
+    serial, slot, rest = _parse_args(args)
+    target = parse_tcp_serial(serial)
+    if any(is_source(arg) for arg in args) and (target is None or rest[:1] != ["flash"] or len(rest) != 3):
+        with materialized(args) as real_args:
+            return _run(real_args, timeout, cancel_check)
+    if target is not None and rest == ["devices"]:
+        try:
+            FastbootDevice.connect_tcp(target[0], target[1], timeout=min(timeout or 5, 5)).close()
+        except (OSError, FastbootError):
+            return subprocess.CompletedProcess(args, 0, "", "")
+        return subprocess.CompletedProcess(args, 0, "%s\tfastboot\n" % serial, "")
+    operation = _native_operation(rest, slot) if target is not None else None
+    if operation is None:
+        return job_executor.run(tool_registry.argv(args), timeout, cancel_check)
+    try:
+        with FastbootDevice.connect_tcp(target[0], target[1], timeout=timeout) as device:
+            result, output = operation(device)
+    except (OSError, FastbootError) as e:
+        logging.error("Fastboot TCP error: %s", e)
+        return subprocess.CompletedProcess(args, 1, "", "fastboot: error: %s\n" % e)
+
+    # The fastboot binary reports on stderr; keep the same layout for the callers.
+    output += result.summary() + "\n"
+    output += "Finished. Total time: %.3fs\n" % result.total_time
+    return subprocess.CompletedProcess(args, 0 if result.ok else 1, "", output)
@@ -0,0 +1,192 @@
+#This module contains the checksum verification of firmware files before flashing:
+#images are matched with their .md5/.sha1/.sha256 sidecar files (or the md5 trailer
+#of Samsung .tar.md5 archives) and hashed in parallel in a process pool. The LZ4
+#compressed images of those archives (.img.lz4) are decompressed to check their frames
+#when the optional lz4 package is installed, and reported as not checked otherwise.
+
+import os
+import re
+import time
+import tarfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from checksum import ChecksumError, MultiDigest, algorithm_for, parse_manifest
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+SIDECAR_EXTENSIONS = (".md5", ".sha1", ".sha256")
+READ_BUFFER = 4 * 1024 * 1024
+# Samsung firmware: '<md5 of the tar>  <name>.tar\n' appended to the tar itself
+TAR_MD5_TRAILER_RE = re.compile(rb"([0-9a-fA-F]{32})[ \t]+\*?([^\r\n/\\]+)\r?\n?$")
+TRAILER_MAX = 512
+LZ4_IMAGE_SUFFIX = ".img.lz4"
+
+# expected: {algorithm: hex digest}; length: number of bytes to hash (None: the whole file);
+# member: LZ4 image inside the archive at path, checked by decompressing it
+VerifyEntry = namedtuple("VerifyEntry", ["path", "expected", "length", "source", "member"], defaults=(None,))
+VerifyResult = namedtuple("VerifyResult", ["path", "ok", "digests", "error", "duration", "source"])
+
+
+def is_sidecar(path):
+    return path.lower().endswith(SIDECAR_EXTENSIONS) and not is_tar_md5(path)
+
+
+def is_tar_md5(path):
+    return path.lower().endswith(".tar.md5")
+
+
+def read_sidecar(path, target_name=None):
+    """
+    Reads the expected digest from a sidecar: either '<hex>' alone or md5sum-style
+    lines, in which case the line for target_name is preferred.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read(64 * 1024)
+    manifest = parse_manifest(text)
+    if target_name and target_name in manifest:
+        return manifest[target_name]
+    if len(manifest) == 1:
+        return next(iter(manifest.values()))
+    value = text.strip().split()[0] if text.strip() else ""
+    algorithm = algorithm_for(value)
+    if algorithm and re.fullmatch(r"[0-9a-fA-F]+", value):
+        return {algorithm: value.lower()}
+    raise ChecksumError("%s: no checksum found" % os.path.basename(path))
+
+
+def read_tar_md5_trailer(path):
+    """Returns (md5, length of the tar before the trailer) for a Samsung .tar.md5 file."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - TRAILER_MAX))
+        tail = f.read()
+    match = TAR_MD5_TRAILER_RE.search(tail)
+    if not match:
+        raise ChecksumError("%s: md5 trailer not found" % os.path.basename(path))
+    return match.group(1).decode("ascii").lower(), size - (len(tail) - match.start())
+
+
+def lz4_members(path):
+    """Names of the LZ4-compressed images (.img.lz4) of a tar archive."""
+    with tarfile.open(path, "r:") as tar:
+        return [member.name for member in tar.getmembers()
+                if member.isfile() and member.name.lower().endswith(LZ4_IMAGE_SUFFIX)]
+
+
+def open_image_member(tar, member):
+    """
+    Readable stream of an image inside an open tar archive, decompressed for .img.lz4
+    members. Returns (image name, stream), or (name, None) for an LZ4 image when the
+    lz4 package is missing.
+    """
+    name = os.path.basename(member.name)
+    if not name.lower().endswith(LZ4_IMAGE_SUFFIX):
+        return name, tar.extractfile(member)
+    if lz4_frame is None:
+        return name, None
+    return name[:-len(".lz4")], lz4_frame.open(tar.extractfile(member), "rb")
+
+
+def sidecar_candidates(path):
+    """Sidecar names accepted for an image: 'boot.img.md5' and 'boot.md5'."""
+    stem = os.path.splitext(path)[0]
+    for ext in SIDECAR_EXTENSIONS:
+        yield path + ext
+        yield stem + ext
+
+
+def match_sidecars(files):
+    """
+    Pairs firmware files with their checksums. Sidecars may be part of the selection
+    or lie next to the image. Returns (entries, unverified, orphans): VerifyEntry
+    objects, images without a checksum and selected sidecars matching no image.
+    The .img.lz4 images of a .tar.md5 archive are checked by decompression, or listed
+    in unverified as '<archive>/<member>' when the lz4 package is missing.
+    """
+    selected_sidecars = {os.path.normcase(os.path.abspath(f)): f for f in files if is_sidecar(f)}
+    used = set()
+    entries = []
+    unverified = []
+    for path in files:
+        if is_sidecar(path):
+            continue
+        if is_tar_md5(path):
+            md5, length = read_tar_md5_trailer(path)
+            entries.append(VerifyEntry(path, {"md5": md5}, length, "trailer"))
+            for member in lz4_members(path):
+                if lz4_frame is None:
+                    unverified.append(path + "/" + member)
+                else:
+                    entries.append(VerifyEntry(path, {}, None, "lz4", member))
+            continue
+        for candidate in sidecar_candidates(path):
+            key = os.path.normcase(os.path.abspath(candidate))
+            if key in selected_sidecars or os.path.isfile(candidate):
+                used.add(key)
+                expected = read_sidecar(candidate, os.path.basename(path))
+                entries.append(VerifyEntry(path, expected, None, os.path.basename(candidate)))
+                break
+        else:
+            unverified.append(path)
+    orphans = [f for key, f in selected_sidecars.items() if key not in used]
+    return entries, unverified, orphans
+
+
+def _verify_lz4_member(entry, digest):
+    """Decompresses an LZ4 image of the archive; corrupt frames raise RuntimeError."""
+    with tarfile.open(entry.path, "r:") as tar:
+        _, stream = open_image_member(tar, tar.getmember(entry.member))
+        with stream:
+            digest.update_from_file(stream, None, READ_BUFFER)
+
+
+def verify_entry(entry):
+    """Hashes one file (in a worker process). Returns a VerifyResult instead of raising."""
+    start = time.monotonic()
+    path = entry.path + "/" + entry.member if entry.member else entry.path
+    if entry.member:
+        # Only the frames can be checked: the archive has no digest of the image itself.
+        digest = MultiDigest(("sha256",), name=entry.member)
+    else:
+        digest = MultiDigest((), entry.expected, name=os.path.basename(entry.path))
+    try:
+        if entry.member:
+            _verify_lz4_member(entry, digest)
+        else:
+            with open(entry.path, "rb", buffering=0) as f:
+                digest.update_from_file(f, entry.length, READ_BUFFER)
+        if entry.length is not None and digest.size != entry.length:
+            raise ChecksumError("%s: file is truncated" % os.path.basename(entry.path))
+        return VerifyResult(path, True, digest.verify(), None, time.monotonic() - start, entry.source)
+    except (OSError, ChecksumError, RuntimeError, EOFError, tarfile.TarError) as e:
+        return VerifyResult(path, False, digest.hexdigests(), str(e), time.monotonic() - start, entry.source)
+
+
+def verify_all(entries, max_workers=None, on_result=None):
+    """
+    Verifies all entries in parallel, one process per core by default. on_result(VerifyResult)
+    is called as each file completes. Returns the results in the order of the entries.
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(entries)))
+    if workers == 1:
+        results = []
+        for entry in entries:
+            results.append(verify_entry(entry))
+            if on_result:
+                on_result(results[-1])
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(verify_entry, entry) for entry in entries]
+        results = []
+        for future in futures:
+            results.append(future.result())
+            if on_result:
+                on_result(results[-1])
+    return results
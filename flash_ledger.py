@@ -0,0 +1,175 @@
+#This module contains FlashLedger, a persistent record of the image last flashed
+#successfully on each serial/slot/partition (identity and size), which lets a
+#delta flash skip the partitions whose image has not changed.
+
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from pathlib import Path
+
+import fastboot_protocol
+from artifact_cache import default_cache as artifact_cache, default_cache_dir
+from device_info import default_cache as getvar_cache
+
+
+def default_ledger_path():
+    if os.environ.get("FASTBOOTGUI_LEDGER"):
+        return Path(os.environ["FASTBOOTGUI_LEDGER"])
+    return default_cache_dir().with_name("fastbootgui-ledger.json")
+
+
+def image_identity(source):
+    """
+    Returns (identity, size) of an image: the sha256 of a file or of the decompressed
+    zip member, remembered by the artifact cache per (size, mtime) of the file.
+    """
+    if fastboot_protocol.is_source(source):
+        zip_path = getattr(source, "zip_path", None)
+        if zip_path is None:
+            return None, source.size
+        return "sha256:" + artifact_cache.fingerprint_sha256(zip_path, source.member), source.size
+    return "sha256:" + artifact_cache.fingerprint_sha256(source), os.path.getsize(source)
+
+
+def resolve_slot(serial, partition, slot=None):
+    """Slot written by a flash: the explicit one, else the current slot for A/B partitions."""
+    if slot:
+        return slot
+    try:
+        info = getvar_cache.get(serial)
+    except Exception as e:
+        logging.debug("No slot information for %s: %s", serial, e)
+        return ""
+    partition_info = info.partitions.get(partition) or info.partitions.get(partition + "_" + (info.current_slot or "a"))
+    if partition_info is not None and partition_info.has_slot and info.current_slot:
+        return info.current_slot
+    return ""
+
+
+class FlashLedger:
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_ledger_path()
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError as e:
+                logging.warning("Flash ledger unreadable, starting empty: %s", e)
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _key(partition, slot):
+        return "%s:%s" % (slot or "", partition)
+
+    def get(self, serial, partition, slot=None):
+        with self._lock:
+            return self._load().get(serial, {}).get(self._key(partition, slot))
+
+    def is_current(self, serial, partition, slot, identity, size):
+        """True if the partition was last flashed successfully with this very image."""
+        if identity is None:
+            return False
+        entry = self.get(serial, partition, slot)
+        return bool(entry) and entry.get("identity") == identity and entry.get("size") == size
+
+    def record(self, serial, partition, slot, identity, size):
+        with self._lock:
+            device = self._load().setdefault(serial, {})
+            if identity is None:
+                device.pop(self._key(partition, slot), None)
+            else:
+                device[self._key(partition, slot)] = {"identity": identity, "size": size, "flashed_at": time.time()}
+            self._save()
+
+    def forget(self, serial, partition=None, slot=None):
+        """
+        Drops one partition (after an erase or a failed flash) or the whole device. Serial
+        None (a command sent without -s) may have reached any device: all of them forget it.
+        """
+        with self._lock:
+            entries = self._load()
+            for device in ([serial] if serial is not None else list(entries)):
+                if partition is None:
+                    entries.pop(device, None)
+                elif device in entries:
+                    for key in [k for k in entries[device] if k.split(":", 1)[1] == partition
+                                and (slot is None or k.split(":", 1)[0] == slot)]:
+                        del entries[device][key]
+            self._save()
+
+
+def parse_flash_step(step):
+    """Returns (partition, slot, source) for ['flash', partition, ('--slot', slot,) source], else None."""
+    if len(step) < 3 or step[0] != "flash":
+        return None
+    slot = None
+    if "--slot" in step[2:-1]:
+        slot = step[step.index("--slot") + 1]
+    return step[1], slot, step[-1]
+
+
+class DeltaFilter:
+    def __init__(self, ledger, delta=True):
+        """
+        Used by the flash executors around each step: with delta set, flash steps whose
+        image is already on the device are skipped; in every mode the ledger is updated.
+        Without delta no image is hashed: the flashed partitions are dropped from the ledger.
+        """
+        self.ledger = ledger
+        self.delta = delta
+        self.skipped_bytes = 0
+        self._lock = threading.Lock()
+
+    def before(self, serial, step):
+        """Returns a context for after(), or "skip" if the step does not need to run."""
+        parsed = parse_flash_step(step)
+        if parsed is None:
+            return None
+        partition, slot, source = parsed
+        if slot in ("all", "other") or not self.delta:
+            # Not tracked: after() drops the partition on every slot.
+            return (partition, None, None, None)
+        slot = resolve_slot(serial, partition, slot)
+        try:
+            identity, size = image_identity(source)
+        except OSError:
+            return None
+        if self.delta and self.ledger.is_current(serial, partition, slot, identity, size):
+            with self._lock:
+                self.skipped_bytes += size
+            return "skip"
+        return (partition, slot, identity, size)
+
+    def after(self, serial, step, context, ok):
+        if step and str(step[0]).partition(":")[0] in ("erase", "format") and len(step) >= 2:
+            self.ledger.forget(serial, step[1])
+        elif any(arg in ("update", "flashall") for arg in step or ()):
+            # The binary wrote partitions this filter did not see.
+            self.ledger.forget(serial)
+        if not isinstance(context, tuple):
+            return
+        partition, slot, identity, size = context
+        if ok and identity is not None:
+            self.ledger.record(serial, partition, slot, identity, size)
+        else:
+            self.ledger.forget(serial, partition, slot)
+
+
+# Shared ledger used by the front-ends.
+default_ledger = FlashLedger()
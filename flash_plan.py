@@ -0,0 +1,615 @@
+#This module contains the factory-image flash plan engine: a factory package
+#(flash-all.sh, android-info.txt, nested image-*.zip) is read into a FlashPlan, a
+#DAG of check/flash/erase/format/reboot/set_active steps. Its executor groups the
+#steps that need no reboot, skips reboots that change nothing, and prepares the next
+#image while the current one is transferred. Nested zips with dynamic partitions
+#(super_empty.img) are left to 'fastboot update', which lays out 'super' first.
+
+import os
+import shlex
+import threading
+import time
+import zipfile
+import logging
+
+import fastboot_protocol
+from device_info import default_cache as getvar_cache
+from flash_scheduler import DeviceResult, list_fastboot_serials
+from tracing import tracer
+from zip_images import ZipImage
+
+FLASH_SCRIPTS = ("flash-all.sh", "flash-all.bat")
+ANDROID_INFO = "android-info.txt"
+SUPER_EMPTY = "super_empty.img"
+# Partitions formatted by '-w' (the binary skips those the device does not have)
+WIPE_PARTITIONS = ("userdata", "metadata")
+# Order used by 'fastboot update' for the images of the nested zip; others follow by name.
+UPDATE_ORDER = ("boot", "init_boot", "dtbo", "dt", "recovery", "vendor_boot", "vendor_kernel_boot",
+                "pvmfw", "vbmeta", "vbmeta_system", "vbmeta_vendor")
+# Partitions whose new content is only used by the bootloader after a reboot
+BOOTLOADER_PARTITIONS = ("bootloader", "radio", "abl", "xbl", "modem")
+# 'require board=...' is checked against 'getvar product'
+REQUIREMENT_VARIABLES = {"board": "product"}
+
+REBOOT_SETTLE = 2       # seconds before looking for a rebooting device
+REBOOT_TIMEOUT = 120
+ESTIMATED_RATE = 40 * 1024 * 1024   # bytes per second, for estimate()
+ESTIMATED_REBOOT = 15               # seconds per reboot
+ESTIMATED_COMMAND = 0.5             # seconds per command
+
+
+class PlanError(Exception):
+    pass
+
+
+class PlanStep:
+    def __init__(self, kind, partition=None, source=None, slot=None, args=None, requirements=None, mode=None):
+        """
+        kind: "check", "flash", "erase", "format", "reboot", "set_active" or "raw" (passed
+        as is). For "reboot", partition is the target ("bootloader", "fastboot" or None);
+        for "format", args can hold the command with its file system ('format:ext4').
+        mode is the fastboot mode the step needs: "bootloader", "fastbootd" or None.
+        """
+        self.kind = kind
+        self.partition = partition
+        self.source = source
+        self.slot = slot
+        self.args = list(args or [])
+        self.requirements = requirements or {}
+        self.mode = mode
+        self.index = None
+        self.deps = []
+
+    @property
+    def size(self):
+        if self.source is None:
+            return 0
+        if fastboot_protocol.is_source(self.source):
+            return self.source.size
+        try:
+            return os.path.getsize(self.source)
+        except OSError:
+            return 0
+
+    @property
+    def is_barrier(self):
+        return self.kind == "reboot"
+
+    def fastboot_args(self, slot=None):
+        """Arguments after 'fastboot -s <serial>'."""
+        slot = slot or self.slot
+        slot_args = ["--slot", slot] if slot else []
+        if self.kind == "flash":
+            return ["flash", self.partition] + slot_args + [self.source]
+        if self.kind == "erase":
+            return ["erase", self.partition] + slot_args
+        if self.kind == "format":
+            return [self.args[0] if self.args else "format", self.partition] + slot_args
+        if self.kind == "reboot":
+            return ["reboot", self.partition] if self.partition else ["reboot"]
+        if self.kind == "set_active":
+            return ["set_active", self.slot]
+        return list(self.args)
+
+    def describe(self):
+        if self.kind == "check":
+            return "check " + ", ".join("%s=%s" % (k, "|".join(v)) for k, v in self.requirements.items())
+        if self.kind == "flash":
+            name = os.path.basename(str(self.source))
+            return "flash %s%s <- %s" % (self.partition, " (slot %s)" % self.slot if self.slot else "", name)
+        return " ".join(str(arg) for arg in self.fastboot_args())
+
+
+class FlashPlan:
+    def __init__(self, name):
+        self.name = name
+        self.steps = []
+        self._resources = []  # objects to release() when the plan is closed
+
+    def add(self, step):
+        """Appends a step; it depends on the last reboot, and a reboot on everything since the previous one."""
+        step.index = len(self.steps)
+        barrier = None
+        since_barrier = []
+        for previous in reversed(self.steps):
+            if previous.is_barrier:
+                barrier = previous
+                break
+            since_barrier.append(previous.index)
+        if step.is_barrier:
+            step.deps = sorted(since_barrier) + ([barrier.index] if barrier else [])
+        else:
+            step.deps = [barrier.index] if barrier else []
+        self.steps.append(step)
+        return step
+
+    def batches(self):
+        """Groups of steps that can run without a reboot in between (the reboots are separate groups)."""
+        groups = [[]]
+        for step in self.steps:
+            if step.is_barrier:
+                groups.append([step])
+                groups.append([])
+            else:
+                groups[-1].append(step)
+        return [group for group in groups if group]
+
+    def optimize(self):
+        """
+        Returns an equivalent plan without redundant reboots: a reboot directly followed
+        by another one is dropped, and inside each batch the steps are grouped by mode
+        (checks first, then bootloader, then fastbootd) so that each mode is entered once.
+        """
+        plan = FlashPlan(self.name)
+        plan._resources, self._resources = self._resources, []
+        mode_rank = {None: 1, "bootloader": 1, "fastbootd": 2}
+        batches = self.batches()
+        for position, batch in enumerate(batches):
+            if batch[0].is_barrier:
+                following = batches[position + 1] if position + 1 < len(batches) else None
+                if following and following[0].is_barrier and batch[0].partition in ("bootloader", "fastboot"):
+                    continue
+                plan.add(_copy_step(batch[0]))
+                continue
+            ordered = sorted(batch, key=lambda s: (0 if s.kind == "check" else mode_rank[s.mode], s.index))
+            for step in ordered:
+                plan.add(_copy_step(step))
+        return plan
+
+    def total_bytes(self):
+        return sum(step.size for step in self.steps)
+
+    def estimate(self, rate=ESTIMATED_RATE):
+        """Expected duration in seconds, including the mode switches the executor will add."""
+        seconds = self.total_bytes() / rate + ESTIMATED_COMMAND * len(self.steps)
+        mode = "bootloader"
+        for step in self.steps:
+            if step.is_barrier:
+                seconds += ESTIMATED_REBOOT
+                mode = "fastbootd" if step.partition == "fastboot" else "bootloader"
+            elif step.mode and step.mode != mode:
+                seconds += ESTIMATED_REBOOT
+                mode = step.mode
+        return seconds
+
+    def summary(self):
+        lines = ["Plan '%s': %d step(s), %d batch(es), %.1f MB, about %ds" % (
+            self.name, len(self.steps), len(self.batches()), self.total_bytes() / 1e6, self.estimate())]
+        for step in self.steps:
+            deps = ",".join(str(d + 1) for d in step.deps)
+            lines.append("  %2d. %s%s" % (step.index + 1, step.describe(), "  [after %s]" % deps if deps else ""))
+        return lines
+
+    def close(self):
+        for resource in self._resources:
+            resource.release()
+        self._resources = []
+
+    # --- Execution ---
+
+    def execute(self, serial, runner=fastboot_protocol.run, report=None, cancel_check=lambda: False,
+                delta_filter=None):
+        """
+        Runs the plan on one device (FlashScheduler calls this instead of running FlashJob
+        steps). report(index, count, args, status) follows the FlashScheduler statuses.
+        Returns a DeviceResult.
+        """
+        return PlanExecutor(self, serial, runner, report, cancel_check, delta_filter).run()
+
+
+def _copy_step(step):
+    copy = PlanStep(step.kind, step.partition, step.source, step.slot, step.args, step.requirements, step.mode)
+    return copy
+
+
+def _fastboot_output(result):
+    return (result.stdout or "") + (result.stderr or "")
+
+
+class _Preloader:
+    def __init__(self, native):
+        """Prepares the source of the next flash step in the background."""
+        self.native = native
+        self._threads = {}
+        self._held = []
+
+    def start(self, step):
+        if step is None or step.kind != "flash" or step.index in self._threads:
+            return
+        thread = threading.Thread(target=self._prepare, args=(step,), daemon=True)
+        self._threads[step.index] = thread
+        thread.start()
+
+    def _prepare(self, step):
+        try:
+            if fastboot_protocol.is_source(step.source):
+                if not self.native:
+                    # Extracted now, reused by the runner (acquire() is reference counted).
+                    step.source.acquire()
+                    self._held.append(step.source)
+            else:
+                _warm_page_cache(step.source)
+        except Exception as e:
+            logging.warning("Preloading %s failed: %s", step.describe(), e)
+
+    def wait(self, step):
+        thread = self._threads.pop(step.index, None)
+        if thread:
+            thread.join()
+
+    def release(self, step):
+        if step.source in self._held:
+            self._held.remove(step.source)
+            step.source.release()
+
+    def close(self):
+        for thread in self._threads.values():
+            thread.join()
+        for source in self._held:
+            source.release()
+        self._held = []
+
+
+def _warm_page_cache(path, buffer_size=4 * 1024 * 1024):
+    """Reads a file ahead so that its transfer starts from memory."""
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            return
+        buffer = bytearray(buffer_size)
+        while f.readinto(buffer):
+            pass
+
+
+class PlanExecutor:
+    def __init__(self, plan, serial, runner=fastboot_protocol.run, report=None, cancel_check=lambda: False,
+                 delta_filter=None):
+        self.plan = plan
+        self.delta_filter = delta_filter
+        self.serial = serial
+        self.runner = runner
+        self.report = report
+        self.cancel_check = cancel_check
+        self.mode = None
+        self.dirty = False  # a bootloader partition was written since the last reboot
+
+    def _run(self, args, result):
+        context = self.delta_filter.before(self.serial, args) if self.delta_filter else None
+        if context == "skip":
+            result.steps.append((list(args), 0, "skipped: unchanged since the last flash"))
+            return True
+        full = ["fastboot", "-s", self.serial] + list(args)
+        try:
+            completed = self.runner(full)
+            returncode, output = completed.returncode, _fastboot_output(completed)
+        except Exception as e:
+            returncode, output = None, str(e)
+        result.steps.append((list(args), returncode, output))
+        if self.delta_filter:
+            self.delta_filter.after(self.serial, args, context, returncode == 0)
+        return returncode == 0
+
+    def query_mode(self):
+        completed = self.runner(["fastboot", "-s", self.serial, "getvar", "is-userspace"])
+        if completed.returncode != 0:
+            raise PlanError("%s does not answer: %s" % (self.serial, _fastboot_output(completed).strip()))
+        return "fastbootd" if "is-userspace: yes" in _fastboot_output(completed) else "bootloader"
+
+    def wait_for_device(self, mode=None):
+        """Waits until the device is back in fastboot (in the given mode)."""
+        getvar_cache.invalidate(self.serial)
+        time.sleep(REBOOT_SETTLE)
+        deadline = time.monotonic() + REBOOT_TIMEOUT
+        native = fastboot_protocol.parse_tcp_serial(self.serial) is not None
+        while time.monotonic() < deadline and not self.cancel_check():
+            try:
+                # 'fastboot -s <usb serial> getvar' would wait for the device: list first.
+                if native or self.serial in list_fastboot_serials(self.runner):
+                    self.mode = self.query_mode()
+                    if mode is None or self.mode == mode:
+                        return True
+            except Exception as e:
+                logging.debug("Waiting for %s: %s", self.serial, e)
+            time.sleep(1)
+        return False
+
+    def reboot(self, target, result):
+        if not self._run(["reboot", target] if target else ["reboot"], result):
+            return False
+        self.dirty = False
+        if target is None:
+            return True
+        return self.wait_for_device("fastbootd" if target == "fastboot" else "bootloader")
+
+    def check(self, step, result):
+        info = getvar_cache.get(self.serial)
+        for key, accepted in step.requirements.items():
+            value = info.get(REQUIREMENT_VARIABLES.get(key, key))
+            if value is None or value.lower() not in [a.lower() for a in accepted]:
+                message = "requirement %s=%s not met (device: %s)" % (key, "|".join(accepted), value)
+                result.steps.append((["check", key], 1, message))
+                return False
+        result.steps.append((["check"], 0, "requirements met"))
+        return True
+
+    def slots_for(self, step):
+        if step.slot not in ("all", "other"):
+            return [step.slot]
+        info = getvar_cache.get(self.serial)
+        if (info.slot_count or 0) < 2:
+            return [None]
+        if step.slot == "all":
+            return ["a", "b"]
+        return ["b" if info.current_slot == "a" else "a"]
+
+    def run(self):
+        result = DeviceResult(self.serial)
+        start = time.monotonic()
+        steps = self.plan.steps
+        count = len(steps)
+        preloader = _Preloader(fastboot_protocol.parse_tcp_serial(self.serial) is not None)
+        try:
+            self.mode = self.query_mode()
+            preloader.start(next((s for s in steps if s.kind == "flash"), None))
+            for position, step in enumerate(steps):
+                if self.cancel_check():
+                    result.ok = False
+                    result.steps.append((step.fastboot_args(), None, "cancelled"))
+                    break
+                next_flash = next((s for s in steps[position + 1:] if s.kind == "flash"), None)
+                args = step.fastboot_args()
+                self._report(step.index + 1, count, args, "running")
+                partition = step.partition if step.kind in ("flash", "erase", "format") else None
+                with tracer.span(step.describe(), "step", serial=self.serial, partition=partition,
+                                 step="%d/%d" % (step.index + 1, count)) as span:
+                    ok = self._run_step(step, result, preloader, next_flash)
+                    span.set(ok=ok)
+                preloader.release(step)
+                self._report(step.index + 1, count, args, "ok" if ok else "failed")
+                if not ok:
+                    result.ok = False
+                    break
+        finally:
+            preloader.close()
+        result.duration = time.monotonic() - start
+        return result
+
+    def _run_step(self, step, result, preloader, next_flash):
+        if step.kind == "reboot":
+            if step.partition == "bootloader" and self.mode == "bootloader" and not self.dirty:
+                result.steps.append((step.fastboot_args(), 0, "skipped: already in the bootloader"))
+                return True
+            return self.reboot(step.partition, result)
+        if step.mode and step.mode != self.mode:
+            if not self.reboot("fastboot" if step.mode == "fastbootd" else "bootloader", result):
+                return False
+        if step.kind == "check":
+            return self.check(step, result)
+        if step.kind == "set_active":
+            return self._run(["set_active", self.slots_for(step)[0]], result)
+        if step.kind == "raw" and "update" in step.args:
+            if not self._run(step.fastboot_args(), result):
+                return False
+            # The binary ends in fastbootd when it flashed logical partitions.
+            self.mode = self.query_mode()
+            self.dirty = True
+            return True
+        if step.kind != "flash":
+            return self._run(step.fastboot_args(), result)
+        preloader.wait(step)
+        preloader.start(next_flash)
+        for slot in self.slots_for(step):
+            if not self._run(step.fastboot_args(slot), result):
+                return False
+        if step.partition in BOOTLOADER_PARTITIONS:
+            self.dirty = True
+        return True
+
+    def _report(self, index, count, args, status):
+        if self.report:
+            try:
+                self.report(index, count, args, status)
+            except Exception as e:
+                logging.error("Error in plan progress callback: %s", e)
+
+
+# --- Loading factory packages ---
+
+def parse_android_info(text):
+    """Parses 'require key=value1|value2' lines into {key: [values]}."""
+    requirements = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("require ") or "=" not in line:
+            continue
+        key, _sep, values = line[len("require "):].partition("=")
+        if key.startswith("partition-exists"):
+            continue
+        requirements[key.strip()] = [v.strip() for v in values.split("|") if v.strip()]
+    return requirements
+
+
+def parse_flash_script(text):
+    """Returns the fastboot command lines of flash-all.sh/.bat as argument lists (without 'fastboot')."""
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", "::", "rem ", "REM ")):
+            continue
+        try:
+            tokens = shlex.split(line, posix=True)
+        except ValueError:
+            continue
+        if tokens and os.path.basename(tokens[0]).lower() in ("fastboot", "fastboot.exe", "$fastboot", "%fastboot%"):
+            commands.append(tokens[1:])
+    return commands
+
+
+class _PackageFiles:
+    def __init__(self, root):
+        """Access to the files of a factory package, unpacked (directory) or zipped."""
+        self.root = root
+        self.is_zip = os.path.isfile(root) and zipfile.is_zipfile(root)
+        self.prefix = ""
+        self._infos = {}
+        if self.is_zip:
+            with zipfile.ZipFile(root) as zip_ref:
+                for info in zip_ref.infolist():
+                    self._infos[info.filename] = info
+            scripts = [name for name in self._infos if os.path.basename(name) in FLASH_SCRIPTS]
+            if not scripts:
+                raise PlanError("%s: no flash-all script found" % os.path.basename(root))
+            self.prefix = os.path.dirname(sorted(scripts, key=len)[0])
+
+    def exists(self, name):
+        if self.is_zip:
+            return self._member(name) in self._infos
+        return os.path.isfile(os.path.join(self.root, name))
+
+    def _member(self, name):
+        return "%s/%s" % (self.prefix, name) if self.prefix else name
+
+    def read_text(self, name):
+        if self.is_zip:
+            with zipfile.ZipFile(self.root) as zip_ref:
+                return zip_ref.read(self._member(name)).decode("utf-8", "replace")
+        with open(os.path.join(self.root, name), encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    def source(self, name):
+        """A path for unpacked packages, a ZipImage streaming from the package otherwise."""
+        if self.is_zip:
+            info = self._infos.get(self._member(name))
+            if info is None:
+                raise PlanError("%s not found in the package" % name)
+            return ZipImage(self.root, info)
+        path = os.path.join(self.root, name)
+        if not os.path.isfile(path):
+            raise PlanError("%s not found in the package" % name)
+        return path
+
+
+def _parse_options(tokens):
+    """Splits fastboot global options from the command: returns (options, command tokens)."""
+    options = {"wipe": False, "slot": None, "skip_reboot": False, "set_active": None}
+    rest = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "-w":
+            options["wipe"] = True
+        elif token == "--skip-reboot":
+            options["skip_reboot"] = True
+        elif token == "--slot" and i + 1 < len(tokens):
+            options["slot"] = tokens[i + 1]
+            i += 1
+        elif token.startswith("--slot="):
+            options["slot"] = token.split("=", 1)[1]
+        elif token == "--set-active":
+            options["set_active"] = "other"
+        elif token.startswith("--set-active="):
+            options["set_active"] = token.split("=", 1)[1]
+        elif token in ("-s",) and i + 1 < len(tokens):
+            i += 1
+        else:
+            rest.append(token)
+        i += 1
+    return options, rest
+
+
+def add_update(plan, package, image_zip, options):
+    """
+    Expands 'fastboot update image-*.zip' into check and flash steps. A zip with
+    super_empty.img is passed to the binary's 'update' after the check: only it
+    resizes 'super' to the package layout (update-super) before the logical flashes.
+    """
+    if package.is_zip:
+        # The nested zip is extracted once (it is read member by member afterwards).
+        holder = package.source(image_zip)
+        path = holder.acquire()
+        plan._resources.append(holder)
+    else:
+        path = package.source(image_zip)
+    with zipfile.ZipFile(path) as zip_ref:
+        infos = {os.path.basename(i.filename): i for i in zip_ref.infolist() if not i.is_dir()}
+        if ANDROID_INFO in infos:
+            requirements = parse_android_info(zip_ref.read(infos[ANDROID_INFO]).decode("utf-8", "replace"))
+            if requirements:
+                plan.add(PlanStep("check", requirements=requirements))
+    if SUPER_EMPTY in infos:
+        args = (["-w"] if options["wipe"] else []) + (["--slot", options["slot"]] if options["slot"] else [])
+        plan.add(PlanStep("raw", source=path, args=args + ["--skip-reboot", "update", path], mode="bootloader"))
+    else:
+        images = [name for name in infos if name.endswith(".img")]
+        rank = {name: i for i, name in enumerate(UPDATE_ORDER)}
+        images.sort(key=lambda name: (rank.get(name[:-4], len(rank)), name))
+        for name in images:
+            partition = name[:-4]
+            slot = options["slot"]
+            if partition == "system_other":
+                partition, slot = "system", "other"
+            plan.add(PlanStep("flash", partition, ZipImage(path, infos[name]), slot, mode="bootloader"))
+        if options["wipe"]:
+            for partition in WIPE_PARTITIONS:
+                plan.add(PlanStep("format", partition, mode="bootloader"))
+    if not options["skip_reboot"]:
+        plan.add(PlanStep("reboot"))
+
+
+def load_factory(path):
+    """
+    Reads a factory package into a FlashPlan. path can be the package zip, its unpacked
+    directory or a file of that directory (flash-all.sh...).
+    """
+    if os.path.isfile(path) and not zipfile.is_zipfile(path):
+        path = os.path.dirname(path)
+    package = _PackageFiles(path)
+    script = next((name for name in FLASH_SCRIPTS if package.exists(name)), None)
+    if script is None:
+        raise PlanError("%s: no flash-all script found" % path)
+    plan = FlashPlan(os.path.basename(os.path.normpath(path)))
+    try:
+        for tokens in parse_flash_script(package.read_text(script)):
+            options, command = _parse_options(tokens)
+            if not command:
+                if options["set_active"]:
+                    plan.add(PlanStep("set_active", slot=options["set_active"], mode="bootloader"))
+                continue
+            name = command[0]
+            if name == "flash" and len(command) == 3:
+                plan.add(PlanStep("flash", command[1], package.source(command[2]), options["slot"],
+                                  mode="bootloader"))
+            elif name == "erase" and len(command) >= 2:
+                plan.add(PlanStep("erase", command[-1], slot=options["slot"]))
+            elif name.partition(":")[0] == "format" and len(command) >= 2:
+                plan.add(PlanStep("format", command[-1], slot=options["slot"], args=[name]))
+            elif name == "reboot-bootloader" or command == ["reboot", "bootloader"]:
+                plan.add(PlanStep("reboot", "bootloader"))
+            elif command == ["reboot", "fastboot"]:
+                plan.add(PlanStep("reboot", "fastboot"))
+            elif command == ["reboot"]:
+                plan.add(PlanStep("reboot"))
+            elif name == "update" and len(command) == 2:
+                add_update(plan, package, command[1], options)
+            elif name == "set_active" and len(command) == 2:
+                plan.add(PlanStep("set_active", slot=command[1], mode="bootloader"))
+            else:
+                plan.add(PlanStep("raw", args=command))
+            if options["set_active"] and name != "update":
+                plan.add(PlanStep("set_active", slot=options["set_active"], mode="bootloader"))
+    except BaseException:
+        plan.close()
+        raise
+    return plan
+
+
+def is_factory_package(path):
+    """True for a flash-all script, an unpacked factory directory or a zip containing a flash-all script."""
+    if os.path.isdir(path):
+        return any(os.path.isfile(os.path.join(path, name)) for name in FLASH_SCRIPTS)
+    if os.path.basename(path) in FLASH_SCRIPTS:
+        return True
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zip_ref:
+            return any(os.path.basename(name) in FLASH_SCRIPTS for name in zip_ref.namelist())
+    return False
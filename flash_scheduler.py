@@ -0,0 +1,149 @@
+#This module contains the FlashScheduler class, which runs the same flash job on
+#several devices in parallel ('fastboot -s <serial>'), with a concurrency limit and
+#per-device progress and results.
+
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import fastboot_protocol
+import job_executor
+from device_watcher import parse_device_list
+from tracing import tracer
+
+DEFAULT_MAX_PARALLEL = 4
+
+
+class FlashJob:
+    def __init__(self, name, steps=None, stop_on_error=True):
+        """
+        A list of fastboot steps, each one given as its arguments without the
+        'fastboot -s <serial>' prefix, e.g. ["flash", "boot", "boot.img"].
+        """
+        self.name = name
+        self.steps = list(steps or [])
+        self.stop_on_error = stop_on_error
+
+    def add(self, *args):
+        self.steps.append(list(args))
+
+
+class DeviceResult:
+    def __init__(self, serial):
+        """Outcome of a job on one device: one (args, returncode, output) entry per step run."""
+        self.serial = serial
+        self.ok = True
+        self.steps = []
+        self.duration = 0.0
+
+    def __repr__(self):
+        return "DeviceResult(%r, ok=%r, steps=%d, duration=%.1fs)" % (
+            self.serial, self.ok, len(self.steps), self.duration)
+
+
+def list_fastboot_serials(runner=fastboot_protocol.run):
+    """Returns the serials listed by 'fastboot devices'."""
+    result = runner(["fastboot", "devices"])
+    return list(parse_device_list(result.stdout))
+
+
+class FlashScheduler:
+    def __init__(self, max_parallel=DEFAULT_MAX_PARALLEL, runner=fastboot_protocol.run,
+                 progress_callback=None, cancel_check=lambda: False, delta_filter=None):
+        """
+        progress_callback(serial, step_index, step_count, args, status) is called from the
+        worker threads with status "running", "ok", "failed" or "skipped". delta_filter
+        (flash_ledger.DeltaFilter) skips unchanged images and keeps the ledger up to date.
+        """
+        self.max_parallel = max_parallel
+        self.runner = runner
+        self.progress_callback = progress_callback
+        self.cancel_check = cancel_check
+        self.delta_filter = delta_filter
+
+    def _cancelled(self):
+        # Run from a job_executor job, cancelling the job also stops the devices' steps.
+        return self.cancel_check() or job_executor.cancel_requested()
+
+    def _report(self, serial, index, count, args, status):
+        if self.progress_callback:
+            try:
+                self.progress_callback(serial, index, count, args, status)
+            except Exception as e:
+                logging.error("Error in flash progress callback: %s", e)
+
+    def run_device(self, job, serial):
+        """Runs every step of the job on one device."""
+        with tracer.span(job.name, "job", serial=serial) as span:
+            result = self._run_device(job, serial)
+            span.set(ok=result.ok)
+        return result
+
+    def _run_device(self, job, serial):
+        if hasattr(job, "execute"):
+            # Jobs with their own executor (flash_plan.FlashPlan) only borrow the runner and callbacks.
+            return job.execute(serial, self.runner, lambda index, count, args, status:
+                               self._report(serial, index, count, args, status), self._cancelled,
+                               self.delta_filter)
+        result = DeviceResult(serial)
+        start = time.monotonic()
+        count = len(job.steps)
+        for index, step in enumerate(job.steps, 1):
+            if self._cancelled():
+                result.ok = False
+                result.steps.append((step, None, "cancelled"))
+                break
+            context = self.delta_filter.before(serial, step) if self.delta_filter else None
+            if context == "skip":
+                result.steps.append((step, 0, "skipped: unchanged since the last flash"))
+                self._report(serial, index, count, step, "skipped")
+                continue
+            args = ["fastboot", "-s", serial] + list(step)
+            self._report(serial, index, count, step, "running")
+            with tracer.span(" ".join(str(arg) for arg in step[:2]), "step", serial=serial,
+                             step="%d/%d" % (index, count)) as span:
+                try:
+                    completed = self.runner(args)
+                    returncode, output = completed.returncode, completed.stdout + completed.stderr
+                except Exception as e:
+                    returncode, output = None, str(e)
+                span.set(exit_code=returncode)
+            result.steps.append((step, returncode, output))
+            if self.delta_filter:
+                self.delta_filter.after(serial, step, context, returncode == 0)
+            if returncode == 0:
+                self._report(serial, index, count, step, "ok")
+            else:
+                result.ok = False
+                self._report(serial, index, count, step, "failed")
+                if job.stop_on_error:
+                    break
+        result.duration = time.monotonic() - start
+        return result
+
+    def run(self, job, serials):
+        """Runs the job on all serials, at most max_parallel at a time. Returns {serial: DeviceResult}."""
+        serials = list(dict.fromkeys(serials))
+        if not serials:
+            return {}
+        with tracer.span(job.name, "job", devices=len(serials), max_parallel=self.max_parallel):
+            return self._run(job, serials)
+
+    def _run(self, job, serials):
+        results = {}
+        lock = threading.Lock()
+        parent = job_executor.current_job()
+
+        def worker(serial):
+            with job_executor.adopt(parent):
+                device_result = self.run_device(job, serial)
+            with lock:
+                results[serial] = device_result
+            return device_result
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel, len(serials))),
+                                thread_name_prefix="flash") as executor:
+            for future in [executor.submit(worker, serial) for serial in serials]:
+                future.result()
+        return {serial: results[serial] for serial in serials}
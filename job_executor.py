@@ -0,0 +1,364 @@
+#This module contains JobExecutor, which runs the front-end's background work. Each job
+#is queued under a kind ("tools", "device", "query"...) and at most limit(kind) jobs of
+#a kind run at once, on worker threads that exit as soon as their queue is empty.
+#submit() returns a Job handle (state, result, wait, cancel). Cancelling a job sets the
+#flag its download/extract/hash loops poll through job.cancelled, and stops the process
+#groups of the commands started from it with popen()/run(), children included.
+
+import os
+import time
+import signal
+import itertools
+import threading
+import subprocess
+import contextlib
+import logging
+from collections import deque
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+TERMINATE_GRACE = 3    # seconds between SIGTERM and SIGKILL of a command's process group
+POLL_INTERVAL = 0.1    # seconds between two cancellation checks while a command runs
+
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised by run() (and may be raised by job functions) when the job is cancelled."""
+
+
+def current_job():
+    """The Job running on this thread (see JobExecutor and adopt()), or None."""
+    return getattr(_local, "job", None)
+
+
+def cancel_requested():
+    """True if the job running on this thread has been cancelled."""
+    job = getattr(_local, "job", None)
+    return job is not None and job.cancelled()
+
+
+@contextlib.contextmanager
+def adopt(job):
+    """Runs the block as part of 'job' (for helper threads started by a job, e.g. per-device workers)."""
+    previous = getattr(_local, "job", None)
+    _local.job = job
+    try:
+        yield job
+    finally:
+        _local.job = previous
+
+
+class Job:
+    def __init__(self, executor, kind, function, args, kwargs, name=None):
+        self.id = next(_ids)
+        self.kind = kind
+        self.name = name or getattr(function, "__name__", "job")
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._executor = executor
+        self._call = (function, args, kwargs)
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._callbacks = []
+
+    def cancelled(self):
+        """True once cancel() was called; pass it as the cancel_check of long loops."""
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """
+        Requests cancellation. A queued job is dropped; a running one sees cancelled()
+        become true and the process groups of its commands get SIGTERM right away.
+        Returns False if the job had already finished.
+        """
+        with self._lock:
+            if self.state in FINAL_STATES:
+                return False
+            self._cancel.set()
+            queued = self.state == QUEUED
+            processes = list(self._processes)
+        if queued and self._executor._discard(self):
+            self._finish(CANCELLED)
+        for process in processes:
+            _signal_group(process)
+        return True
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for the job to finish. Returns its result (None if it failed or was cancelled)."""
+        self._done.wait(timeout)
+        return self.result
+
+    def add_done_callback(self, callback):
+        """callback(job) is called once the job has finished (right away if it already has)."""
+        with self._lock:
+            if self.state not in FINAL_STATES:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+    def _attach(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._cancel.is_set()
+        if cancelled:
+            _signal_group(process)
+
+    def _detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def _finish(self, state, result=None, error=None):
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished = time.monotonic()
+            callbacks, self._callbacks = self._callbacks, []
+        self._done.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logging.error("Error in job callback: %s", e)
+
+    def __repr__(self):
+        return "Job(%d, %r, kind=%r, state=%r)" % (self.id, self.name, self.kind, self.state)
+
+
+class JobExecutor:
+    def __init__(self, limits=None, default_limit=1):
+        """limits maps a job kind to its maximum number of concurrent jobs (default_limit otherwise)."""
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._workers = {}
+        self._threads = set()
+        self._active = []
+        self._closed = False
+
+    def limit(self, kind):
+        return max(1, self.limits.get(kind, self.default_limit))
+
+    def submit(self, kind, function, *args, name=None, **kwargs):
+        """Queues function(*args, **kwargs) as a job of the given kind. Returns its Job."""
+        job = Job(self, kind, function, args, kwargs, name)
+        thread = None
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("executor is shut down")
+            self._queues.setdefault(kind, deque()).append(job)
+            self._active.append(job)
+            if self._workers.get(kind, 0) < self.limit(kind):
+                self._workers[kind] = self._workers.get(kind, 0) + 1
+                thread = threading.Thread(target=self._worker, args=(kind,), name="job-" + kind, daemon=True)
+                self._threads.add(thread)
+        if thread is not None:
+            thread.start()
+        return job
+
+    def _worker(self, kind):
+        while True:
+            with self._lock:
+                queue = self._queues[kind]
+                if not queue:
+                    self._workers[kind] -= 1
+                    self._threads.discard(threading.current_thread())
+                    return
+                job = queue.popleft()
+            self._run(job)
+
+    def _run(self, job):
+        with job._lock:
+            if job._cancel.is_set():
+                job.state = CANCELLED
+            else:
+                job.state = RUNNING
+                job.started = time.monotonic()
+        if job.state == CANCELLED:
+            self._forget(job)
+            job._finish(CANCELLED)
+            return
+        function, args, kwargs = job._call
+        state, result, error = DONE, None, None
+        with adopt(job):
+            try:
+                result = function(*args, **kwargs)
+                if job.cancelled():
+                    state = CANCELLED
+            except JobCancelled:
+                state = CANCELLED
+            except Exception as e:
+                state, error = (CANCELLED if job.cancelled() else FAILED), e
+                if state == FAILED:
+                    logging.exception("Job %s failed: %s", job.name, e)
+        self._forget(job)
+        job._finish(state, result, error)
+
+    def _discard(self, job):
+        """Removes a queued job. Returns False if a worker already took it."""
+        with self._lock:
+            queue = self._queues.get(job.kind)
+            if not queue or job not in queue:
+                return False
+            queue.remove(job)
+            if job in self._active:
+                self._active.remove(job)
+            return True
+
+    def _forget(self, job):
+        with self._lock:
+            if job in self._active:
+                self._active.remove(job)
+
+    def jobs(self, kind=None):
+        """The queued and running jobs (of one kind, or all), oldest first."""
+        with self._lock:
+            return [job for job in self._active if kind is None or job.kind == kind]
+
+    def cancel_all(self, kind=None):
+        """Cancels the queued and running jobs. Returns how many were cancelled."""
+        return sum(1 for job in self.jobs(kind) if job.cancel())
+
+    def shutdown(self, cancel=True, timeout=None):
+        """
+        Refuses new jobs, cancels the pending ones if asked, and waits for the worker
+        threads. Returns True if they all exited within the timeout.
+        """
+        with self._lock:
+            self._closed = True
+        if cancel:
+            self.cancel_all()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                return True
+            for thread in threads:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                thread.join(remaining)
+                if thread.is_alive():
+                    logging.warning("Job thread %s still running after shutdown.", thread.name)
+                    return False
+                with self._lock:
+                    self._threads.discard(thread)
+
+
+# --- Commands in their own process group ---
+
+def popen(args, **kwargs):
+    """
+    subprocess.Popen in a new process group (session on POSIX), so that the command
+    and its children can be stopped together. The process is attached to the current
+    job: cancelling the job signals its group. Call release() once it has exited.
+    """
+    if os.name == "nt":
+        kwargs.setdefault("creationflags", subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs.setdefault("start_new_session", True)
+    process = subprocess.Popen(args, **kwargs)
+    job = current_job()
+    if job is not None:
+        job._attach(process)
+    return process
+
+
+def release(process):
+    job = current_job()
+    if job is not None:
+        job._detach(process)
+
+
+def _signal_group(process, kill=False):
+    try:
+        if os.name == "nt":
+            if kill:
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+            else:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except (OSError, ValueError):
+        # Group already gone, or not a group leader (started by plain Popen).
+        try:
+            process.kill() if kill else process.terminate()
+        except OSError:
+            pass
+
+
+def terminate(process, grace=TERMINATE_GRACE):
+    """Stops the process and its children: SIGTERM to the group, SIGKILL after 'grace' seconds."""
+    _signal_group(process)
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        _signal_group(process, kill=True)
+        process.wait()
+    else:
+        # The leader is gone; children that ignored SIGTERM must not outlive it.
+        if os.name != "nt":
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+def run(args, timeout=None, cancel_check=None, interactive=False):
+    """
+    subprocess.run(args, capture_output=True, text=True, timeout=timeout) in its own
+    process group, stopped (children included) when cancel_check() becomes true, by
+    default when the current job is cancelled. Raises JobCancelled in that case and
+    subprocess.TimeoutExpired on timeout, as subprocess.run does.
+    interactive keeps the caller's session and stdin, so that sudo can ask for a password
+    on the terminal; cancelling then stops the process itself only.
+    """
+    cancel_check = cancel_check or cancel_requested
+    if interactive:
+        process = popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                        **({} if os.name == "nt" else {"start_new_session": False}))
+    else:
+        process = popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True)
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_check():
+                    terminate(process)
+                    process.communicate()
+                    raise JobCancelled("%s cancelled" % " ".join(str(arg) for arg in args))
+                if deadline and time.monotonic() > deadline:
+                    terminate(process)
+                    process.communicate()
+                    raise subprocess.TimeoutExpired(args, timeout)
+    finally:
+        release(process)
+    if process.returncode != 0 and cancel_check():
+        # Stopped by Job.cancel() before this loop noticed the cancellation.
+        raise JobCancelled("%s cancelled" % " ".join(str(arg) for arg in args))
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
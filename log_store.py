@@ -0,0 +1,98 @@
+#This module contains LogStore, a bounded, line-indexed ring buffer for the UI log.
+#Appends are O(1), the oldest lines are dropped once the cap is reached, and views
+#fetch only the lines they have not shown yet. LogQueue carries log records from
+#worker threads to a UI loop that drains them in batches.
+
+import threading
+from collections import deque
+
+DEFAULT_MAX_LINES = 10000
+
+
+class LogStore:
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        self.max_lines = max_lines
+        self._buffer = [None] * max_lines
+        self._start = 0
+        self._count = 0
+        self.total = 0  # number of lines ever appended
+        self._lock = threading.Lock()
+
+    def append(self, message):
+        """Appends a message; multi-line messages are stored one line per entry."""
+        lines = message.split("\n")
+        with self._lock:
+            for line in lines:
+                end = (self._start + self._count) % self.max_lines
+                self._buffer[end] = line
+                if self._count < self.max_lines:
+                    self._count += 1
+                else:
+                    self._start = (self._start + 1) % self.max_lines
+            self.total += len(lines)
+        return len(lines)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        with self._lock:
+            if index < 0:
+                index += self._count
+            if not 0 <= index < self._count:
+                raise IndexError("log line index out of range")
+            return self._buffer[(self._start + index) % self.max_lines]
+
+    def since(self, total):
+        """
+        Returns (total, lines): the current line counter and the lines appended after
+        'total' (the value returned by a previous call), at most max_lines of them.
+        """
+        with self._lock:
+            missing = min(self.total - total, self._count)
+            first = self._count - missing
+            lines = [self._buffer[(self._start + i) % self.max_lines] for i in range(first, self._count)]
+            return self.total, lines
+
+    def lines(self):
+        """Returns a snapshot of the stored lines, oldest first."""
+        return self.since(0)[1]
+
+    def write_to(self, f, batch=1000):
+        """Writes the stored lines to a text file object in batches."""
+        lines = self.lines()
+        for offset in range(0, len(lines), batch):
+            f.write("\n".join(lines[offset:offset + batch]))
+            f.write("\n")
+
+    def clear(self):
+        with self._lock:
+            self._buffer = [None] * self.max_lines
+            self._start = 0
+            self._count = 0
+
+
+class LogQueue:
+    def __init__(self):
+        """
+        Multi-producer queue of log messages. deque.append and deque.popleft are atomic,
+        so worker threads never wait on the UI thread.
+        """
+        self._items = deque()
+
+    def push(self, message):
+        self._items.append(message)
+
+    def drain(self, limit=None):
+        """Removes and returns up to 'limit' queued messages (all of them if None)."""
+        items = []
+        pop = self._items.popleft
+        try:
+            while limit is None or len(items) < limit:
+                items.append(pop())
+        except IndexError:
+            pass
+        return items
+
+    def __len__(self):
+        return len(self._items)
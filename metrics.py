@@ -0,0 +1,356 @@
+#This module contains the station metrics: counters, gauges and histograms with labels,
+#rendered in the Prometheus text format (version 0.0.4), and an optional HTTP endpoint
+#serving them on /metrics. It is enabled by FASTBOOTGUI_METRICS=[host:]port (host
+#defaults to 127.0.0.1); disabled, recording a value costs one attribute test and no
+#server is started. The front-ends record at the places where they log the same events.
+
+import os
+import math
+import time
+import logging
+import threading
+
+from tracing import describe_command
+
+METRICS_ENV = "FASTBOOTGUI_METRICS"
+DEFAULT_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Command durations range from a 10 ms 'getvar' to a 10 min 'flash super'.
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def parse_address(value):
+    """'9100' -> ('127.0.0.1', 9100), '0.0.0.0:9100' -> ('0.0.0.0', 9100); None if invalid."""
+    host, sep, port = value.rpartition(":")
+    if not port.isdigit():
+        return None
+    return (host if sep and host else DEFAULT_HOST), int(port)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+        return repr(value)
+    return str(value)
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + "}"
+
+
+class Registry:
+    def __init__(self, enabled=False, address=None):
+        self.enabled = enabled
+        self.address = address
+        self.metrics = []
+        self.server = None
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        return self._add(Histogram(self, name, help, labels, buckets))
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, registry, name, help, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {} if self.labels else {(): self._initial()}
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ["%s%s %s" % (self.name, _labels_text(self.labels, key), _format_value(value))
+                for key, value in values]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, registry, name, help, labels):
+        super().__init__(registry, name, help, labels)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Reads the value from function() at each scrape (None: no sample)."""
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception as e:
+                logging.debug("Metric %s%s not collected: %s", self.name, key, e)
+                continue
+            if value is not None:
+                values[key] = value
+        return ["%s%s %s" % (self.name, _labels_text(self.labels, key), _format_value(value))
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels, buckets):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, help, labels)
+
+    def _initial(self):
+        # Per-bucket counts (not cumulative), then sum and count.
+        return [[0] * len(self.buckets), 0.0, 0]
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._initial()
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append("%s_bucket%s %d" % (self.name, _labels_text(self.labels, key, [("le", _format_value(float(bound)))]),
+                                                 cumulative))
+            lines.append("%s_bucket%s %d" % (self.name, _labels_text(self.labels, key, [("le", "+Inf")]), count))
+            lines.append("%s_sum%s %s" % (self.name, _labels_text(self.labels, key), _format_value(total)))
+            lines.append("%s_count%s %d" % (self.name, _labels_text(self.labels, key), count))
+        return lines
+
+
+def _handler_class():
+    # http.server (and the http.client, email and socketserver modules it loads) is only
+    # imported once the endpoint is enabled.
+    from http.server import BaseHTTPRequestHandler
+
+    class _Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404, "see /metrics")
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return _Handler
+
+
+class MetricsServer:
+    def __init__(self, registry, host=DEFAULT_HOST, port=0):
+        """Serves registry.render() on http://host:port/metrics from a daemon thread."""
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((host, port), _handler_class())
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d/metrics" % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def from_environment():
+    value = os.environ.get(METRICS_ENV, "")
+    if value in ("", "0"):
+        return Registry()
+    address = parse_address(value)
+    if address is None:
+        logging.warning("%s=%r is not a [host:]port, metrics disabled.", METRICS_ENV, value)
+        return Registry()
+    return Registry(True, address)
+
+
+# Shared registry and the station metrics.
+registry = from_environment()
+
+devices = registry.gauge("fastbootgui_devices", "Devices connected, by mode (adb, fastboot).", ("mode",))
+flashes_started = registry.counter("fastbootgui_flashes_started_total", "Flash commands started.", ("partition",))
+flashes_succeeded = registry.counter("fastbootgui_flashes_succeeded_total", "Flash commands that succeeded.",
+                                     ("partition",))
+flashes_failed = registry.counter("fastbootgui_flashes_failed_total", "Flash commands that failed or were cancelled.",
+                                  ("partition",))
+bytes_transferred = registry.counter("fastbootgui_bytes_transferred_total",
+                                     "Bytes flashed, sideloaded or downloaded successfully.", ("kind",))
+command_duration = registry.histogram("fastbootgui_command_duration_seconds", "Duration of adb/fastboot commands.",
+                                      ("command",))
+commands_failed = registry.counter("fastbootgui_commands_failed_total",
+                                   "Commands that returned a non-zero code, were cancelled or raised.", ("command",))
+commands_folded = registry.counter("fastbootgui_commands_folded_total",
+                                   "Read-only queries answered by an identical one already in flight.", ("command",))
+cache_requests = registry.counter("fastbootgui_cache_requests_total",
+                                  "Artifact cache lookups (download: platform-tools, extract: firmware archives).",
+                                  ("cache", "result"))
+cache_hit_ratio = registry.gauge("fastbootgui_cache_hit_ratio", "Share of artifact cache lookups that hit.", ("cache",))
+log_queue_depth = registry.gauge("fastbootgui_log_queue_depth", "Log lines waiting to be shown by the UI.")
+
+
+def _hit_ratio(cache):
+    hits = cache_requests.value(cache=cache, result="hit")
+    total = hits + cache_requests.value(cache=cache, result="miss")
+    return hits / total if total else None
+
+
+for _cache in ("download", "extract"):
+    cache_hit_ratio.set_function(lambda cache=_cache: _hit_ratio(cache), cache=_cache)
+
+
+class _NullMeasure:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def done(self, returncode):
+        pass
+
+
+NULL_MEASURE = _NullMeasure()
+
+
+class _CommandMeasure:
+    def __init__(self, args):
+        self.command, info = describe_command(args)
+        self.partition = info.get("partition", "unknown")
+        self.bytes = info.get("bytes")
+        subcommand = self.command.rpartition(" ")[2]
+        self.kind = subcommand if subcommand in ("flash", "sideload") else None
+        self.returncode = None
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        if self.kind == "flash":
+            flashes_started.inc(partition=self.partition)
+        return self
+
+    def done(self, returncode):
+        self.returncode = returncode
+
+    def __exit__(self, exc_type, exc, tb):
+        command_duration.observe(time.monotonic() - self.start, command=self.command)
+        ok = exc_type is None and self.returncode == 0
+        if not ok:
+            commands_failed.inc(command=self.command)
+        if self.kind == "flash":
+            (flashes_succeeded if ok else flashes_failed).inc(partition=self.partition)
+        if ok and self.kind and self.bytes:
+            bytes_transferred.inc(self.bytes, kind=self.kind)
+        return False
+
+
+def command(args):
+    """
+    Context manager measuring an adb/fastboot command line: duration per command type,
+    failures, flashes per partition and bytes sent. Call done(returncode) inside it.
+    """
+    if not registry.enabled:
+        return NULL_MEASURE
+    return _CommandMeasure(args)
+
+
+def start_server():
+    """Starts the endpoint if FASTBOOTGUI_METRICS is set (once). Returns the server or None."""
+    if not registry.enabled or registry.server is not None:
+        return registry.server
+    host, port = registry.address
+    try:
+        registry.server = MetricsServer(registry, host, port).start()
+    except OSError as e:
+        logging.warning("Could not serve metrics on %s:%d: %s", host, port, e)
+        return None
+    logging.info("Metrics served on %s", registry.server.url)
+    return registry.server
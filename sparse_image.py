@@ -0,0 +1,197 @@
+#This module contains the Android sparse image reader/splitter. Large images are
+#cut into sparse parts no bigger than the device's max-download-size; the parts are
+#laid out from the chunk headers alone and read their data from the source file only
+#when they are sent.
+
+import os
+import struct
+
+SPARSE_MAGIC = 0xED26FF3A
+FILE_HEADER = struct.Struct("<IHHHHIIII")
+CHUNK_HEADER = struct.Struct("<HHII")
+CHUNK_RAW = 0xCAC1
+CHUNK_FILL = 0xCAC2
+CHUNK_DONT_CARE = 0xCAC3
+CHUNK_CRC32 = 0xCAC4
+DEFAULT_BLOCK_SIZE = 4096
+READ_SIZE = 1024 * 1024
+
+
+class SparseError(Exception):
+    """Raised when a sparse image is malformed."""
+
+
+def is_sparse(path):
+    """Checks the sparse magic at the start of the file."""
+    with open(path, "rb") as f:
+        header = f.read(4)
+    return len(header) == 4 and struct.unpack("<I", header)[0] == SPARSE_MAGIC
+
+
+def parse_max_download_size(value):
+    """Parses the 'max-download-size' variable ('0x10000000' or decimal)."""
+    return int(value.strip(), 0)
+
+
+def read_layout(path):
+    """Returns (block_size, total_blocks, chunk generator) for a raw or sparse image."""
+    size = os.path.getsize(path)
+    if not is_sparse(path):
+        # A partial last block is padded with zeros when the part is sent.
+        total_blocks = -(-size // DEFAULT_BLOCK_SIZE)
+
+        def raw_chunks():
+            if total_blocks:
+                yield CHUNK_RAW, total_blocks, 0
+        return DEFAULT_BLOCK_SIZE, total_blocks, raw_chunks()
+
+    with open(path, "rb") as f:
+        header = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    (magic, major, minor, file_header_size, chunk_header_size,
+     block_size, total_blocks, total_chunks, _checksum) = header
+    if major != 1:
+        raise SparseError("unsupported sparse version %d.%d" % (major, minor))
+
+    def sparse_chunks():
+        with open(path, "rb") as f:
+            offset = file_header_size
+            for _ in range(total_chunks):
+                f.seek(offset)
+                chunk_type, _reserved, blocks, total_size = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+                data_offset = offset + chunk_header_size
+                data_size = total_size - chunk_header_size
+                if chunk_type == CHUNK_RAW:
+                    if data_size != blocks * block_size:
+                        raise SparseError("raw chunk size mismatch at offset %d" % offset)
+                    yield CHUNK_RAW, blocks, data_offset
+                elif chunk_type == CHUNK_FILL:
+                    f.seek(data_offset)
+                    yield CHUNK_FILL, blocks, f.read(4)
+                elif chunk_type == CHUNK_DONT_CARE:
+                    yield CHUNK_DONT_CARE, blocks, None
+                elif chunk_type != CHUNK_CRC32:
+                    raise SparseError("unknown chunk type 0x%04x" % chunk_type)
+                offset += total_size
+    return block_size, total_blocks, sparse_chunks()
+
+
+class SparsePart:
+    def __init__(self, path, block_size, total_blocks):
+        """
+        One sparse image covering part of the output. Iterating over it yields its bytes;
+        data buffers are reused, so each one must be consumed before the next is requested.
+        """
+        self.path = path
+        self.block_size = block_size
+        self.total_blocks = total_blocks
+        self.index = 0
+        self.count = 0
+        self.entries = []
+        self.size = FILE_HEADER.size
+        self.blocks = 0
+
+    def add(self, chunk_type, blocks, payload):
+        self.entries.append((chunk_type, blocks, payload))
+        self.size += CHUNK_HEADER.size
+        if chunk_type == CHUNK_RAW:
+            self.size += blocks * self.block_size
+        elif chunk_type == CHUNK_FILL:
+            self.size += 4
+        self.blocks += blocks
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        yield FILE_HEADER.pack(SPARSE_MAGIC, 1, 0, FILE_HEADER.size, CHUNK_HEADER.size,
+                               self.block_size, self.total_blocks, len(self.entries), 0)
+        with open(self.path, "rb") as f:
+            buffer = bytearray(READ_SIZE)
+            view = memoryview(buffer)
+            for chunk_type, blocks, payload in self.entries:
+                data_size = {CHUNK_RAW: blocks * self.block_size, CHUNK_FILL: 4}.get(chunk_type, 0)
+                yield CHUNK_HEADER.pack(chunk_type, 0, blocks, CHUNK_HEADER.size + data_size)
+                if chunk_type == CHUNK_FILL:
+                    yield payload
+                elif chunk_type == CHUNK_RAW:
+                    f.seek(payload)
+                    remaining = data_size
+                    while remaining:
+                        count = f.readinto(view[:min(READ_SIZE, remaining)])
+                        if not count:
+                            if remaining >= self.block_size:
+                                raise SparseError("image truncated at offset %d" % f.tell())
+                            yield bytes(remaining)
+                            break
+                        remaining -= count
+                        yield view[:count]
+
+
+def split(path, max_size):
+    """
+    Returns the list of SparsePart objects no bigger than max_size bytes. Each part is a complete
+    sparse image: blocks written by other parts are skipped with DONT_CARE chunks.
+    Only chunk headers are read here; data is read when a part is iterated. The parts are
+    all laid out first so that each one knows its index and the part count.
+    """
+    block_size, total_blocks, chunks = read_layout(path)
+    # Room for the file header and the leading/trailing DONT_CARE chunks.
+    overhead = FILE_HEADER.size + 2 * CHUNK_HEADER.size
+    if max_size < overhead + CHUNK_HEADER.size + block_size:
+        raise SparseError("max download size %d is too small" % max_size)
+
+    parts = []
+    position = 0
+    part = None
+
+    def new_part():
+        p = SparsePart(path, block_size, total_blocks)
+        if position:
+            p.add(CHUNK_DONT_CARE, position, None)
+        return p
+
+    def close_part(p):
+        if position < total_blocks:
+            p.add(CHUNK_DONT_CARE, total_blocks - position, None)
+        parts.append(p)
+
+    for chunk_type, blocks, payload in chunks:
+        if chunk_type == CHUNK_DONT_CARE:
+            # Skipped blocks never need a part of their own.
+            if part is not None:
+                if max_size - part.size - 2 * CHUNK_HEADER.size >= 0:
+                    part.add(chunk_type, blocks, None)
+                else:
+                    close_part(part)
+                    part = None
+            position += blocks
+            continue
+        while blocks:
+            if part is None:
+                part = new_part()
+            room = max_size - part.size - 2 * CHUNK_HEADER.size
+            if chunk_type == CHUNK_RAW:
+                take = min(blocks, room // block_size)
+            else:
+                take = blocks if room >= 4 else 0
+            if take <= 0:
+                close_part(part)
+                part = None
+                continue
+            part.add(chunk_type, take, payload)
+            if chunk_type == CHUNK_RAW:
+                payload += take * block_size
+            blocks -= take
+            position += take
+    if part is not None or not parts:
+        close_part(part or new_part())
+
+    for index, p in enumerate(parts, 1):
+        p.index = index
+        p.count = len(parts)
+    return parts
+
+
+def needs_split(path, max_size):
+    """True if the image is bigger than max_size and must be sent through split()."""
+    return os.path.getsize(path) > max_size
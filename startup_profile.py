@@ -0,0 +1,72 @@
+#This module contains StartupProfiler, which times the start of a front-end phase by
+#phase (imports, widget construction, first frame, deferred panels) and logs a report
+#once the window is interactive. It is enabled by FASTBOOTGUI_PROFILE_STARTUP=1 (or a
+#.json path to also write the report there); disabled, a phase costs one attribute test.
+
+import os
+import time
+import json
+import logging
+import contextlib
+
+PROFILE_ENV = "FASTBOOTGUI_PROFILE_STARTUP"
+
+
+class StartupProfiler:
+    def __init__(self, enabled=False, output=None):
+        self.enabled = enabled
+        self.output = output
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.marks = []
+        self.reported = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Records the duration of the enclosed block under 'name'."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.origin, time.perf_counter() - start))
+
+    def mark(self, name):
+        """Records the time elapsed since the profiler was created (e.g. 'first frame')."""
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.origin))
+
+    def as_dict(self):
+        return {"phases": [{"name": name, "start_ms": round(start * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                           for name, start, duration in self.phases],
+                "marks": {name: round(at * 1000, 2) for name, at in self.marks}}
+
+    def report(self, log=logging.info):
+        """Logs the phases (once) and writes them to the JSON output if one is set."""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        log("Startup profile:")
+        for name, start, duration in self.phases:
+            log("  %-28s %8.1f ms  (at %.1f ms)" % (name, duration * 1000, start * 1000))
+        for name, at in self.marks:
+            log("  %-28s at %.1f ms" % (name, at * 1000))
+        if self.output:
+            try:
+                with open(self.output, "w", encoding="utf-8") as f:
+                    json.dump(self.as_dict(), f, indent=1)
+            except OSError as e:
+                logging.warning("Could not write the startup profile to %s: %s", self.output, e)
+
+
+def from_environment():
+    value = os.environ.get(PROFILE_ENV, "")
+    if value in ("", "0"):
+        return StartupProfiler()
+    return StartupProfiler(True, value if value.lower().endswith(".json") else None)
+
+
+# Shared profiler; created when the front-end imports this module, which it does first.
+startup_profiler = from_environment()
@@ -0,0 +1,240 @@
+#Tests of adb_client against a stand-in adb server speaking the host protocol
+#('%04x' framing, OKAY/FAIL, host:transport, shell v2 packets).
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import adb_client
+from adb_client import AdbClient, AdbError, ShellProtocolUnsupported, SHELL_EXIT, SHELL_STDERR, SHELL_STDOUT
+
+DEVICES = {
+    "SERIAL1": "device product:sunfish model:Pixel_4a device:sunfish transport_id:1",
+    "SERIAL2": "unauthorized transport_id:2",
+}
+
+
+def _recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError
+        data += chunk
+    return data
+
+
+def _message(payload):
+    data = payload.encode()
+    return b"%04x" % len(data) + data
+
+
+def _packet(kind, payload):
+    return bytes([kind]) + struct.pack("<I", len(payload)) + payload
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class StandInAdbServer:
+    def __init__(self, shell_v2=True, drop_replies=False):
+        """drop_replies: device services are received, then the connection is closed unanswered."""
+        self.shell_v2 = shell_v2
+        self.drop_replies = drop_replies
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.accepted = 0
+        self.requests = []   # (connection number, request)
+        self.reboots = []
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.accepted += 1
+            threading.Thread(target=self._handle, args=(conn, self.accepted), daemon=True).start()
+
+    def _handle(self, conn, number):
+        serial = None
+        try:
+            while True:
+                request = _recv_exact(conn, int(_recv_exact(conn, 4), 16)).decode()
+                self.requests.append((number, request))
+                if request == "host:version":
+                    conn.sendall(b"OKAY" + _message("0029"))
+                    return
+                if request == "host:devices-l":
+                    conn.sendall(b"OKAY" + _message("".join("%s %s\n" % item for item in DEVICES.items())))
+                    return
+                if request.startswith("host:transport"):
+                    serial = request.partition("host:transport:")[2] or "SERIAL1"
+                    if serial not in DEVICES:
+                        conn.sendall(b"FAIL" + _message("device '%s' not found" % serial))
+                        return
+                    conn.sendall(b"OKAY")
+                    continue
+                if self.drop_replies:
+                    if request.startswith("reboot:"):
+                        self.reboots.append((serial, request[7:]))
+                    return
+                if request.startswith("shell,v2,raw:"):
+                    if not self.shell_v2:
+                        conn.sendall(b"FAIL" + _message("closed"))
+                        return
+                    command = request.partition(":")[2]
+                    conn.sendall(b"OKAY")
+                    if command == "false":
+                        conn.sendall(_packet(SHELL_STDERR, b"failed\n") + _packet(SHELL_EXIT, b"\x01"))
+                    else:
+                        conn.sendall(_packet(SHELL_STDOUT, ("%s:%s\n" % (serial, command)).encode())
+                                     + _packet(SHELL_EXIT, b"\x00"))
+                    return
+                if request.startswith("shell:"):
+                    conn.sendall(b"OKAY" + ("%s:%s\n" % (serial, request[6:])).encode())
+                    return
+                if request.startswith("reboot:"):
+                    self.reboots.append((serial, request[7:]))
+                    conn.sendall(b"OKAY")
+                    return
+                conn.sendall(b"FAIL" + _message("unknown request"))
+                return
+        except (OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def server():
+    server = StandInAdbServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    client = AdbClient(port=server.port, pool_size=2, timeout=5)
+    yield client
+    client.close()
+
+
+def test_version(client):
+    assert client.version() == 0x29
+
+
+def test_devices(client):
+    devices = client.devices()
+    assert [device["serial"] for device in devices] == ["SERIAL1", "SERIAL2"]
+    assert devices[0]["model"] == "Pixel_4a"
+    assert devices[1]["state"] == "unauthorized"
+
+
+def test_run_devices_and_devices_long(client):
+    result = client.run(["adb", "devices"])
+    assert result.returncode == 0
+    assert result.stdout.splitlines()[1:3] == ["SERIAL1\tdevice", "SERIAL2\tunauthorized"]
+    result = client.run(["adb", "devices", "-l"])
+    assert "product:sunfish" in result.stdout.splitlines()[1]
+
+
+def test_shell_reports_output_and_exit_status(client):
+    result = client.run(["adb", "-s", "SERIAL1", "shell", "getprop", "ro.product.model"])
+    assert (result.returncode, result.stdout, result.stderr) == (0, "SERIAL1:getprop ro.product.model\n", "")
+    result = client.run(["adb", "shell", "false"])
+    assert (result.returncode, result.stdout, result.stderr) == (1, "", "failed\n")
+
+
+def test_shell_v1(client):
+    assert client.shell("id", "SERIAL2") == "SERIAL2:id\n"
+
+
+def test_reboot(client, server):
+    assert client.run(["adb", "-s", "SERIAL2", "reboot", "bootloader"]).returncode == 0
+    client.reboot()
+    assert server.reboots == [("SERIAL2", "bootloader"), ("SERIAL1", "")]
+
+
+def test_fail_reply(client):
+    with pytest.raises(AdbError, match="not found"):
+        client.shell("id", "MISSING")
+    result = client.run(["adb", "-s", "MISSING", "reboot"])
+    assert result.returncode == 1
+    assert "not found" in result.stderr
+
+
+def test_pooled_sockets_are_reused(client, server):
+    client.devices()
+    # The request was served on a new connection, then the pool was refilled.
+    assert _wait_for(lambda: server.accepted == 3)
+    client.devices()
+    number, request = server.requests[-1]
+    assert request == "host:devices-l"
+    assert number in (2, 3)
+    assert _wait_for(lambda: server.accepted == 4)
+
+
+def test_stale_pooled_socket_is_discarded(server):
+    client = AdbClient(port=server.port, pool_size=1, timeout=5)
+    stale, ours = socket.socketpair()
+    ours.close()
+    client._pool.append(stale)
+    assert client.version() == 0x29
+    assert stale.fileno() == -1
+    client.close()
+
+
+def test_shell_v2_refused():
+    server = StandInAdbServer(shell_v2=False)
+    client = AdbClient(port=server.port, pool_size=0, timeout=5)
+    with pytest.raises(ShellProtocolUnsupported):
+        client.shell_v2("id")
+    server.close()
+
+
+@pytest.fixture
+def binary(monkeypatch):
+    calls = []
+
+    def fake_binary(args, timeout=None, cancel_check=None):
+        calls.append(args[1:])
+        return adb_client.subprocess.CompletedProcess(args, 0, "", "")
+    monkeypatch.setattr(adb_client.job_executor, "run", fake_binary)
+    return calls
+
+
+def test_unreachable_server_falls_back_to_the_binary(binary):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    client = AdbClient(port=port, pool_size=0, timeout=5)
+    assert client.run(["adb", "reboot"]).returncode == 0
+    assert binary == [["reboot"]]
+
+
+def test_error_after_the_request_is_not_retried(binary):
+    server = StandInAdbServer(drop_replies=True)
+    client = AdbClient(port=server.port, pool_size=0, timeout=5)
+    for args in (["adb", "-s", "SERIAL1", "reboot"], ["adb", "shell", "id"]):
+        result = client.run(args)
+        assert result.returncode == 1
+        assert "adb: error" in result.stderr
+    assert server.reboots == [("SERIAL1", "")]
+    assert binary == []
+    server.close()
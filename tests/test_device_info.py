@@ -0,0 +1,32 @@
+#Tests of the per-serial getvar cache.
+
+from device_info import DeviceInfo, GetvarCache
+
+
+def _cache(calls):
+    def loader(serial):
+        calls.append(serial)
+        return DeviceInfo({"current-slot": "a"}, serial)
+    return GetvarCache(loader=loader)
+
+
+def test_invalidate_one_serial_keeps_the_others():
+    calls = []
+    cache = _cache(calls)
+    for serial in ("A", "B", None):
+        cache.get(serial)
+    cache.invalidate("A")
+    for serial in ("A", "B", None):
+        cache.get(serial)
+    assert calls == ["A", "B", None, "A", None]
+
+
+def test_invalidate_without_serial_drops_every_device():
+    calls = []
+    cache = _cache(calls)
+    cache.get("A")
+    cache.get("B")
+    cache.invalidate(None)
+    cache.get("A")
+    cache.get("B")
+    assert calls == ["A", "B", "A", "B"]
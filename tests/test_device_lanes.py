@@ -0,0 +1,57 @@
+#Tests of the per-device command lanes.
+
+import threading
+import time
+
+import pytest
+
+from device_lanes import DeviceBusy, LaneRegistry
+
+
+@pytest.fixture(autouse=True)
+def no_android_serial(monkeypatch):
+    monkeypatch.delenv("ANDROID_SERIAL", raising=False)
+
+
+def _start(lanes, args, events, name):
+    def function():
+        events.append(name + " start")
+        time.sleep(0.2)
+        events.append(name + " end")
+    thread = threading.Thread(target=lanes.run, args=(args, function))
+    thread.start()
+    time.sleep(0.05)
+    return thread
+
+
+def test_serial_less_command_waits_for_the_device():
+    lanes = LaneRegistry()
+    events = []
+    threads = [_start(lanes, ["fastboot", "-s", "X", "flash", "boot", "boot.img"], events, "flash"),
+               _start(lanes, ["fastboot", "reboot"], events, "reboot")]
+    for thread in threads:
+        thread.join()
+    assert events == ["flash start", "flash end", "reboot start", "reboot end"]
+
+
+def test_device_command_waits_for_a_serial_less_command():
+    lanes = LaneRegistry()
+    lanes.lane("X")
+    events = []
+    threads = [_start(lanes, ["fastboot", "erase", "cache"], events, "erase"),
+               _start(lanes, ["fastboot", "-s", "X", "reboot"], events, "reboot")]
+    assert lanes.busy_serials() and "X" in lanes.busy_serials()
+    with pytest.raises(DeviceBusy):
+        with lanes.hold("X", wait=False):
+            pass
+    for thread in threads:
+        thread.join()
+    assert events == ["erase start", "erase end", "reboot start", "reboot end"]
+
+
+def test_holder_runs_serial_less_commands_on_its_device():
+    lanes = LaneRegistry()
+    lanes.lane("Y")
+    with lanes.hold("X"):
+        assert lanes.run(["fastboot", "getvar", "product"], lambda: "ok") == "ok"
+        assert not lanes.lane(None).busy()
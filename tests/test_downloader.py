@@ -0,0 +1,133 @@
+#Tests of downloader against a stand-in HTTP server with Range, ETag and If-Range support.
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+SIZE = 4 * downloader.MIN_SEGMENT_SIZE
+
+
+def _content(seed):
+    return bytes((i * 7 + seed) % 251 for i in range(256)) * (SIZE // 256)
+
+
+class StandInServer:
+    def __init__(self):
+        self.body = _content(1)
+        self.etag = '"v1"'
+        self.sent = 0
+        self.active = 0
+        self.condition = threading.Condition()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with server.condition:
+                    server.active += 1
+                try:
+                    self.send_body()
+                finally:
+                    with server.condition:
+                        server.active -= 1
+                        server.condition.notify_all()
+
+            def send_body(self):
+                body, start, end = server.body, 0, len(server.body) - 1
+                match = RANGE_RE.match(self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                if match and (if_range is None or if_range == server.etag):
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else end
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, len(body)))
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+                self.wfile.write(body[start:end + 1])
+                if end - start > 0:
+                    with server.condition:
+                        server.sent += end - start + 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d/image.zip" % self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self, body=None, etag=None):
+        """Waits for the requests of a cancelled download to end, then restarts the count."""
+        with self.condition:
+            assert self.condition.wait_for(lambda: self.active == 0, timeout=10)
+            self.body = body or self.body
+            self.etag = etag or self.etag
+            self.sent = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    yield server
+    server.close()
+
+
+def _cancel_after(calls):
+    count = [0]
+
+    def cancel_check():
+        count[0] += 1
+        return count[0] > calls
+    return cancel_check
+
+
+@pytest.mark.parametrize("segments", [4, 1])
+def test_download(server, tmp_path, segments):
+    destination = tmp_path / "image.zip"
+    assert downloader.download(server.url, destination, segments=segments)
+    assert destination.read_bytes() == server.body
+    assert not downloader.state_path(destination).exists()
+
+
+@pytest.mark.parametrize("segments", [4, 1])
+def test_file_without_state_is_not_trusted(server, tmp_path, segments):
+    destination = tmp_path / "image.zip"
+    destination.write_bytes(b"\0" * (SIZE + 10))
+    assert downloader.download(server.url, destination, segments=segments)
+    assert destination.read_bytes() == server.body
+    assert server.sent == SIZE
+
+
+@pytest.mark.parametrize("segments", [4, 1])
+def test_resume_from_state(server, tmp_path, segments):
+    destination = tmp_path / "image.zip"
+    assert not downloader.download(server.url, destination, cancel_check=_cancel_after(2), segments=segments)
+    state = json.loads(downloader.state_path(destination).read_text())
+    assert state["tag"] == server.etag
+    done = sum(segment["done"] for segment in state["segments"]) if segments > 1 else state["done"]
+    assert 0 < done < SIZE
+    server.reset()
+    assert downloader.download(server.url, destination, segments=segments)
+    assert destination.read_bytes() == server.body
+    assert server.sent == SIZE - done
+
+
+@pytest.mark.parametrize("segments", [4, 1])
+def test_changed_resource_starts_over(server, tmp_path, segments):
+    destination = tmp_path / "image.zip"
+    assert not downloader.download(server.url, destination, cancel_check=_cancel_after(2), segments=segments)
+    server.reset(_content(2), '"v2"')
+    assert downloader.download(server.url, destination, segments=segments)
+    assert destination.read_bytes() == server.body
+    assert server.sent == SIZE
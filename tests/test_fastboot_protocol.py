@@ -0,0 +1,229 @@
+#Tests of fastboot_protocol against a stand-in fastbootd speaking the TCP transport
+#('FB01' handshake, 8-byte big-endian length framing, OKAY/FAIL/DATA/INFO replies).
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import fastboot_protocol
+from fastboot_protocol import FastbootDevice, FastbootError
+
+VARIABLES = {
+    "product": "sunfish",
+    "current-slot": "a",
+    "max-download-size": "0x10000000",
+    "partition-size:boot_a": "0x4000000",
+}
+
+
+def _recv_exact(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError
+        data += chunk
+    return bytes(data)
+
+
+class StandInFastbootd:
+    def __init__(self, write_delay=0, keep_alive=None):
+        """
+        Serves one connection at a time, like a device. 'flash' waits write_delay seconds
+        before its OKAY, sending an INFO packet every keep_alive seconds if set.
+        """
+        self.write_delay = write_delay
+        self.keep_alive = keep_alive
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(4)
+        self.port = self.sock.getsockname()[1]
+        self.serial = "tcp:127.0.0.1:%d" % self.port
+        self.connections = 0
+        self.open_connections = 0
+        self.commands = []
+        self.partitions = {}
+        self.active_slot = "a"
+        self.rebooted = None
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self.open_connections += 1
+            try:
+                self._session(conn)
+            except (OSError, ValueError):
+                pass
+            finally:
+                conn.close()
+                self.open_connections -= 1
+
+    def _send(self, conn, data):
+        conn.sendall(struct.pack(">Q", len(data)) + data)
+
+    def _read(self, conn):
+        return _recv_exact(conn, struct.unpack(">Q", _recv_exact(conn, 8))[0])
+
+    def _session(self, conn):
+        if _recv_exact(conn, 4) != b"FB01":
+            return
+        conn.sendall(b"FB01")
+        downloaded = b""
+        while True:
+            command = self._read(conn).decode()
+            self.commands.append(command)
+            name, _, argument = command.partition(":")
+            if name == "getvar" and argument == "all":
+                for key, value in VARIABLES.items():
+                    self._send(conn, b"INFO%s: %s" % (key.encode(), value.encode()))
+                self._send(conn, b"OKAY")
+            elif name == "getvar":
+                if argument in VARIABLES:
+                    self._send(conn, b"OKAY" + VARIABLES[argument].encode())
+                else:
+                    self._send(conn, b"FAILGetVar Variable Not found")
+            elif name == "download":
+                size = int(argument, 16)
+                self._send(conn, b"DATA%08x" % size)
+                data = bytearray()
+                while len(data) < size:
+                    data += self._read(conn)
+                downloaded = bytes(data)
+                self._send(conn, b"OKAY")
+            elif name == "flash":
+                if argument.rstrip("_ab") not in ("boot", "vendor_boot", "super"):
+                    self._send(conn, b"FAILpartition does not exist")
+                    continue
+                deadline = time.monotonic() + self.write_delay
+                while time.monotonic() < deadline:
+                    time.sleep(min(self.keep_alive or self.write_delay, max(0, deadline - time.monotonic())))
+                    if self.keep_alive:
+                        self._send(conn, b"INFOwriting...")
+                self.partitions[argument] = downloaded
+                self._send(conn, b"OKAY")
+            elif name == "erase":
+                self.partitions[argument] = b""
+                self._send(conn, b"OKAY")
+            elif name == "set_active":
+                self.active_slot = argument
+                self._send(conn, b"OKAY")
+            elif name.startswith("reboot"):
+                self.rebooted = name
+                self._send(conn, b"OKAY")
+                return
+            else:
+                self._send(conn, b"FAILunknown command")
+
+
+@pytest.fixture
+def fastbootd():
+    server = StandInFastbootd()
+    yield server
+    server.close()
+
+
+def test_getvar(fastbootd):
+    with FastbootDevice.connect_tcp("127.0.0.1", fastbootd.port, timeout=5) as device:
+        assert device.getvar("product").response == "sunfish"
+        assert not device.getvar("unknown").ok
+        assert device.getvar_all()["partition-size:boot_a"] == "0x4000000"
+        assert device.max_download_size() == 0x10000000
+
+
+def test_download(fastbootd):
+    data = bytes(range(256)) * 10000   # spans several 1 MiB packets
+    with FastbootDevice.connect_tcp("127.0.0.1", fastbootd.port, timeout=5) as device:
+        progress = []
+        result = device.download(data, progress_callback=lambda sent, size: progress.append(sent))
+    assert result.ok
+    assert result.bytes_sent == len(data)
+    assert progress[-1] == len(data)
+    assert "download" in result.timings
+
+
+def test_flash(fastbootd, tmp_path):
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"\x42" * 300000)
+    with FastbootDevice.connect_tcp("127.0.0.1", fastbootd.port, timeout=5) as device:
+        result = device.flash("boot", str(image), slot="b")
+        assert result.ok
+        assert set(result.timings) == {"download", "write"}
+        assert not device.flash("nosuch", b"data").ok
+    assert fastbootd.partitions["boot_b"] == image.read_bytes()
+
+
+def test_run_getvar_flash_and_set_active(fastbootd, tmp_path):
+    image = tmp_path / "vendor_boot.img"
+    image.write_bytes(b"\x01" * 5000)
+    result = fastboot_protocol.run(["fastboot", "-s", fastbootd.serial, "getvar", "current-slot"])
+    # Like the binary, the report goes to stderr.
+    assert result.returncode == 0
+    assert result.stderr.startswith("current-slot: a\n")
+    result = fastboot_protocol.run(["fastboot", "-s", fastbootd.serial, "getvar", "all"])
+    assert "(bootloader) product: sunfish" in result.stderr
+    result = fastboot_protocol.run(["fastboot", "-s", fastbootd.serial, "flash", "vendor_boot", str(image)])
+    assert result.returncode == 0
+    assert "Finished. Total time" in result.stderr
+    assert fastbootd.partitions["vendor_boot"] == image.read_bytes()
+    assert fastboot_protocol.run(["fastboot", "-s", fastbootd.serial, "--set-active=b"]).returncode == 0
+    assert fastbootd.active_slot == "b"
+    result = fastboot_protocol.run(["fastboot", "-s", fastbootd.serial, "flash", "nosuch", str(image)])
+    assert result.returncode == 1
+    assert "partition does not exist" in result.stderr
+
+
+def test_unsupported_command_goes_to_the_binary_without_a_session(fastbootd, monkeypatch):
+    seen = []
+
+    def fake_binary(args, timeout=None, cancel_check=None):
+        seen.append((args[1:], fastbootd.open_connections))
+        return fastboot_protocol.subprocess.CompletedProcess(args, 0, "", "")
+
+    monkeypatch.setattr(fastboot_protocol.job_executor, "run", fake_binary)
+    args = ["fastboot", "-s", fastbootd.serial, "oem", "device-info"]
+    assert not fastboot_protocol.is_native(args)
+    assert fastboot_protocol.run(args).returncode == 0
+    assert seen == [(["-s", fastbootd.serial, "oem", "device-info"], 0)]
+    assert fastbootd.connections == 0
+
+
+def test_long_write_outlives_the_connection_timeout(tmp_path):
+    image = tmp_path / "super.img"
+    image.write_bytes(b"\x00" * 4096)
+    for keep_alive in (None, 0.2):
+        server = StandInFastbootd(write_delay=0.8, keep_alive=keep_alive)
+        try:
+            with FastbootDevice.connect_tcp("127.0.0.1", server.port, timeout=0.3) as device:
+                assert device.flash("super", str(image)).ok
+                # The connection timeout still applies to ordinary replies.
+                assert device.transport.sock.gettimeout() == 0.3
+        finally:
+            server.close()
+
+
+def test_handshake_refused():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def reply():
+        conn, _ = server.accept()
+        conn.recv(4)
+        conn.sendall(b"NOPE")
+        conn.close()
+    threading.Thread(target=reply, daemon=True).start()
+    with pytest.raises(FastbootError, match="handshake"):
+        FastbootDevice.connect_tcp("127.0.0.1", server.getsockname()[1], timeout=5)
+    server.close()
@@ -0,0 +1,59 @@
+#Tests of firmware_verify on Samsung-style .tar.md5 archives.
+
+import hashlib
+import io
+import tarfile
+
+import pytest
+
+import firmware_verify
+from firmware_verify import match_sidecars, verify_all
+
+
+def _tar_md5(path, members):
+    """Writes a tar of {name: bytes} followed by the Samsung md5 trailer."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    data = buffer.getvalue()
+    name = path.name[:-len(".md5")]
+    path.write_bytes(data + b"%s  %s\n" % (hashlib.md5(data).hexdigest().encode(), name.encode()))
+    return str(path)
+
+
+def test_tar_md5_trailer(tmp_path):
+    path = _tar_md5(tmp_path / "AP.tar.md5", {"boot.img": b"\x01" * 5000})
+    entries, unverified, orphans = match_sidecars([path])
+    assert (unverified, orphans) == ([], [])
+    [result] = verify_all(entries)
+    assert result.ok and result.source == "trailer"
+    with open(path, "r+b") as f:
+        f.seek(600)
+        f.write(b"\xff")
+    [result] = verify_all(entries)
+    assert not result.ok and "md5 mismatch" in result.error
+
+
+def test_lz4_member_without_lz4_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(firmware_verify, "lz4_frame", None)
+    path = _tar_md5(tmp_path / "AP.tar.md5", {"boot.img": b"\x01" * 100, "super.img.lz4": b"\x04\x22\x4d\x18"})
+    entries, unverified, _ = match_sidecars([path])
+    assert [entry.source for entry in entries] == ["trailer"]
+    assert unverified == [path + "/super.img.lz4"]
+
+
+def test_lz4_member_is_decompressed(tmp_path):
+    lz4_frame = pytest.importorskip("lz4.frame")
+    image = bytes(range(256)) * 4096
+    frame = lz4_frame.compress(image, content_checksum=True)
+    path = _tar_md5(tmp_path / "AP.tar.md5", {"super.img.lz4": frame, "vbmeta.img.lz4": frame[:len(frame) // 2]})
+    entries, unverified, _ = match_sidecars([path])
+    assert unverified == []
+    results = {result.path.rpartition("/")[2]: result for result in verify_all(entries, max_workers=1)}
+    assert results["AP.tar.md5"].ok
+    assert results["super.img.lz4"].ok
+    assert results["super.img.lz4"].digests["sha256"] == hashlib.sha256(image).hexdigest()
+    assert not results["vbmeta.img.lz4"].ok
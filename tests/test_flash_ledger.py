@@ -0,0 +1,105 @@
+#Tests of the delta-flash ledger and of the image fingerprints it relies on.
+
+import hashlib
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+import artifact_cache
+import flash_ledger
+from artifact_cache import ArtifactCache
+from flash_ledger import DeltaFilter, FlashLedger
+from zip_images import list_images
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ArtifactCache(tmp_path / "cache")
+    monkeypatch.setattr(flash_ledger, "artifact_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return FlashLedger(tmp_path / "ledger.json")
+
+
+def test_concurrent_fingerprints_hash_once(cache, tmp_path, monkeypatch):
+    image = tmp_path / "system.img"
+    image.write_bytes(b"\x05" * 100000)
+    calls = []
+
+    def slow_sha256(path):
+        calls.append(path)
+        time.sleep(0.2)
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    monkeypatch.setattr(artifact_cache, "file_sha256", slow_sha256)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fingerprint_sha256(image))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [hashlib.sha256(image.read_bytes()).hexdigest()] * 4
+
+
+def test_zip_member_identity_is_a_content_hash(cache, tmp_path):
+    path = tmp_path / "image.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("boot.img", b"\x07" * 50000)
+    [image] = list_images(str(path))
+    identity, size = flash_ledger.image_identity(image)
+    assert (identity, size) == ("sha256:" + hashlib.sha256(b"\x07" * 50000).hexdigest(), 50000)
+
+
+def test_delta_off_hashes_nothing_and_forgets(cache, ledger, tmp_path, monkeypatch):
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"\x01" * 1000)
+    ledger.record("SERIAL", "boot", "a", "sha256:old", 1000)
+    monkeypatch.setattr(flash_ledger, "image_identity", lambda source: pytest.fail("image hashed"))
+    monkeypatch.setattr(flash_ledger, "resolve_slot", lambda *args: pytest.fail("slot queried"))
+    delta_filter = DeltaFilter(ledger, delta=False)
+    step = ["flash", "boot", str(image)]
+    context = delta_filter.before("SERIAL", step)
+    delta_filter.after("SERIAL", step, context, True)
+    assert ledger.get("SERIAL", "boot", "a") is None
+
+
+def test_delta_skips_unchanged_images(cache, ledger, tmp_path, monkeypatch):
+    monkeypatch.setattr(flash_ledger, "resolve_slot", lambda serial, partition, slot=None: slot or "a")
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"\x01" * 1000)
+    step = ["flash", "boot", str(image)]
+    delta_filter = DeltaFilter(ledger)
+    context = delta_filter.before("SERIAL", step)
+    assert context != "skip"
+    delta_filter.after("SERIAL", step, context, True)
+    assert delta_filter.before("SERIAL", step) == "skip"
+    assert delta_filter.skipped_bytes == 1000
+    image.write_bytes(b"\x02" * 1000)
+    os.utime(image, ns=(0, image.stat().st_mtime_ns + 1000))
+    assert delta_filter.before("SERIAL", step) != "skip"
+
+
+def test_serial_less_forget_reaches_every_device(ledger):
+    for serial in ("A", "B"):
+        ledger.record(serial, "boot", "a", "sha256:x", 10)
+        ledger.record(serial, "vbmeta", "a", "sha256:y", 10)
+    ledger.forget(None, "boot")
+    assert [ledger.get(serial, "boot", "a") for serial in ("A", "B")] == [None, None]
+    assert ledger.get("B", "vbmeta", "a")["identity"] == "sha256:y"
+
+
+def test_flash_on_all_slots_forgets_the_partition(cache, ledger, tmp_path):
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"\x01" * 1000)
+    ledger.record("SERIAL", "boot", "a", "sha256:old", 1000)
+    ledger.record("SERIAL", "boot", "b", "sha256:old", 1000)
+    step = ["flash", "boot", "--slot", "all", str(image)]
+    delta_filter = DeltaFilter(ledger)
+    delta_filter.after("SERIAL", step, delta_filter.before("SERIAL", step), True)
+    assert [ledger.get("SERIAL", "boot", slot) for slot in "ab"] == [None, None]
@@ -0,0 +1,80 @@
+#Tests of flash_plan on small factory packages, run with a recording fastboot runner.
+
+import subprocess
+import zipfile
+
+import pytest
+
+from flash_plan import load_factory
+
+FLASH_ALL = """#!/bin/sh
+fastboot flash bootloader bootloader-sunfish.img
+fastboot reboot-bootloader
+fastboot format:ext4 cache
+fastboot -w update image-sunfish.zip
+"""
+
+
+def _factory(tmp_path, images):
+    nested = tmp_path / "image-sunfish.zip"
+    with zipfile.ZipFile(nested, "w") as zip_ref:
+        for name in images:
+            zip_ref.writestr(name, b"\x01" * 1000)
+    package = tmp_path / "sunfish-factory"
+    package.mkdir()
+    (package / "flash-all.sh").write_text(FLASH_ALL)
+    (package / "bootloader-sunfish.img").write_bytes(b"\x02" * 1000)
+    nested.rename(package / nested.name)
+    return package
+
+
+class RecordingRunner:
+    def __init__(self):
+        self.commands = []
+        self.userspace = "no"
+
+    def __call__(self, args):
+        args = [str(arg) for arg in args]
+        if args[1:] == ["devices"]:
+            return subprocess.CompletedProcess(args, 0, "SERIAL\tfastboot\n", "")
+        self.commands.append(args[3:])
+        output = ""
+        if args[3:] == ["getvar", "is-userspace"]:
+            output = "is-userspace: %s\n" % self.userspace
+        elif "update" in args:
+            self.userspace = "yes"
+        return subprocess.CompletedProcess(args, 0, "", output)
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    monkeypatch.setattr("flash_plan.REBOOT_SETTLE", 0)
+
+
+def test_wipe_formats_userdata_and_metadata(tmp_path):
+    plan = load_factory(str(_factory(tmp_path, ["boot.img", "vbmeta.img", "system.img"])))
+    try:
+        assert [step.fastboot_args()[:2] for step in plan.steps if step.kind == "format"] == [
+            ["format:ext4", "cache"], ["format", "userdata"], ["format", "metadata"]]
+        assert not [step for step in plan.steps if step.kind == "erase"]
+        assert [step.partition for step in plan.steps if step.kind == "flash"] == [
+            "bootloader", "boot", "vbmeta", "system"]
+    finally:
+        plan.close()
+
+
+def test_dynamic_partitions_go_to_the_binary_update(tmp_path):
+    package = _factory(tmp_path, ["boot.img", "super_empty.img", "system.img", "vendor.img"])
+    plan = load_factory(str(package)).optimize()
+    try:
+        [update] = [step for step in plan.steps if step.kind == "raw"]
+        assert update.fastboot_args() == ["-w", "--skip-reboot", "update", str(package / "image-sunfish.zip")]
+        # The images of the nested zip are not flashed a second time.
+        assert [step.partition for step in plan.steps if step.kind == "flash"] == ["bootloader"]
+        runner = RecordingRunner()
+        assert plan.execute("SERIAL", runner=runner).ok
+    finally:
+        plan.close()
+    position = runner.commands.index(update.fastboot_args())
+    # The mode is queried again after the update and the final reboot still happens.
+    assert runner.commands[position + 1:] == [["getvar", "is-userspace"], ["reboot"]]
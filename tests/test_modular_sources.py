@@ -0,0 +1,14 @@
+#The modular sources ship copies of root modules: they must stay identical to them.
+
+import zipfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ARCHIVE = ROOT / "Modular Source Code (FastbootGui V.0.2).zip"
+SHARED_MODULES = ("tracing.py",)
+
+
+def test_shared_modules_match_the_root():
+    with zipfile.ZipFile(ARCHIVE) as zip_ref:
+        for name in SHARED_MODULES:
+            assert zip_ref.read("Modular Source Code (FastbootGui V.0.2)/" + name) == (ROOT / name).read_bytes(), name
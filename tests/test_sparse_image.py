@@ -0,0 +1,144 @@
+#Tests of sparse_image.split: every part is a valid sparse image and the parts together
+#write exactly the blocks of the source image.
+
+import pytest
+
+import sparse_image
+from sparse_image import (CHUNK_CRC32, CHUNK_DONT_CARE, CHUNK_FILL, CHUNK_HEADER, CHUNK_RAW, FILE_HEADER,
+                          SPARSE_MAGIC, SparseError, split)
+
+BLOCK = 4096
+# The smallest part: file header, one data block and the chunk headers around it.
+MIN_SIZE = FILE_HEADER.size + 3 * CHUNK_HEADER.size + BLOCK
+
+
+def _block(seed):
+    return bytes((i * 13 + seed) % 256 for i in range(BLOCK))
+
+
+def _write_sparse(path, chunks):
+    """Writes a sparse image of (type, blocks, payload) chunks; returns the expanded image."""
+    body, image = b"", b""
+    for chunk_type, blocks, payload in chunks:
+        if chunk_type == CHUNK_RAW:
+            data = b"".join(_block(payload + i) for i in range(blocks))
+            image += data
+        elif chunk_type == CHUNK_FILL:
+            data = payload
+            image += payload * (blocks * BLOCK // 4)
+        elif chunk_type == CHUNK_CRC32:
+            data = b"\0" * 4
+        else:
+            data = b""
+            image += bytes(blocks * BLOCK)
+        body += CHUNK_HEADER.pack(chunk_type, 0, blocks, CHUNK_HEADER.size + len(data)) + data
+    total_blocks = len(image) // BLOCK
+    path.write_bytes(FILE_HEADER.pack(SPARSE_MAGIC, 1, 0, FILE_HEADER.size, CHUNK_HEADER.size,
+                                      BLOCK, total_blocks, len(chunks), 0) + body)
+    return image
+
+
+def _apply(part, output):
+    """Decodes one sent part onto output; returns the part's blocks that carry data."""
+    data = b"".join(bytes(piece) for piece in part)
+    assert len(data) == len(part)
+    magic, _, _, header_size, chunk_header_size, block_size, total_blocks, total_chunks, _ = \
+        FILE_HEADER.unpack_from(data)
+    assert (magic, block_size, total_blocks * block_size) == (SPARSE_MAGIC, BLOCK, len(output))
+    offset, position, written = header_size, 0, set()
+    for _ in range(total_chunks):
+        chunk_type, _, blocks, total_size = CHUNK_HEADER.unpack_from(data, offset)
+        payload = data[offset + chunk_header_size:offset + total_size]
+        start, end = position * BLOCK, (position + blocks) * BLOCK
+        if chunk_type == CHUNK_RAW:
+            output[start:end] = payload
+        elif chunk_type == CHUNK_FILL:
+            output[start:end] = payload * (blocks * BLOCK // 4)
+        else:
+            assert chunk_type == CHUNK_DONT_CARE
+        if chunk_type != CHUNK_DONT_CARE:
+            written.update(range(position, position + blocks))
+        position += blocks
+        offset += total_size
+    assert (position, offset) == (total_blocks, len(data))
+    return written
+
+
+def _round_trip(path, image, max_size):
+    parts = split(str(path), max_size)
+    output = bytearray(len(image))
+    written = []
+    for index, part in enumerate(parts, 1):
+        assert (part.index, part.count) == (index, len(parts))
+        assert len(part) <= max_size
+        blocks = _apply(part, output)
+        assert not blocks & set(written)
+        written.extend(blocks)
+    assert bytes(output) == image
+    return parts
+
+
+CHUNKS = [
+    (CHUNK_RAW, 3, 1),
+    (CHUNK_FILL, 5, b"\xde\xad\xbe\xef"),
+    (CHUNK_DONT_CARE, 4, None),
+    (CHUNK_CRC32, 0, None),
+    (CHUNK_RAW, 1, 9),
+    (CHUNK_FILL, 1, b"\0\0\0\1"),
+    (CHUNK_RAW, 6, 20),
+    (CHUNK_DONT_CARE, 2, None),
+]
+
+
+@pytest.mark.parametrize("max_size", [
+    MIN_SIZE,                   # one raw block per part
+    MIN_SIZE + BLOCK - 1,       # one byte short of a second block
+    MIN_SIZE + BLOCK,           # exactly two blocks
+    MIN_SIZE + 3 * BLOCK + 40,  # the first raw chunk and a fill chunk share a part
+    1 << 20,                    # everything fits in one part
+])
+def test_sparse_round_trip(tmp_path, max_size):
+    path = tmp_path / "system.img"
+    image = _write_sparse(path, CHUNKS)
+    parts = _round_trip(path, image, max_size)
+    if max_size == 1 << 20:
+        assert len(parts) == 1
+
+
+def test_raw_chunk_cut_at_block_boundaries(tmp_path):
+    path = tmp_path / "vendor.img"
+    image = _write_sparse(path, [(CHUNK_RAW, 7, 3)])
+    parts = _round_trip(path, image, MIN_SIZE + 2 * BLOCK)
+    assert len(parts) == 3
+
+
+def test_raw_image_with_partial_last_block(tmp_path):
+    path = tmp_path / "boot.img"
+    data = b"".join(_block(i) for i in range(4)) + b"\x55" * 100
+    path.write_bytes(data)
+    image = data + bytes(BLOCK - 100)
+    _round_trip(path, image, MIN_SIZE + BLOCK)
+
+
+def test_leading_and_trailing_dont_care(tmp_path):
+    path = tmp_path / "userdata.img"
+    image = _write_sparse(path, [(CHUNK_DONT_CARE, 10, None), (CHUNK_RAW, 2, 5), (CHUNK_DONT_CARE, 10, None)])
+    parts = _round_trip(path, image, MIN_SIZE)
+    assert len(parts) == 2
+
+
+def test_max_size_too_small(tmp_path):
+    path = tmp_path / "system.img"
+    _write_sparse(path, [(CHUNK_RAW, 1, 0)])
+    with pytest.raises(SparseError):
+        split(str(path), MIN_SIZE - 1)
+
+
+def test_truncated_raw_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(sparse_image, "READ_SIZE", BLOCK)
+    path = tmp_path / "system.img"
+    _write_sparse(path, [(CHUNK_RAW, 3, 0)])
+    path.write_bytes(path.read_bytes()[:-2 * BLOCK])
+    [part] = split(str(path), 1 << 20)
+    with pytest.raises(SparseError):
+        b"".join(bytes(piece) for piece in part)
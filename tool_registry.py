@@ -0,0 +1,207 @@
+#This module contains ToolRegistry, which resolves adb and fastboot once to an absolute
+#path (PATH lookup with PATHEXT, so adb.exe is found on Windows, then the local
+#platform-tools directory) and describes them: version, build and supported features.
+#Descriptions are persisted per path with the binary size and mtime, so the tools are
+#only run again when the binary has changed.
+
+import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+import logging
+from collections import namedtuple
+from pathlib import Path
+
+TOOLS = ("adb", "fastboot")
+LOCAL_DIRS = ("platform-tools",)  # where the front-ends install platform-tools
+PROBE_TIMEOUT = 10
+
+# Feature -> text found in the tool's help when it supports the feature.
+FEATURE_MARKERS = {
+    "adb": {
+        "sideload": "sideload",
+        "pair": "pair HOST",
+        "mdns": "mdns",
+        "incremental": "--incremental",
+    },
+    "fastboot": {
+        "fastbootd": "|fastboot]",
+        "slot-all": "--slot",
+        "flashing": "flashing lock",
+        "snapshot-update": "snapshot-update",
+    },
+}
+
+ToolInfo = namedtuple("ToolInfo", "name path version build features in_path")
+
+
+def default_registry_path():
+    if os.environ.get("FASTBOOTGUI_TOOLS"):
+        return Path(os.environ["FASTBOOTGUI_TOOLS"])
+    # Imported here: the registry is used by modules that must load quickly.
+    from artifact_cache import default_cache_dir
+    return default_cache_dir().with_name("fastbootgui-tools.json")
+
+
+def parse_version(output):
+    """
+    Returns (version, build) from 'adb version' / 'fastboot --version' output, e.g.
+    'Version 35.0.2-12147458' -> ('35.0.2', '12147458'); distribution builds such as
+    'fastboot version 1:29.0.6-6' -> ('29.0.6', '6').
+    """
+    match = re.search(r"^Version (\S+)", output, re.M) or re.search(r"version (\S+)", output, re.I)
+    if not match:
+        return None, None
+    release = match.group(1).split(":", 1)[-1]
+    version, _, build = release.partition("-")
+    return version, build or None
+
+
+def version_tuple(version):
+    """'35.0.2' -> (35, 0, 2); non-numeric parts are ignored."""
+    return tuple(int(part) for part in re.findall(r"\d+", version or ""))
+
+
+def _run(args):
+    result = subprocess.run(args, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    return result.returncode, result.stdout + result.stderr
+
+
+class ToolRegistry:
+    def __init__(self, path=None, local_dirs=LOCAL_DIRS):
+        """Nothing is read or run before the first lookup."""
+        self.path = Path(path) if path else None
+        self.local_dirs = local_dirs
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._entries = None
+
+    # --- Persistence ---
+
+    def _store_path(self):
+        if self.path is None:
+            self.path = default_registry_path()
+        return self.path
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self._store_path().read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError as e:
+                logging.warning("Tool registry unreadable, starting empty: %s", e)
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        path = self._store_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning("Could not save the tool registry: %s", e)
+
+    # --- Lookup ---
+
+    def _find(self, name):
+        """Returns (absolute path, in_path) or (None, False)."""
+        found = shutil.which(name)
+        if found:
+            return os.path.abspath(found), True
+        for directory in self.local_dirs:
+            found = shutil.which(name, path=os.path.abspath(directory))
+            if found:
+                return os.path.abspath(found), False
+        return None, False
+
+    def which(self, name):
+        """
+        Absolute path of the tool, or None. The lookup is done once; afterwards only a
+        stat of the known path is made, and the tool is looked up again if it is gone.
+        """
+        with self._lock:
+            known = self._paths.get(name)
+        if known and os.path.isfile(known[0]):
+            return known[0]
+        found = self._find(name)
+        with self._lock:
+            if found[0]:
+                self._paths[name] = found
+            else:
+                self._paths.pop(name, None)
+        return found[0]
+
+    def argv(self, args):
+        """Returns args with a bare 'adb' or 'fastboot' replaced by its resolved path."""
+        args = list(args)
+        if args and args[0] in TOOLS:
+            path = self.which(args[0])
+            if path:
+                args[0] = path
+        return args
+
+    def info(self, name, refresh=False):
+        """
+        Returns the ToolInfo of the tool, or None if it cannot be found or run. The tool
+        is only run when its size or mtime differ from the recorded ones.
+        """
+        path = self.which(name)
+        if path is None:
+            return None
+        with self._lock:
+            in_path = self._paths.get(name, (path, False))[1]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load().get(path)
+        if refresh or not entry or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            entry = self._probe(name, path)
+            if entry is None:
+                return None
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            with self._lock:
+                self._load()[path] = entry
+                self._save()
+        return ToolInfo(name, path, entry["version"], entry["build"], entry["features"], in_path)
+
+    def _probe(self, name, path):
+        version = build = None
+        for arg in ("version", "--version") if name == "adb" else ("--version", "version"):
+            try:
+                code, text = _run([path, arg])
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.warning("Could not run %s: %s", path, e)
+                return None
+            if code == 0:
+                version, build = parse_version(text)
+                if version:
+                    break
+        if not version:
+            logging.warning("%s did not return a version.", path)
+            return None
+        try:
+            help_text = _run([path, "help" if name == "adb" else "--help"])[1]
+        except (OSError, subprocess.SubprocessError):
+            help_text = ""
+        features = sorted(feature for feature, marker in FEATURE_MARKERS.get(name, {}).items()
+                          if marker in help_text)
+        logging.info("%s %s (build %s) at %s, features: %s", name, version, build, path, ", ".join(features))
+        return {"version": version, "build": build, "features": features}
+
+    def forget(self):
+        """Drops the resolved paths (e.g. after installing platform-tools)."""
+        with self._lock:
+            self._paths.clear()
+
+
+# Shared registry used by the front-ends and the command helpers.
+default_registry = ToolRegistry()
@@ -0,0 +1,192 @@
+#This module contains Tracer, which records nested spans (job -> step -> command -> phase)
+#carrying the serial, partition, bytes and exit code of each operation, and exports them
+#as Chrome trace JSON (chrome://tracing, https://ui.perfetto.dev). It is enabled by
+#FASTBOOTGUI_TRACE=<file.json>, written when the program exits; disabled, span() and
+#command() return a shared no-op span, so instrumented code costs one attribute test.
+
+import os
+import time
+import atexit
+import logging
+import functools
+import threading
+from collections import deque
+
+TRACE_ENV = "FASTBOOTGUI_TRACE"
+MAX_EVENTS = 200000  # oldest spans are dropped beyond this, a station may run for days
+
+# Sub-commands whose next argument is a partition.
+PARTITION_COMMANDS = ("flash", "erase", "format")
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = {key: value for key, value in args.items() if value is not None}
+        self.start = None
+
+    def set(self, **args):
+        """Adds arguments known once the operation ran (exit_code, bytes...)."""
+        self.args.update((key, value) for key, value in args.items() if value is not None)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = "%s: %s" % (exc_type.__name__, exc)
+        self.tracer._record(self.name, self.cat, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+def describe_command(args):
+    """
+    Returns (span name, arguments) for an adb/fastboot command line, e.g.
+    ['fastboot', '-s', 'X', 'flash', 'boot', 'boot.img'] -> ('fastboot flash',
+    {'serial': 'X', 'partition': 'boot', 'bytes': <size of boot.img>}).
+    """
+    args = list(args)
+    tool = os.path.basename(str(args[0])).lower() if args else ""
+    tool = os.path.splitext(tool)[0] if tool.endswith(".exe") else tool
+    info = {}
+    rest = []
+    i = 1
+    while i < len(args):
+        if args[i] == "-s" and i + 1 < len(args):
+            info["serial"] = args[i + 1]
+            i += 2
+        elif args[i] == "--slot" and i + 1 < len(args):
+            info["slot"] = args[i + 1]
+            i += 2
+        else:
+            rest.append(args[i])
+            i += 1
+    command = next((str(arg) for arg in rest if not str(arg).startswith("-")), "")
+    if command in PARTITION_COMMANDS and len(rest) > rest.index(command) + 1:
+        info["partition"] = str(rest[rest.index(command) + 1])
+    if command in ("flash", "boot", "sideload") and rest:
+        image = rest[-1]
+        size = getattr(image, "size", None)
+        if size is None and isinstance(image, str):
+            try:
+                size = os.path.getsize(image)
+            except OSError:
+                size = None
+        if size is not None:
+            info["bytes"] = size
+    return (tool + " " + command).strip(), info
+
+
+class Tracer:
+    def __init__(self, enabled=False, output=None, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.output = output
+        self.origin = time.perf_counter_ns()
+        self._events = deque(maxlen=max_events)
+        self._threads = {}
+
+    def span(self, name, cat="step", **args):
+        """Context manager timing the enclosed block; yields the span (see Span.set)."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def command(self, args, **extra):
+        """Span for an adb/fastboot command line, named and described by describe_command()."""
+        if not self.enabled:
+            return NULL_SPAN
+        name, info = describe_command(args)
+        info.update(extra)
+        return Span(self, name, "command", info)
+
+    def complete(self, name, cat, duration, **args):
+        """Records a span that ended now and lasted 'duration' seconds (phases reported by fastboot)."""
+        if not self.enabled:
+            return
+        end = time.perf_counter_ns()
+        start = max(self.origin, end - int(duration * 1e9))
+        self._record(name, cat, start, end, {key: value for key, value in args.items() if value is not None})
+
+    def traced(self, name=None, cat="job"):
+        """Decorator running the function inside a span (named after the function by default)."""
+        def decorate(function):
+            span_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, cat, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _record(self, name, cat, start, end, args):
+        thread = threading.current_thread()
+        # deque.append and dict assignment are atomic: no lock on the hot path.
+        self._threads[thread.ident] = thread.name
+        self._events.append((name, cat, start, end, thread.ident, args))
+
+    def events(self):
+        """The recorded spans as Chrome trace events (complete 'X' events, times in microseconds)."""
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in list(self._threads.items())]
+        for name, cat, start, end, tid, args in list(self._events):
+            events.append({"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+                           "ts": (start - self.origin) / 1000, "dur": (end - start) / 1000, "args": args})
+        return events
+
+    def export_chrome(self, path):
+        """Writes the trace as Chrome trace / Perfetto JSON."""
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+        return path
+
+    def save(self):
+        """Writes the trace to the configured output, if any (registered at exit)."""
+        if not self.enabled or not self.output:
+            return
+        try:
+            self.export_chrome(self.output)
+            logging.info("Trace of %d spans written to %s", len(self._events), self.output)
+        except OSError as e:
+            logging.warning("Could not write the trace to %s: %s", self.output, e)
+
+    def clear(self):
+        self._events.clear()
+
+
+def from_environment():
+    value = os.environ.get(TRACE_ENV, "")
+    if value in ("", "0"):
+        return Tracer()
+    tracer = Tracer(True, value if value != "1" else "fastbootgui-trace.json")
+    atexit.register(tracer.save)
+    return tracer
+
+
+# Shared tracer used by the command helpers and the front-ends.
+tracer = from_environment()
@@ -0,0 +1,120 @@
+#This module contains extract_all(), a parallel zip extractor: members are decompressed
+#in a thread pool (zlib releases the GIL), progress is reported in uncompressed bytes
+#from the central directory, and members already on disk with the same size and CRC
+#are skipped, so extracting the same archive again is almost free.
+
+import os
+import threading
+import zipfile
+import zlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+BUFFER_SIZE = 4 * 1024 * 1024
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ExtractCancelled(Exception):
+    pass
+
+
+def member_target(info, extract_to):
+    """Destination path of a member; names escaping extract_to are refused."""
+    parts = [p for p in info.filename.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts or os.path.isabs(info.filename) or ":" in parts[0]:
+        raise zipfile.BadZipFile("unsafe member name: %r" % info.filename)
+    return os.path.join(extract_to, *parts)
+
+
+def file_crc32(path):
+    crc = 0
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(view)
+            if not count:
+                return crc
+            crc = zlib.crc32(view[:count], crc)
+
+
+def is_up_to_date(info, path):
+    """True if path already holds the member (same size, then same CRC-32)."""
+    try:
+        if os.path.getsize(path) != info.file_size:
+            return False
+        return file_crc32(path) == info.CRC
+    except OSError:
+        return False
+
+
+class _Progress:
+    def __init__(self, total, callback):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.done += count
+            done = self.done
+        if self.callback and self.total:
+            self.callback(done / self.total * 100)
+
+
+def _extract_member(zip_path, info, target, progress, cancel_check):
+    tmp = target + ".part"
+    with zipfile.ZipFile(zip_path) as zip_ref, zip_ref.open(info) as src, open(tmp, "wb") as dst:
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        try:
+            while True:
+                if cancel_check():
+                    raise ExtractCancelled()
+                count = src.readinto(view)
+                if not count:
+                    break
+                dst.write(view[:count])
+                progress.add(count)
+        except BaseException:
+            dst.close()
+            os.remove(tmp)
+            raise
+    os.replace(tmp, target)
+
+
+def extract_all(zip_path, extract_to, progress_callback=None, max_workers=DEFAULT_WORKERS,
+                cancel_check=lambda: False):
+    """
+    Extracts every member of the zip into extract_to. progress_callback(percent) is based
+    on uncompressed bytes, skipped members included. Returns (extracted, skipped) counts.
+    """
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        infos = zip_ref.infolist()
+    progress = _Progress(sum(info.file_size for info in infos), progress_callback)
+    work = []
+    for info in infos:
+        target = member_target(info, extract_to)
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        work.append((info, target))
+
+    def run(item):
+        info, target = item
+        if is_up_to_date(info, target):
+            progress.add(info.file_size)
+            return False
+        _extract_member(zip_path, info, target, progress, cancel_check)
+        return True
+
+    # The biggest members start first so that one large image does not finish last alone.
+    work.sort(key=lambda item: item[0].file_size, reverse=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="unzip") as executor:
+        results = list(executor.map(run, work))
+    skipped = results.count(False)
+    logging.info("Extracted %d member(s) of %s, %d already up to date.", len(results) - skipped,
+                 os.path.basename(zip_path), skipped)
+    return len(results) - skipped, skipped
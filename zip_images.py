@@ -0,0 +1,107 @@
+#This module contains ZipImage, an image member of a firmware zip used as the source
+#of a flash step without extracting the archive: fastboot TCP targets get the member
+#streamed as it decompresses, and the fastboot binary gets it extracted just in time
+#to a temporary file deleted as soon as the last step using it has finished.
+
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+import logging
+
+COPY_BUFFER = 4 * 1024 * 1024
+
+
+class _CheckedStream:
+    def __init__(self, zip_file, member, size):
+        """
+        Reads a zip member and makes sure its CRC is checked once 'size' bytes were read;
+        a corrupt member raises IOError before the flasher sends its last command.
+        """
+        self._zip = zip_file
+        self._stream = zip_file.open(member)
+        self.remaining = size
+
+    def readinto(self, buffer):
+        try:
+            count = self._stream.readinto(buffer)
+            self.remaining -= count
+            if self.remaining <= 0:
+                # Reading past the end is what makes zipfile compare the CRC.
+                self._stream.read(1)
+            return count
+        except zipfile.BadZipFile as e:
+            raise IOError(str(e))
+
+    def close(self):
+        self._stream.close()
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ZipImage:
+    def __init__(self, zip_path, info):
+        self.zip_path = zip_path
+        self.member = info.filename
+        self.name = os.path.basename(info.filename)
+        self.partition = os.path.splitext(self.name)[0]
+        self.size = info.file_size
+        self.crc = info.CRC
+        self._lock = threading.Lock()
+        self._users = 0
+        self._path = None
+
+    def __str__(self):
+        return "%s:%s" % (os.path.basename(self.zip_path), self.member)
+
+    def __repr__(self):
+        return "ZipImage(%r, %r, size=%d)" % (self.zip_path, self.member, self.size)
+
+    def open(self):
+        """Returns a binary stream of the decompressed member (with readinto)."""
+        return _CheckedStream(zipfile.ZipFile(self.zip_path), self.member, self.size)
+
+    def acquire(self):
+        """Extracts the member to a temporary file on first use and returns its path."""
+        with self._lock:
+            if self._path is None:
+                directory = tempfile.mkdtemp(prefix="fbimg-")
+                path = os.path.join(directory, self.name)
+                try:
+                    with self.open() as src, open(path, "wb") as dst:
+                        buffer = bytearray(COPY_BUFFER)
+                        view = memoryview(buffer)
+                        while True:
+                            count = src.readinto(view)
+                            if not count:
+                                break
+                            dst.write(view[:count])
+                except BaseException:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    raise
+                logging.info("Extracted %s (%d bytes) just in time.", self, self.size)
+                self._path = path
+            self._users += 1
+            return self._path
+
+    def release(self):
+        """Deletes the extracted file once no step uses it any more."""
+        with self._lock:
+            self._users -= 1
+            if self._users <= 0 and self._path:
+                shutil.rmtree(os.path.dirname(self._path), ignore_errors=True)
+                self._path = None
+                self._users = 0
+
+
+def list_images(zip_path, extensions=(".img",)):
+    """Returns the ZipImage objects of a zip, in archive order."""
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        return [ZipImage(zip_path, info) for info in zip_ref.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(extensions)]